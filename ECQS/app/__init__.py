@@ -1,10 +1,102 @@
+import click
 from flask import Flask
 
+_retention = None
+
+def start_retention():
+    """Start a background retention task per site with a record archive"""
+    global _retention
+    from .archive import RetentionScheduler
+    from .config import RETENTION_HOURS, RETENTION_INTERVAL
+    from .sites import sites
+
+    if _retention is not None or not RETENTION_INTERVAL:
+        return
+    _retention = []
+    for site in sites:
+        if site.queue.archive is None:
+            continue
+        scheduler = RetentionScheduler(site.queue, RETENTION_INTERVAL, RETENTION_HOURS)
+        scheduler.start()
+        _retention.append(scheduler)
+
+_announcer_process = None
+
+def start_announcer():
+    """Start the voice announcer process once per web process (AUDIO_MODE 'local')"""
+    global _announcer_process
+    from .announcer import AUDIO_MODES, start_announcer_process
+    from .config import AUDIO_MODE
+
+    if AUDIO_MODE not in AUDIO_MODES:
+        raise ValueError(f"Invalid audio mode: {AUDIO_MODE}")
+    if AUDIO_MODE == 'local' and _announcer_process is None:
+        _announcer_process = start_announcer_process()
+
+def register_metrics(app):
+    """Time every request and serve the metrics at /metrics (METRICS_ENABLED)"""
+    from time import perf_counter
+    from flask import Response, g, request
+    from .announcer import announcer_client
+    from .config import METRICS_ENABLED
+    from .metrics import CONTENT_TYPE, REQUEST_SECONDS, registry
+    from .sites import sites
+
+    if not METRICS_ENABLED:
+        return
+
+    registry.gauge('ecqs_queue_waiting', 'Patients waiting per site and room type', ('site', 'room_type'),
+                   lambda: {(site.id, room_type): status['total_waiting'] for site in sites
+                            for room_type, status in site.queue.get_room_type_status().items()})
+    registry.gauge('ecqs_announcer_outbox_pending', 'Announcements not yet sent to the announcer', (),
+                   lambda: {(): announcer_client.pending()})
+    registry.gauge('ecqs_announcer_client_events_total', 'Announcement jobs of this process by outcome',
+                   ('event',), lambda: {(event,): value for event, value in announcer_client.metrics.items()},
+                   kind='counter')
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            site = g.get('site')
+            endpoint = request.endpoint.rsplit('.', 1)[-1] if request.endpoint else 'unmatched'
+            REQUEST_SECONDS.observe(perf_counter() - start, site.id if site else '', endpoint,
+                                    request.method, str(response.status_code))
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus scrape endpoint (web process and announcer)"""
+        return Response(registry.render() + announcer_client.fetch_metrics(), content_type=CONTENT_TYPE)
+
 def create_app():
     app = Flask(__name__)
     
     # Import and register blueprints
     from .routes import bp
     app.register_blueprint(bp)
+    # Same pages and API per site of the registry
+    app.register_blueprint(bp, url_prefix='/site/<site_id>', name='site')
+
+    from .sites import load_sites
+    load_sites()
+
+    register_metrics(app)
+    start_retention()
+    start_announcer()
+
+    @app.cli.command('warm-voice')
+    @click.option('--count', default=None, type=int,
+                  help='Queue numbers per room type to pre-render')
+    def warm_voice(count):
+        """Pre-render common voice announcements into the audio cache"""
+        from .config import TTS_WARMUP_COUNT
+        from .voice_utils import warm_up_announcements
+        created = warm_up_announcements(count if count is not None else TTS_WARMUP_COUNT)
+        click.echo(f"Synthesized {created} announcements")
     
     return app
@@ -0,0 +1,113 @@
+"""
+Announcement texts. Kept apart from the audio stack (voice_utils), so
+the web process can build them without importing pygame or gTTS.
+"""
+from app.config import ROOM_TYPES, ROOMS
+from app.tts_cache import AudioCache
+
+# Carrier phrases of the announcements
+PROCEED_EN = 'please proceed to'
+PROCEED_TL = 'mangyaring pumunta sa'
+NUMBER_TL = 'Numero'
+
+# Convert color names to Tagalog
+COLOR_TL = {
+    'blue': 'asul',
+    'green': 'berde',
+    'orange': 'orange',
+    'purple': 'lila',
+    'red': 'pula'
+}
+
+def split_queue_number(number, room_types=ROOM_TYPES):
+    """
+    Room type and sequence of a queue number ('MC001' -> ('MC', 1)).
+    Room type codes hold no digits (see load_site_config), so the code
+    is everything before the trailing digits.
+    Returns: (room type, sequence), or None when it is not a queue number
+    """
+    room_type = number.rstrip('0123456789')
+    if room_type not in room_types or room_type == number:
+        return None
+    return room_type, int(number[len(room_type):])
+
+def format_number_for_speech(number, room_types=ROOM_TYPES):
+    """Format the number for speech (e.g., 'MC001' becomes 'green 1')"""
+    parsed = split_queue_number(number, room_types)
+    if parsed is None:
+        raise ValueError(f"Invalid queue number: {number}")
+    room_type, num = parsed
+    color = room_types[room_type]['color_name']
+    return f"{color} {num}"
+
+def create_announcement(queue_number, room_id, rooms=ROOMS, room_types=ROOM_TYPES):
+    """Create announcement text in English and Tagalog"""
+    formatted_num = format_number_for_speech(queue_number, room_types)
+    room_name = rooms[room_id]['name'].split('/')[0].strip()  # Get English name
+
+    # English announcement
+    en_text = f"{formatted_num}, {PROCEED_EN} {room_name}"
+    
+    # Tagalog announcement
+    color_en = formatted_num.split()[0]
+    number = formatted_num.split()[1]
+    tl_text = f"{NUMBER_TL} {COLOR_TL[color_en]} {number}, {PROCEED_TL} {room_name}"
+
+    return en_text, tl_text
+
+def create_announcement_phrases(queue_number, room_id, rooms=ROOMS, room_types=ROOM_TYPES):
+    """
+    Split an announcement into the phrases used by the segments engine
+    Returns: (English phrases, Tagalog phrases)
+    """
+    color_en, number = format_number_for_speech(queue_number, room_types).split()
+    room_name = rooms[room_id]['name'].split('/')[0].strip()
+
+    en_phrases = [color_en, number, PROCEED_EN, room_name]
+    tl_phrases = [NUMBER_TL, COLOR_TL[color_en], number, PROCEED_TL, room_name]
+    return en_phrases, tl_phrases
+
+def segment_phrase_library(max_number=999):
+    """
+    All phrases the segments engine needs for numbers 1..max_number
+    Returns: dict of language -> list of phrases
+    """
+    colors = [info['color_name'] for info in ROOM_TYPES.values()]
+    numbers = [str(n) for n in range(1, max_number + 1)]
+    room_names = sorted({room['name'].split('/')[0].strip() for room in ROOMS.values()})
+
+    return {
+        'en': colors + [PROCEED_EN] + room_names + numbers,
+        'tl': [NUMBER_TL] + [COLOR_TL[c] for c in colors] + [PROCEED_TL] + room_names + numbers
+    }
+
+def announcement_ids(queue_number, room_id, rooms=ROOMS, room_types=ROOM_TYPES):
+    """
+    Audio ids of an announcement, as served at /api/announcement/<id>.mp3:
+    '<number>-<room>-<lang>-<hash of the text>'. Any worker can resolve
+    them, and an id never names different audio, even after the room
+    layout changes.
+    Returns: dict of language -> id
+    """
+    texts = dict(zip(('en', 'tl'), create_announcement(queue_number, room_id, rooms, room_types)))
+    return {lang: f"{queue_number}-{room_id}-{lang}-{AudioCache.make_key(text, lang)[:16]}"
+            for lang, text in texts.items()}
+
+def parse_announcement_id(announcement_id, rooms=ROOMS, room_types=ROOM_TYPES):
+    """
+    Call and text of an announcement audio id (see announcement_ids)
+    Returns: (queue number, room id, text, lang), or None when the id
+    names no current announcement
+    """
+    queue_number, _, rest = announcement_id.partition('-')
+    parts = rest.rsplit('-', 2)
+    if len(parts) != 3:
+        return None
+    room_id, lang, _ = parts
+    if room_id not in rooms or split_queue_number(queue_number, room_types) is None:
+        return None
+    if announcement_ids(queue_number, room_id, rooms, room_types).get(lang) != announcement_id:
+        return None
+
+    texts = dict(zip(('en', 'tl'), create_announcement(queue_number, room_id, rooms, room_types)))
+    return queue_number, room_id, texts[lang], lang
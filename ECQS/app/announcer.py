@@ -0,0 +1,377 @@
+"""
+Voice announcer process.
+
+The web process only hands announcement jobs to an AnnouncerClient,
+which forwards them in the background over a socket; synthesis and
+playback run in a separate announcer process, started from create_app()
+(AUDIO_MODE 'local') or on its own with
+
+    python -m app.announcer
+"""
+import heapq
+import ipaddress
+import os
+import time
+from collections import OrderedDict
+from multiprocessing import Process
+from multiprocessing.connection import Client, Listener
+from queue import Full, Queue
+from threading import Condition, Lock, Thread
+from app.announcements import create_announcement, create_announcement_phrases
+from app.config import (ANNOUNCER_ADDRESS, ANNOUNCER_AUTHKEY, ANNOUNCEMENT_MAX_AGE,
+                        ANNOUNCEMENT_MAX_PENDING, AUDIO_MODE, DEFAULT_ANNOUNCER_AUTHKEY,
+                        DEFAULT_SITE, ROOM_TYPES, ROOMS, TTS_WARMUP_COUNT)
+from app.metrics import voice_registry
+
+AUDIO_MODES = ('none', 'local', 'remote')
+
+# AnnouncementQueue counters exposed as metrics
+ANNOUNCER_EVENTS = ('received', 'coalesced', 'dropped_stale', 'dropped_full', 'played')
+
+# Job priorities, lower plays first
+PRIORITY_RECALL = 0
+PRIORITY_CALL = 1
+
+class AnnouncementQueue:
+    """
+    Pending announcements of one site in the announcer process.
+    Re-calls play before first calls; a job for a number (of the same
+    site) that is already pending replaces it instead of queueing twice; jobs older than max_age
+    seconds are dropped; when max_pending jobs wait, the oldest is dropped.
+    """
+
+    def __init__(self, max_age=60, max_pending=50):
+        self.max_age = max_age
+        self.max_pending = max_pending
+
+        self._heap = []
+        self._pending = {}
+        self._seq = 0
+        self._cond = Condition()
+
+        # Latest numbers announced ((site, number) -> room), to recognise re-calls
+        self._announced = OrderedDict()
+        self.announced_limit = 1000
+
+        self.metrics = {
+            'received': 0,
+            'coalesced': 0,
+            'dropped_stale': 0,
+            'dropped_full': 0,
+            'played': 0,
+            'max_depth': 0,
+            'last_delay': None
+        }
+
+    def put(self, job):
+        """Add a job ({'site', 'number', 'room', 'en', 'tl', 'time'})"""
+        with self._cond:
+            self.metrics['received'] += 1
+            key = (job['site'], job['number'])
+            priority = PRIORITY_RECALL if self._announced.get(key) == job['room'] else PRIORITY_CALL
+
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.metrics['coalesced'] += 1
+                priority = min(priority, pending['priority'])
+            elif len(self._pending) >= self.max_pending:
+                oldest = min(self._pending.values(), key=lambda j: j['time'])
+                del self._pending[(oldest['site'], oldest['number'])]
+                self.metrics['dropped_full'] += 1
+
+            self._seq += 1
+            self._pending[key] = dict(job, priority=priority, seq=self._seq)
+            heapq.heappush(self._heap, (priority, self._seq, key))
+
+            self.metrics['max_depth'] = max(self.metrics['max_depth'], len(self._pending))
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Next job to play, waiting up to timeout seconds
+        Returns: job dict, or None on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                while self._heap:
+                    _, seq, key = heapq.heappop(self._heap)
+                    job = self._pending.get(key)
+                    # Entry replaced by a coalesced job or dropped
+                    if job is None or job['seq'] != seq:
+                        continue
+                    del self._pending[key]
+
+                    delay = time.time() - job['time']
+                    if delay > self.max_age:
+                        self.metrics['dropped_stale'] += 1
+                        continue
+
+                    self._announced[key] = job['room']
+                    self._announced.move_to_end(key)
+                    if len(self._announced) > self.announced_limit:
+                        self._announced.popitem(last=False)
+                    self.metrics['last_delay'] = round(delay, 3)
+                    return job
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def done(self):
+        """Record a finished playback"""
+        with self._cond:
+            self.metrics['played'] += 1
+
+    def stats(self):
+        """Queue depth and counters"""
+        with self._cond:
+            return dict(self.metrics, depth=len(self._pending))
+
+def _is_loopback(host):
+    """Whether the host name or address only accepts local connections"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class Announcer:
+    """
+    Announcer process: receives jobs over the socket and plays them.
+    Every site gets its own queue and player, so one site's backlog never
+    coalesces, drops or delays another site's calls; the players take
+    turns on the speaker.
+    """
+
+    def __init__(self, address=ANNOUNCER_ADDRESS, authkey=ANNOUNCER_AUTHKEY,
+                 max_age=ANNOUNCEMENT_MAX_AGE, max_pending=ANNOUNCEMENT_MAX_PENDING):
+        if not authkey or (authkey == DEFAULT_ANNOUNCER_AUTHKEY and not _is_loopback(address[0])):
+            raise ValueError(f"Announcer on {address[0]} needs its own key "
+                             "(ECQS_ANNOUNCER_KEY or ECQS_ANNOUNCER_KEY_FILE)")
+        self.address = address
+        self.authkey = authkey
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.queues = {}
+        self._queues_lock = Lock()
+        self._speaker = Lock()
+
+        voice_registry.gauge('ecqs_announcer_queue_depth', 'Announcements waiting to be played', ('site',),
+                             lambda: {(site_id,): stats['depth'] for site_id, stats in self.stats().items()})
+        voice_registry.gauge('ecqs_announcer_events_total', 'Announcement jobs by outcome', ('site', 'event'),
+                             lambda: {(site_id, event): value for site_id, stats in self.stats().items()
+                                      for event, value in stats.items() if event in ANNOUNCER_EVENTS},
+                             kind='counter')
+
+    def queue(self, site_id):
+        """Announcement queue of a site, started with its player on first use"""
+        with self._queues_lock:
+            queue = self.queues.get(site_id)
+            if queue is None:
+                queue = self.queues[site_id] = AnnouncementQueue(self.max_age, self.max_pending)
+                Thread(target=self._player, args=(queue,), daemon=True).start()
+            return queue
+
+    def stats(self):
+        """Queue depth and counters per site"""
+        with self._queues_lock:
+            queues = dict(self.queues)
+        return {site_id: queue.stats() for site_id, queue in queues.items()}
+
+    def _player(self, queue):
+        from app.voice_utils import play_announcement
+        while True:
+            job = queue.get()
+            with self._speaker:
+                play_announcement(job)
+            queue.done()
+
+    def _handle(self, conn):
+        try:
+            while True:
+                message = conn.recv()
+                if message['type'] == 'announce':
+                    self.queue(message['job']['site']).put(message['job'])
+                elif message['type'] == 'stats':
+                    conn.send(self.stats())
+                elif message['type'] == 'metrics':
+                    conn.send(voice_registry.render())
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        """Accept connections and play announcements until killed"""
+        # The audio stack is only loaded in the announcer process
+        from app.voice_utils import init_audio, start_warm_up
+
+        listener = Listener(self.address, authkey=self.authkey)
+        init_audio()
+        # Pre-render common announcements so the first calls play at once
+        start_warm_up(TTS_WARMUP_COUNT)
+
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                # Failed handshake (e.g. wrong authkey)
+                print(f"Announcer connection error: {e}")
+                continue
+            Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+def _exit_with_parent(parent_pid):
+    """Stop the announcer when the web process that started it is gone"""
+    while os.getppid() == parent_pid:
+        time.sleep(1)
+    os._exit(0)
+
+def run_announcer(parent_pid=None):
+    """Run the announcer, unless another process already serves the address"""
+    if parent_pid is not None:
+        Thread(target=_exit_with_parent, args=(parent_pid,), daemon=True).start()
+    try:
+        Announcer().serve_forever()
+    except (OSError, ValueError) as e:
+        print(f"Announcer not started: {e}")
+
+def start_announcer_process():
+    """Start the announcer in a child process"""
+    process = Process(target=run_announcer, args=(os.getpid(),), name='announcer', daemon=True)
+    process.start()
+    return process
+
+class AnnouncerClient:
+    """
+    Web-process side of the announcer. announce() only puts the job in a
+    bounded in-memory outbox and returns; a background thread sends it.
+    When the outbox is full (announcer down or far behind) jobs are dropped.
+    """
+
+    def __init__(self, address=ANNOUNCER_ADDRESS, authkey=ANNOUNCER_AUTHKEY,
+                 max_age=ANNOUNCEMENT_MAX_AGE, max_pending=ANNOUNCEMENT_MAX_PENDING):
+        self.address = address
+        self.authkey = authkey
+        self.max_age = max_age
+        self._outbox = Queue(max_pending)
+        self._sender_thread = None
+        self._lock = Lock()
+
+        self.metrics = {
+            'sent': 0,
+            'dropped_full': 0,
+            'dropped_stale': 0,
+            'send_errors': 0
+        }
+
+    def announce(self, queue_number, room_id, rooms=ROOMS, room_types=ROOM_TYPES, site_id=DEFAULT_SITE):
+        """
+        Queue an announcement of a site to be spoken, without waiting
+        Returns: (English text, Tagalog text)
+        """
+        en_text, tl_text = create_announcement(queue_number, room_id, rooms, room_types)
+        job = {
+            'site': site_id,
+            'number': queue_number,
+            'room': room_id,
+            'en': en_text,
+            'tl': tl_text,
+            # Phrases for the segments engine, from the calling site's layout
+            'phrases': create_announcement_phrases(queue_number, room_id, rooms, room_types),
+            'time': time.time()
+        }
+
+        self._start_sender()
+        try:
+            self._outbox.put_nowait(job)
+        except Full:
+            self.metrics['dropped_full'] += 1
+        return en_text, tl_text
+
+    def _start_sender(self):
+        with self._lock:
+            if self._sender_thread is None:
+                self._sender_thread = Thread(target=self._sender, daemon=True)
+                self._sender_thread.start()
+
+    def _sender(self):
+        conn = None
+        while True:
+            job = self._outbox.get()
+            while True:
+                if time.time() - job['time'] > self.max_age:
+                    self.metrics['dropped_stale'] += 1
+                    break
+                try:
+                    if conn is None:
+                        conn = Client(self.address, authkey=self.authkey)
+                    conn.send({'type': 'announce', 'job': job})
+                    self.metrics['sent'] += 1
+                    break
+                except Exception:
+                    # Announcer not (yet) running: retry until the job is stale
+                    self.metrics['send_errors'] += 1
+                    if conn is not None:
+                        conn.close()
+                        conn = None
+                    time.sleep(1)
+
+    def pending(self):
+        """Jobs in the outbox, not yet sent to the announcer"""
+        return self._outbox.qsize()
+
+    def fetch_metrics(self, timeout=0.5):
+        """
+        Metrics of the announcer process (text exposition format)
+        Returns: text, or '' without audio or when the announcer is unreachable
+        """
+        if AUDIO_MODE == 'none':
+            return ''
+        try:
+            with Client(self.address, authkey=self.authkey) as conn:
+                conn.send({'type': 'metrics'})
+                if conn.poll(timeout):
+                    return conn.recv()
+        except Exception:
+            pass
+        return ''
+
+    def stats(self, timeout=1.0):
+        """
+        Backpressure metrics of this client and of the announcer process
+        Returns: dict with 'client' and 'announcer' (None when unreachable)
+        """
+        announcer = None
+        if AUDIO_MODE == 'none':
+            return {'mode': AUDIO_MODE, 'client': None, 'announcer': None}
+        try:
+            with Client(self.address, authkey=self.authkey) as conn:
+                conn.send({'type': 'stats'})
+                if conn.poll(timeout):
+                    announcer = conn.recv()
+        except Exception:
+            pass
+
+        return {
+            'mode': AUDIO_MODE,
+            'client': dict(self.metrics, pending=self.pending()),
+            'announcer': announcer
+        }
+
+# Announcer connection of the web process
+announcer_client = AnnouncerClient()
+
+def queue_announcement(queue_number, room_id, rooms=ROOMS, room_types=ROOM_TYPES, site_id=DEFAULT_SITE):
+    """
+    Queue an announcement of a site to be spoken (never blocks)
+    Returns: (English text, Tagalog text)
+    """
+    if AUDIO_MODE == 'none':
+        return create_announcement(queue_number, room_id, rooms, room_types)
+    return announcer_client.announce(queue_number, room_id, rooms, room_types, site_id)
+
+if __name__ == '__main__':
+    run_announcer()
@@ -0,0 +1,173 @@
+import glob
+import os
+from collections import OrderedDict
+from datetime import datetime
+from threading import Event, Lock, Thread
+from uuid import uuid4
+import pandas as pd
+from app.models import QUEUE_COLUMNS, TIME_COLUMNS
+
+def parquet_available():
+    """True when pandas can write Parquet (pyarrow or fastparquet installed)"""
+    for engine in ('pyarrow', 'fastparquet'):
+        try:
+            __import__(engine)
+            return True
+        except ImportError:
+            continue
+    return False
+
+def records_from_frame(df):
+    """Convert archived rows back into record dicts (NaT -> None)"""
+    # Files written before a column was added lack it
+    df = df.reindex(columns=QUEUE_COLUMNS)
+    records = df.astype(object).where(df.notna(), None).to_dict('records')
+    for record in records:
+        for column in TIME_COLUMNS:
+            if record[column] is not None:
+                record[column] = pd.Timestamp(record[column]).to_pydatetime()
+    return records
+
+class RecordArchive:
+    """
+    Completed queue records moved out of the live queue, stored as
+    date-partitioned columnar files:
+
+        <directory>/date=YYYY-MM-DD/part-<time>-<id>.parquet
+
+    Parquet needs pyarrow (or fastparquet); without it the archive falls
+    back to gzip-compressed CSV files in the same layout.
+    """
+
+    def __init__(self, directory, cache_files=32):
+        self.directory = directory
+        self.use_parquet = parquet_available()
+        self.cache_files = cache_files
+
+        # Archive files never change once written, so they can be cached
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, records):
+        """
+        Append records to the archive, one file per service day
+        Returns: list of files written
+        """
+        if not records:
+            return []
+
+        df = pd.DataFrame(records, columns=QUEUE_COLUMNS)
+        for column in TIME_COLUMNS:
+            df[column] = pd.to_datetime(df[column])
+
+        written = []
+        stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        for day, part in df.groupby(df['RegisterTime'].dt.strftime('%Y-%m-%d')):
+            partition = os.path.join(self.directory, f"date={day}")
+            os.makedirs(partition, exist_ok=True)
+
+            name = f"part-{stamp}-{uuid4().hex[:8]}"
+            if self.use_parquet:
+                path = os.path.join(partition, name + '.parquet')
+                part.to_parquet(path + '.tmp', index=False)
+            else:
+                path = os.path.join(partition, name + '.csv.gz')
+                part.to_csv(path + '.tmp', index=False, compression='gzip')
+
+            # Readers only pick up complete files
+            os.replace(path + '.tmp', path)
+            written.append(path)
+        return written
+
+    def days(self):
+        """Archived service days (YYYY-MM-DD), newest first"""
+        return sorted((os.path.basename(p)[5:] for p in glob.glob(os.path.join(self.directory, 'date=*'))),
+                      reverse=True)
+
+    def _read_file(self, path):
+        with self._lock:
+            if path in self._cache:
+                self._cache.move_to_end(path)
+                return self._cache[path]
+
+        if path.endswith('.parquet'):
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_csv(path, compression='gzip', parse_dates=list(TIME_COLUMNS))
+
+        with self._lock:
+            self._cache[path] = df
+            while len(self._cache) > self.cache_files:
+                self._cache.popitem(last=False)
+        return df
+
+    def read_day(self, day):
+        """
+        All records archived for a service day
+        Returns: DataFrame with the queue columns
+        """
+        paths = sorted(glob.glob(os.path.join(self.directory, f"date={day}", 'part-*')))
+        paths = [p for p in paths if not p.endswith('.tmp')]
+        if not paths:
+            return pd.DataFrame(columns=QUEUE_COLUMNS)
+
+        df = pd.concat([self._read_file(p) for p in paths], ignore_index=True)
+        # A retention run interrupted after writing may archive records twice
+        return df.drop_duplicates('Number', keep='last')
+
+    def read_room_calls(self, room_id, limit, exclude=()):
+        """
+        Most recent archived calls of a room, newest first
+        Returns: list of record dicts
+        """
+        found = []
+        for day in self.days():
+            df = self.read_day(day)
+            calls = df[(df['CallRoom'] == room_id) & ~df['Number'].isin(list(exclude))]
+            found.append(calls)
+            if sum(len(f) for f in found) >= limit:
+                break
+
+        if not found:
+            return []
+        calls = pd.concat(found, ignore_index=True).sort_values('CallTime', ascending=False)
+        return records_from_frame(calls.head(limit))
+
+class RetentionScheduler:
+    """
+    Background task running clean_old_records every `interval` seconds,
+    so expired records are archived without blocking a request.
+    """
+
+    def __init__(self, queue, interval, retention_hours):
+        self.queue = queue
+        self.interval = interval
+        self.retention_hours = retention_hours
+        self._thread = None
+        self._stop = Event()
+
+    def run_once(self):
+        """
+        Archive and remove expired records once
+        Returns: number of records removed
+        """
+        return self.queue.clean_old_records(self.retention_hours)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error archiving old records: {e}")
+
+    def start(self):
+        """Start the background task (once)"""
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background task after the current run"""
+        self._stop.set()
@@ -1,3 +1,5 @@
+import os
+
 # 在 ROOM_TYPES 配置中添加顏色名稱
 ROOM_TYPES = {
     'MC': {
@@ -56,3 +58,111 @@ ROOMS = {
     'R10': {'type': 'WA', 'name': 'Room 10 / Kwarto 10'},
     'R11': {'type': 'WA', 'name': 'Room 11 / Kwarto 11'}
 }
+
+# Priority lanes of waiting patients (registration 'priority', import
+# column 'Priority'). Within a room type, a patient one level above the
+# default lane is served as if registered PRIORITY_AGING_SECONDS earlier,
+# two levels: twice that. Regular patients who waited longer than that head
+# start are not passed by newcomers; a very large value gives strict lanes.
+PRIORITY_LANES = {
+    'urgent': {'level': 2, 'en': 'Urgent', 'tl': 'Kagyat'},
+    'senior': {'level': 1, 'en': 'Senior Citizen', 'tl': 'Nakatatanda'},
+    'pwd': {'level': 1, 'en': 'Person with Disability', 'tl': 'May Kapansanan'},
+    'regular': {'level': 0, 'en': 'Regular', 'tl': 'Karaniwan'}
+}
+DEFAULT_PRIORITY = 'regular'
+PRIORITY_AGING_SECONDS = 20 * 60
+
+# Overflow: {room type: {other room type: backlog threshold}}. A room of
+# the type may also call patients of the other type while at least
+# `threshold` of them are waiting; Call Next then takes whichever head
+# patient is due first (priority lanes included), its own type on ties.
+# A room may override its type's rule with an 'overflow' entry of the
+# same shape in ROOMS ({} turns overflow off for that room).
+OVERFLOW_RULES = {
+    'WA': {'MC': 10, 'SP': 10}
+}
+
+# Sites served by this deployment. The layout above is the default site
+# (pages and API at /); every SITES_DIR/<site_id>.json adds a site with
+# its own rooms and queue at /site/<site_id>/ (see sites/clinic.json.example).
+# Data of those sites is kept under SITE_DATA_DIR/<site_id>.
+DEFAULT_SITE = 'main'
+SITES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sites')
+SITE_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'sites')
+
+# Queue storage backend:
+#   'memory' - in-process store (single worker), made durable by the journal below
+#   'sqlite' - shared SQLite database in WAL mode, for several gunicorn workers
+QUEUE_BACKEND = 'memory'
+SQLITE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'queue.db')
+
+# Write-ahead log of queue changes, replayed on startup (memory backend).
+# Set JOURNAL_DIR to None to keep the queue in memory only.
+JOURNAL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+JOURNAL_FSYNC_INTERVAL = 0.05   # Seconds between batched fsyncs of the log
+JOURNAL_SNAPSHOT_EVERY = 1000   # Logged changes between compact snapshots
+
+# Completed records older than RETENTION_HOURS are moved from the live queue
+# to date-partitioned files in ARCHIVE_DIR (Parquet if pyarrow is installed,
+# gzip CSV otherwise) every RETENTION_INTERVAL seconds.
+# Set RETENTION_INTERVAL to None to disable the background task.
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'archive')
+RETENTION_HOURS = 24
+RETENTION_INTERVAL = 15 * 60
+
+# Estimated waiting time: exponentially weighted mean of the service times
+# per room type (ETA_ALPHA = weight of the newest service), starting from
+# ETA_DEFAULT_SERVICE_SECONDS
+ETA_ALPHA = 0.2
+ETA_DEFAULT_SERVICE_SECONDS = 300
+
+# Voice announcement engine:
+#   'tts'      - synthesize each announcement with gTTS (cached per sentence)
+#   'segments' - join pre-rendered phrase segments (colour, number, room),
+#                no per-call synthesis once the segments are cached
+VOICE_ENGINE = 'tts'
+SEGMENT_CACHE_MAX_BYTES = 64 * 1024 * 1024   # Decoded segments kept in memory (least recently used dropped)
+
+# Voice announcements (environment variable ECQS_AUDIO_MODE):
+#   'local'  - create_app() starts an announcer process on this machine
+#   'remote' - send announcements to an announcer started elsewhere with
+#              `python -m app.announcer` (host: ECQS_ANNOUNCER_HOST)
+#   'none'   - API only, no audio (the audio stack is never imported)
+# The announcer socket is authenticated with a shared secret, taken from
+# ECQS_ANNOUNCER_KEY or the file named by ECQS_ANNOUNCER_KEY_FILE. The
+# built-in default is only accepted while the announcer listens on loopback.
+AUDIO_MODE = os.environ.get('ECQS_AUDIO_MODE', 'local')
+ANNOUNCER_ADDRESS = (os.environ.get('ECQS_ANNOUNCER_HOST', '127.0.0.1'), 6060)
+DEFAULT_ANNOUNCER_AUTHKEY = b'ecqs-announcer'
+
+def _announcer_authkey():
+    if os.environ.get('ECQS_ANNOUNCER_KEY'):
+        return os.environ['ECQS_ANNOUNCER_KEY'].encode()
+    if os.environ.get('ECQS_ANNOUNCER_KEY_FILE'):
+        with open(os.environ['ECQS_ANNOUNCER_KEY_FILE'], 'rb') as f:
+            return f.read().strip()
+    return DEFAULT_ANNOUNCER_AUTHKEY
+
+ANNOUNCER_AUTHKEY = _announcer_authkey()
+ANNOUNCEMENT_MAX_AGE = 60       # Seconds after which an unplayed announcement is dropped
+ANNOUNCEMENT_MAX_PENDING = 50   # Waiting announcements before the oldest is dropped
+
+# Request, queue and voice instrumentation served at /metrics (Prometheus
+# text format). Cheap enough to stay on; False also removes the timers.
+METRICS_ENABLED = True
+
+# Text-to-speech audio cache
+TTS_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tts_cache')
+TTS_CACHE_MAX_BYTES = 200 * 1024 * 1024   # Evict least recently used audio past this size
+TTS_TIMEOUT = 10                          # Seconds to wait for one synthesis request
+TTS_WARMUP_COUNT = 30                     # Queue numbers per room type pre-rendered at startup
+
+# Room displays play the announcements themselves, from
+# /api/announcement/<id>.mp3 (synthesized in the web process, kept in
+# memory up to ANNOUNCEMENT_AUDIO_MAX_BYTES; also the announcer's playback
+# buffers). Environment variable ECQS_DISPLAY_AUDIO=0 turns it off; it is
+# also off in audio mode 'none'. Only patients recently called to a room
+# have their announcements served.
+DISPLAY_AUDIO = os.environ.get('ECQS_DISPLAY_AUDIO', '1') != '0' and AUDIO_MODE != 'none'
+ANNOUNCEMENT_AUDIO_MAX_BYTES = 32 * 1024 * 1024
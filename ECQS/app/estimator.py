@@ -0,0 +1,29 @@
+class ServiceEstimator:
+    """
+    Streaming estimate of the waiting time for one room type.
+    Keeps an exponentially weighted mean of the CallTime -> CompleteTime
+    durations, so each completed service and each estimate is O(1).
+    """
+
+    def __init__(self, rooms, alpha=0.2, default_seconds=300):
+        self.rooms = max(rooms, 1)
+        self.alpha = alpha
+        self.mean_service = float(default_seconds)
+        self.samples = 0
+
+    def observe(self, seconds):
+        """Add one service duration"""
+        if seconds < 0:
+            return
+        # Seeded with the default, so one odd service cannot set the estimate
+        self.mean_service += self.alpha * (seconds - self.mean_service)
+        self.samples += 1
+
+    def eta(self, ahead):
+        """
+        Expected wait of a patient with `ahead` patients in front of them
+        Returns: seconds
+        """
+        # The rooms of the type serve in parallel; the patient is called
+        # once those in front and one of the services in progress are done
+        return round(self.mean_service * (ahead + 1) / self.rooms)
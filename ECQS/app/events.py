@@ -0,0 +1,64 @@
+import json
+from queue import Queue, Empty, Full
+from threading import Lock
+
+class EventBroker:
+    """Fan-out of queue change events to streaming (SSE) subscribers"""
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._subscribers = {}
+        self._lock = Lock()
+
+    def subscribe(self, room_id=None, room_type=None):
+        """
+        Register a subscriber, optionally limited to one room or room type
+        Returns: subscription to pass to listen() / unsubscribe()
+        """
+        subscription = {
+            'room_id': room_id,
+            'room_type': room_type,
+            'queue': Queue(maxsize=self.max_pending)
+        }
+        with self._lock:
+            self._subscribers[id(subscription)] = subscription
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscriber"""
+        with self._lock:
+            self._subscribers.pop(id(subscription), None)
+
+    def publish(self, event):
+        """Deliver an event to every matching subscriber without blocking"""
+        with self._lock:
+            subscriptions = list(self._subscribers.values())
+
+        for subscription in subscriptions:
+            if subscription['room_id'] and subscription['room_id'] not in event['rooms']:
+                continue
+            if subscription['room_type'] and subscription['room_type'] != event['room_type']:
+                continue
+            try:
+                subscription['queue'].put_nowait(event)
+            except Full:
+                # Slow client: it will resync on the next event it receives
+                pass
+
+    def listen(self, subscription, keepalive=15):
+        """
+        Generator of Server-Sent Events text for one subscriber.
+        Sends a comment line every `keepalive` seconds so dropped
+        connections are detected by both sides.
+        """
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = subscription['queue'].get(timeout=keepalive)
+                except Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(subscription)
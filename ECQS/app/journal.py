@@ -0,0 +1,196 @@
+import glob
+import json
+import os
+from threading import Event, Lock, Thread
+
+class QueueJournal:
+    """
+    Append-only write-ahead log of queue changes with compact snapshots.
+
+    Every change is written to the log as one JSON line before the call
+    returns; fsync is batched by a background thread every
+    fsync_interval seconds so registrations do not wait on the disk.
+    After snapshot_every events the caller is asked for a snapshot: the
+    log is rotated to journal.log.<seq> at once and the snapshot is
+    written by a background thread, which then deletes the rotated log.
+    Recovery = latest snapshot + rotated logs not yet folded into it +
+    the log tail.
+    """
+
+    SNAPSHOT_FILE = 'snapshot.json'
+    LOG_FILE = 'journal.log'
+
+    def __init__(self, directory, fsync_interval=0.05, snapshot_every=1000):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+
+        self.seq = 0
+        self.events_since_snapshot = 0
+        self._lock = Lock()
+        # Held while the log is fsynced, so close() waits for it; append()
+        # only takes _lock and never waits on the disk
+        self._sync_lock = Lock()
+        self._dirty = False
+        self._stop = Event()
+        self._fd = None
+        self._valid_bytes = None
+        self._snapshot_thread = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, self.SNAPSHOT_FILE)
+        self.log_path = os.path.join(directory, self.LOG_FILE)
+
+    def load(self):
+        """
+        Read the persisted state
+        Returns: (snapshot dict or None, list of events logged after it)
+        """
+        snapshot = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self.seq = snapshot['seq']
+
+        events = []
+        # Logs rotated for snapshots that did not finish, oldest first
+        for _, path in self._rotated_logs():
+            events += self._read_log(path)[0]
+        if os.path.exists(self.log_path):
+            log_events, self._valid_bytes = self._read_log(self.log_path)
+            events += log_events
+
+        self.events_since_snapshot = len(events)
+        return snapshot, events
+
+    def _read_log(self, path):
+        """
+        Events of a log file that are newer than the state read so far
+        Returns: (list of events, bytes of complete lines)
+        """
+        events = []
+        valid_bytes = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('incomplete line')
+                    event = json.loads(line)
+                except ValueError:
+                    # Torn last write from a crash: it is cut off in open()
+                    break
+                valid_bytes += len(line)
+                # Events already folded into the snapshot
+                if event['seq'] <= self.seq:
+                    continue
+                events.append(event)
+                self.seq = event['seq']
+        return events, valid_bytes
+
+    def _rotated_logs(self):
+        """Rotated logs as (last seq, path), oldest first"""
+        logs = []
+        for path in glob.glob(self.log_path + '.*'):
+            suffix = path.rsplit('.', 1)[1]
+            if suffix.isdigit():
+                logs.append((int(suffix), path))
+        return sorted(logs)
+
+    def open(self):
+        """Open the log for appending and start the fsync thread"""
+        self._fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if self._valid_bytes is not None:
+            os.ftruncate(self._fd, self._valid_bytes)
+        Thread(target=self._sync_worker, daemon=True).start()
+
+    def append(self, op, **fields):
+        """
+        Log one change
+        Returns: True when a snapshot is due
+        """
+        with self._lock:
+            self.seq += 1
+            fields['op'] = op
+            fields['seq'] = self.seq
+            # Unbuffered write: survives a process crash, fsync covers power loss
+            os.write(self._fd, (json.dumps(fields, separators=(',', ':')) + '\n').encode('utf-8'))
+            self._dirty = True
+            self.events_since_snapshot += 1
+            return self.events_since_snapshot >= self.snapshot_every
+
+    @property
+    def snapshotting(self):
+        """True while a snapshot is being written"""
+        thread = self._snapshot_thread
+        return thread is not None and thread.is_alive()
+
+    def start_snapshot(self, build_state):
+        """
+        Start a fresh log and write a snapshot of the state up to now in
+        the background; build_state() returns it (from data the caller
+        copied). The caller must make sure no change happens while this
+        runs, not while the snapshot is written.
+        Returns: False when the previous snapshot is still being written
+        """
+        with self._lock:
+            if self.snapshotting:
+                return False
+            seq = self.seq
+            os.rename(self.log_path, f"{self.log_path}.{seq}")
+            rotated_fd = self._fd
+            self._fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._dirty = False
+            self.events_since_snapshot = 0
+
+            self._snapshot_thread = Thread(target=self._write_snapshot,
+                                           args=(build_state, seq, rotated_fd), daemon=True)
+            self._snapshot_thread.start()
+            return True
+
+    def _write_snapshot(self, build_state, seq, rotated_fd):
+        try:
+            # The rotated log stays the record of its events until the snapshot is in place
+            with self._sync_lock:
+                os.fsync(rotated_fd)
+                os.close(rotated_fd)
+
+            temp_path = self.snapshot_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(build_state(), seq=seq), f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+
+            # Events up to seq are in the snapshot now
+            for last_seq, path in self._rotated_logs():
+                if last_seq <= seq:
+                    os.remove(path)
+        except Exception as e:
+            # Recovery still replays the rotated log
+            print(f"Error writing journal snapshot: {e}")
+
+    def sync(self):
+        """Flush logged changes to disk"""
+        with self._sync_lock:
+            with self._lock:
+                if not self._dirty or self._fd is None:
+                    return
+                # Changes appended from here on are picked up by the next sync
+                self._dirty = False
+                fd = self._fd
+            os.fsync(fd)
+
+    def _sync_worker(self):
+        while not self._stop.wait(self.fsync_interval):
+            self.sync()
+
+    def close(self):
+        """Flush and close the log"""
+        self._stop.set()
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        self.sync()
+        with self._sync_lock, self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
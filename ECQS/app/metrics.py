@@ -0,0 +1,177 @@
+"""
+Lightweight instrumentation, exposed in the Prometheus text format.
+
+Histograms are fixed-bucket counters updated under a lock (a bisect and
+a few additions per observation), so they stay on in production. Gauges
+are read from callbacks when /metrics is scraped.
+
+The web process fills `registry` (request latency, QueueData method
+timings, queue sizes); the announcer process fills `voice_registry`
+(synthesis and playback durations, announcement queue depth), which the
+web process fetches over the announcer socket on every scrape.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from app.config import METRICS_ENABLED
+
+# Bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+AUDIO_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """Distribution of observed values (seconds) per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = Lock()
+
+    def observe(self, value, *labels):
+        """Record one value for the given label values"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [count per bucket (+Inf last), sum, count]
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the duration of a with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        """Exposition lines of all label sets"""
+        with self._lock:
+            series = {labels: (list(counts), total, n) for labels, (counts, total, n) in self._series.items()}
+
+        lines = []
+        for labels, (counts, total, n) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {n}")
+        return lines
+
+class Gauge:
+    """
+    Values read from a callback at scrape time.
+    The callback returns {label values tuple: value}; kind 'counter'
+    exposes monotonically increasing totals kept elsewhere.
+    """
+
+    def __init__(self, name, documentation, labelnames, callback, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def samples(self):
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                for labels, value in sorted(self.callback().items())]
+
+class MetricsRegistry:
+    """Named metrics of one process, rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        histogram = Histogram(name, documentation, labelnames, buckets)
+        self._metrics[name] = histogram
+        return histogram
+
+    def gauge(self, name, documentation, labelnames, callback, kind='gauge'):
+        """Add (or replace) a callback metric"""
+        gauge = Gauge(name, documentation, labelnames, callback, kind)
+        self._metrics[name] = gauge
+        return gauge
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.samples()
+            except Exception:
+                # A failing callback must not break the whole scrape
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+# Web process
+registry = MetricsRegistry()
+
+REQUEST_SECONDS = registry.histogram(
+    'ecqs_http_request_duration_seconds', 'Time to handle an HTTP request, per route',
+    ('site', 'endpoint', 'method', 'status'))
+
+QUEUE_OPERATION_SECONDS = registry.histogram(
+    'ecqs_queue_operation_duration_seconds', 'Time spent in QueueData methods',
+    ('backend', 'operation'))
+
+# Announcer process
+voice_registry = MetricsRegistry()
+
+SYNTHESIS_SECONDS = voice_registry.histogram(
+    'ecqs_tts_synthesis_duration_seconds', 'Time to synthesize one utterance (cache misses)',
+    ('lang',), AUDIO_BUCKETS)
+
+PLAYBACK_SECONDS = voice_registry.histogram(
+    'ecqs_announcement_playback_duration_seconds', 'Time to play one announcement (both languages)',
+    ('engine',), AUDIO_BUCKETS)
+
+def timed(method):
+    """Decorator timing a QueueData method into QUEUE_OPERATION_SECONDS"""
+    if not METRICS_ENABLED:
+        return method
+
+    operation = method.__name__
+    observe = QUEUE_OPERATION_SECONDS.observe
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            observe(time.perf_counter() - start, self.backend_name, operation)
+    return wrapper
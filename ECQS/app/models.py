@@ -1,165 +1,839 @@
+import atexit
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
 from datetime import datetime
+from itertools import count, islice
+from threading import RLock
+from uuid import uuid4
+import numpy as np
 import pandas as pd
-from app.config import ROOMS, ROOM_TYPES
+from app.config import (ROOMS, ROOM_TYPES, QUEUE_BACKEND, SQLITE_PATH, JOURNAL_DIR,
+                        JOURNAL_FSYNC_INTERVAL, JOURNAL_SNAPSHOT_EVERY, ETA_ALPHA,
+                        ETA_DEFAULT_SERVICE_SECONDS, DEFAULT_PRIORITY, PRIORITY_LANES,
+                        OVERFLOW_RULES)
+from app.estimator import ServiceEstimator
+from app.events import EventBroker
+from app.journal import QueueJournal
+from app.metrics import timed
+from app.priority import WaitingLine, sort_key, validate_priority
+
+# Record fields holding datetimes (stored as ISO strings in the journal)
+TIME_COLUMNS = ('CallTime', 'RegisterTime', 'CompleteTime')
+
+# Columns of a patient record (also the columns of the exported DataFrame)
+QUEUE_COLUMNS = [
+    'Number',          # Queue number (format: MC001, SP001, etc.)
+    'Name',           # Patient name
+    'RoomType',       # Type of room needed (MC, SP, etc.)
+    'Status',         # Status (Waiting, Called, Complete)
+    'CallRoom',       # Room number where patient is called
+    'CallTime',       # Time when patient was called
+    'RegisterTime',   # Time when patient registered
+    'CompleteTime',   # Time when service was completed
+    'Priority'        # Priority lane (regular, senior, pwd, urgent)
+]
+
+def epoch_ms(value):
+    """Milliseconds since the epoch of a datetime (None when unset or NaT)"""
+    if value is None or value is pd.NaT:
+        return None
+    return int(value.timestamp() * 1000)
+
+@dataclass
+class PatientRecord:
+    """
+    Compact read-only copy of a patient record, as returned by the read
+    API. Times are epoch milliseconds; EstimatedWait (seconds) is only set
+    for waiting patients.
+    """
+
+    __slots__ = QUEUE_COLUMNS + ['EstimatedWait']
+
+    Number: str
+    Name: str
+    RoomType: str
+    Status: str
+    CallRoom: str
+    CallTime: int
+    RegisterTime: int
+    CompleteTime: int
+    Priority: str
+    EstimatedWait: int
+
+    @classmethod
+    def from_record(cls, record, estimated_wait=None):
+        """Copy a record dict (datetimes or pandas Timestamps)"""
+        return cls(record['Number'], record['Name'], record['RoomType'], record['Status'],
+                   record['CallRoom'], epoch_ms(record['CallTime']), epoch_ms(record['RegisterTime']),
+                   epoch_ms(record['CompleteTime']), record.get('Priority') or DEFAULT_PRIORITY,
+                   estimated_wait)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+def room_lines(rooms, room_types, overflow):
+    """
+    Waiting lines each room calls from: its own type (threshold 0), then
+    the overflow types allowed for it (the room's 'overflow' entry, else
+    its type's rule) with their backlog thresholds
+    Returns: dict of room id -> [(room type, threshold), ...]
+    """
+    lines = {}
+    for room_id, room in rooms.items():
+        rules = room.get('overflow', overflow.get(room['type'], {}))
+        lines[room_id] = [(room['type'], 0)] + [
+            (room_type, int(threshold)) for room_type, threshold in rules.items()
+            if room_type in room_types and room_type != room['type']
+        ]
+    return lines
 
 class QueueData:
     """Queue management system data model"""
-    
-    def __init__(self):
-        # Main queue dataframe
-        self.queue_df = pd.DataFrame(columns=[
-            'Number',          # Queue number (format: MC001, SP001, etc.)
-            'Name',           # Patient name
-            'RoomType',       # Type of room needed (MC, SP, etc.)
-            'Status',         # Status (Waiting, Called, Complete)
-            'CallRoom',       # Room number where patient is called
-            'CallTime',       # Time when patient was called
-            'RegisterTime',   # Time when patient registered
-            'CompleteTime'    # Time when service was completed
-        ])
-        
+
+    # Label of this store in the operation timings (see app.metrics)
+    backend_name = 'memory'
+
+    def __init__(self, rooms=ROOMS, room_types=ROOM_TYPES, overflow=OVERFLOW_RULES):
+        # Room layout of the site this queue serves
+        self.rooms = rooms
+        self.room_types = room_types
+
+        # Lines each room calls from (own type, then overflow types), and
+        # the other-type rooms that may call from each type's line
+        self.room_lines = room_lines(rooms, room_types, overflow)
+        self.overflow_rooms = {room_type: [rid for rid, lines in self.room_lines.items()
+                                           if any(t == room_type for t, _ in lines[1:])]
+                               for room_type in self.room_types}
+
+        # Time source of registrations, calls and completions (simulate.py
+        # swaps in a virtual clock)
+        self.clock = datetime.now
+
+        # All patient records, keyed by queue number (insertion = registration order)
+        self.records = {}
+
+        # Waiting patients per room type in serving order (priority lane
+        # with aging, then registration), see app.priority
+        self.waiting = {room_type: WaitingLine() for room_type in self.room_types}
+
+        # Patients currently in 'Called' status per room, in call order
+        self.room_current = {room_id: OrderedDict() for room_id in self.rooms}
+
+        # Every patient called to a room (CallRoom == room), in call order
+        self.room_calls = {room_id: OrderedDict() for room_id in self.rooms}
+
         # Keep track of last number for each room type
-        self.last_numbers = {room_type: 0 for room_type in ROOM_TYPES.keys()}
+        self.last_numbers = {room_type: 0 for room_type in self.room_types.keys()}
+
+        # One lock per room type: operations on different types run in
+        # parallel, operations on the same type (and its rooms) are serialized
+        self.type_locks = {room_type: RLock() for room_type in self.room_types}
+
+        # Rooms serving each room type
+        self.type_rooms = {room_type: [rid for rid, r in self.rooms.items() if r['type'] == room_type]
+                           for room_type in self.room_types}
+
+        # Waiting time estimate per room type, updated on every completed service
+        self.estimators = {room_type: ServiceEstimator(len(self.type_rooms[room_type]),
+                                                       ETA_ALPHA, ETA_DEFAULT_SERVICE_SECONDS)
+                           for room_type in self.room_types}
+
+        # Dashboard status per room type, rebuilt on every change of that type
+        self.type_status = {}
+        for room_type in self.room_types:
+            self._refresh_type_status(room_type)
+
+        # Change notifications for streaming clients
+        self.events = EventBroker()
+
+        # Monotonic change counters, used as ETags by the API.
+        # The epoch keeps them unique across restarts.
+        self.epoch = uuid4().hex[:8]
+        self.version = 0
+        self._version_counter = count(1)
+        self.type_versions = {room_type: 0 for room_type in self.room_types}
+        self.room_versions = {room_id: 0 for room_id in self.rooms}
+
+        # Write-ahead log of changes, see attach_journal()
+        self.journal = None
+        self._snapshot_due = False
+
+        # Archive of records dropped by clean_old_records (optional)
+        self.archive = None
+
+    @contextmanager
+    def _locks(self, room_types):
+        """Hold the locks of some room types (always taken in the same order)"""
+        with ExitStack() as stack:
+            for room_type in sorted(set(room_types)):
+                stack.enter_context(self.type_locks[room_type])
+            yield
+
+    def _all_locks(self):
+        """Hold every room type lock"""
+        return self._locks(self.type_locks)
+
+    def _line_types(self, room_id):
+        """Room types a room may call, its own first"""
+        return [room_type for room_type, _ in self.room_lines[room_id]]
+
+    def _eligible_lines(self, room_id):
+        """Lines a room calls from now: its own, and overflow lines at or over their threshold"""
+        return [room_type for room_type, threshold in self.room_lines[room_id]
+                if not threshold or len(self.waiting[room_type]) >= threshold]
+
+    def _check_overflow(self, room_id, room_type, waiting):
+        """Raise ValueError when the room may not call from the line of room_type now"""
+        threshold = dict(self.room_lines[room_id])[room_type]
+        if threshold and waiting < threshold:
+            raise ValueError(f"{room_id} calls {room_type} patients only while {threshold} or more wait")
+
+    def _next_for_room(self, room_id):
+        """
+        Overflow scheduler: the patient a room should call next, the head
+        with the lowest serving key (see app.priority.sort_key) among its
+        eligible lines, its own line winning ties. O(lines of the room).
+        Returns: record, or None when nobody is waiting
+        """
+        best_key, best_line = None, None
+        for room_type in self._eligible_lines(room_id):
+            key = self.waiting[room_type].head_key()
+            if key is not None and (best_key is None or key < best_key):
+                best_key, best_line = key, room_type
+        return self.waiting[best_line].peek() if best_line else None
+
+    def _bump_versions(self, room_type, rooms):
+        """Advance the change counters of a room type and some of its rooms"""
+        # next() on itertools.count is atomic, unlike += across type locks
+        self.version = next(self._version_counter)
+        if room_type is not None:
+            self.type_versions[room_type] += 1
+        for room_id in rooms:
+            self.room_versions[room_id] += 1
+
+    def get_version(self, room_id=None):
+        """
+        Get a version tag of the queue state
+        Returns: tag that changes whenever the room (or, without room_id,
+        anything in the queue) changes
+        """
+        if room_id is None:
+            return f"{self.epoch}-{self.version}"
+        # A room's next patients can come from any of its lines
+        types = '-'.join(str(self.type_versions[room_type]) for room_type in self._line_types(room_id))
+        return f"{self.epoch}-{room_id}-{types}-{self.room_versions[room_id]}"
+
+    def _refresh_type_status(self, room_type):
+        """
+        Rebuild the dashboard entry of a room type: waiting count, next 3
+        and the current patient of each room. O(rooms of the type).
+        The entry is replaced, never modified, so readers need no lock.
+        """
+        waiting = self.waiting[room_type]
+        next_numbers = [record['Number'] for record in waiting.first(3)]
+
+        rooms_status = []
+        for room_id in self.type_rooms[room_type]:
+            current = self._current_patient(room_id)
+            rooms_status.append({
+                'room_id': room_id,
+                'room_name': self.rooms[room_id]['name'],
+                'current': current['Number'] if current else None,
+                'next': next_numbers,
+                'waiting_count': len(waiting)
+            })
+
+        self.type_status[room_type] = {
+            'rooms': rooms_status,
+            'total_waiting': len(waiting)
+        }
+
+    def _publish(self, action, queue_number, room_type, rooms):
+        """Notify subscribers that the given rooms of a room type changed"""
+        self._refresh_type_status(room_type)
+        # Rooms of other types, serving a patient of this type as overflow
+        for other_type in {self.rooms[room_id]['type'] for room_id in rooms} - {room_type}:
+            self._refresh_type_status(other_type)
+        self._bump_versions(room_type, rooms)
+        self.events.publish({
+            'action': action,
+            'number': queue_number,
+            'room_type': room_type,
+            # Overflow rooms show this type's line too
+            'rooms': rooms + [rid for rid in self.overflow_rooms[room_type] if rid not in rooms]
+        })
+
+    def _log(self, op, **fields):
+        """Append a change to the journal, noting when a snapshot is due"""
+        if self.journal is not None and self.journal.append(op, **fields):
+            self._snapshot_due = True
+
+    def _snapshot_if_due(self):
+        """
+        Write a journal snapshot if one is due.
+        Must be called without holding a type lock, since the snapshot
+        needs all of them.
+        """
+        if not self._snapshot_due or self.journal.snapshotting:
+            return
+        with self._all_locks():
+            if not self._snapshot_due:
+                return
+            # Only copied under the locks; serialized and written by the
+            # journal's background thread
+            records = [dict(record) for record in self.records.values()]
+            last_numbers = dict(self.last_numbers)
+            if self.journal.start_snapshot(lambda: self._state_data(records, last_numbers)):
+                self._snapshot_due = False
+
+    def attach_journal(self, journal):
+        """
+        Restore the queue from a journal (snapshot + log tail) and log
+        every further change to it
+        """
+        snapshot, events = journal.load()
+        if snapshot is not None:
+            self._load_state(snapshot)
+        for event in events:
+            self._replay(event)
+
+        journal.open()
+        self.journal = journal
+
+    def _replay(self, event):
+        """Apply one journal event"""
+        op = event['op']
+        if op == 'add':
+            room_type = event['room_type']
+            self.last_numbers[room_type] = max(self.last_numbers[room_type],
+                                               int(event['number'][len(room_type):]))
+            self._apply_add(event['number'], event['name'], room_type,
+                            datetime.fromisoformat(event['time']),
+                            event.get('priority', DEFAULT_PRIORITY))
+        elif op == 'add_bulk':
+            for number, _, room_type, *_ in event['patients']:
+                self.last_numbers[room_type] = max(self.last_numbers[room_type],
+                                                   int(number[len(room_type):]))
+            self._apply_add_bulk(event['patients'], datetime.fromisoformat(event['time']))
+        elif op == 'call':
+            self._apply_call(self.records[event['number']], event['room'],
+                             datetime.fromisoformat(event['time']))
+        elif op == 'complete':
+            self._apply_complete(self.records[event['number']],
+                                 datetime.fromisoformat(event['time']))
+        elif op == 'clean':
+            self._apply_clean(datetime.fromisoformat(event['cutoff']))
+
+    def export_state(self):
+        """
+        Get the full queue state as JSON-serializable data
+        Returns: dict with last_numbers and records
+        """
+        with self._all_locks():
+            records = [dict(record) for record in self.records.values()]
+            last_numbers = dict(self.last_numbers)
+        return self._state_data(records, last_numbers)
+
+    @staticmethod
+    def _state_data(records, last_numbers):
+        """export_state() data of copied records (converted in place)"""
+        for record in records:
+            for column in TIME_COLUMNS:
+                if record[column] is not None:
+                    record[column] = record[column].isoformat()
+        return {
+            'last_numbers': last_numbers,
+            'records': records
+        }
+
+    def _load_state(self, state):
+        """Rebuild the queue and its indexes from export_state() data"""
+        self.last_numbers.update(state['last_numbers'])
+
+        called = []
+        for record in state['records']:
+            for column in TIME_COLUMNS:
+                if record[column] is not None:
+                    record[column] = datetime.fromisoformat(record[column])
+            record.setdefault('Priority', DEFAULT_PRIORITY)
+            self.records[record['Number']] = record
+
+            if record['Status'] == 'Waiting':
+                self.waiting[record['RoomType']].push(record)
+            elif record['CallRoom'] is not None:
+                called.append(record)
+
+        # Room indexes are kept in call order
+        for record in sorted(called, key=lambda r: r['CallTime']):
+            self.room_calls[record['CallRoom']][record['Number']] = record
+            if record['Status'] == 'Called':
+                self.room_current[record['CallRoom']][record['Number']] = record
+
+        # Service times of the snapshot feed the estimators in completion order
+        completed = [r for r in called if r['Status'] == 'Complete']
+        for record in sorted(completed, key=lambda r: r['CompleteTime']):
+            self._observe_service(record)
+
+        for room_type in self.room_types:
+            self._refresh_type_status(room_type)
 
     def generate_queue_number(self, room_type):
         """Generate a new queue number for given room type"""
-        self.last_numbers[room_type] += 1
-        return f"{room_type}{self.last_numbers[room_type]:03d}"
+        with self.type_locks[room_type]:
+            self.last_numbers[room_type] += 1
+            return f"{room_type}{self.last_numbers[room_type]:03d}"
 
-    def add_patient(self, name, room_type):
+    @timed
+    def add_patient(self, name, room_type, priority=DEFAULT_PRIORITY):
         """
-        Add a new patient to the queue
-        Returns: queue number
+        Add a new patient to the queue, in the given priority lane
+        Returns: (queue number, estimated wait in seconds)
         """
-        if room_type not in ROOM_TYPES:
+        if room_type not in self.room_types:
             raise ValueError(f"Invalid room type: {room_type}")
+        priority = validate_priority(priority)
+
+        with self.type_locks[room_type]:
+            queue_number = self.generate_queue_number(room_type)
+            self._apply_add(queue_number, name, room_type, self.clock(), priority)
+            waiting = self.waiting[room_type]
+            # A regular patient registering now is behind everybody
+            ahead = len(waiting) - 1 if priority == DEFAULT_PRIORITY else waiting.ahead_of(queue_number)
+            eta = self.estimators[room_type].eta(ahead)
+
+        self._snapshot_if_due()
+        return queue_number, eta
+
+    @staticmethod
+    def _new_record(queue_number, name, room_type, register_time, priority=DEFAULT_PRIORITY):
+        """Record of a newly registered patient"""
+        return {
+            'Number': queue_number,
+            'Name': name,
+            'RoomType': room_type,
+            'Status': 'Waiting',
+            'CallRoom': None,
+            'CallTime': None,
+            'RegisterTime': register_time,
+            'CompleteTime': None,
+            'Priority': priority
+        }
+
+    def _apply_add(self, queue_number, name, room_type, register_time, priority=DEFAULT_PRIORITY):
+        """Insert a registered patient (also used to replay the journal)"""
+        record = self._new_record(queue_number, name, room_type, register_time, priority)
 
-        queue_number = self.generate_queue_number(room_type)
-        
-        new_patient = pd.DataFrame({
-            'Number': [queue_number],
-            'Name': [name],
-            'RoomType': [room_type],
-            'Status': ['Waiting'],
-            'CallRoom': [None],
-            'CallTime': [None],
-            'RegisterTime': [datetime.now()],
-            'CompleteTime': [None]
+        self.records[queue_number] = record
+        self.waiting[room_type].push(record)
+
+        self._log('add', number=queue_number, name=name, room_type=room_type,
+                  time=register_time.isoformat(), priority=priority)
+        self._publish('add', queue_number, room_type, self.type_rooms[room_type])
+
+    @timed
+    def validate_import(self, rows):
+        """
+        Validate import rows (columns 'Name', 'Room Type', 'Room', optional
+        'Priority') in one vectorized pass
+        Returns: (DataFrame of valid rows with Name/RoomType/Priority in input order,
+        list of 'Row n: ...' errors; n is the spreadsheet row number)
+        """
+        df = pd.DataFrame(rows)
+        for column in ('Name', 'Room Type', 'Room', 'Priority'):
+            if column not in df.columns:
+                df[column] = None
+
+        names = df['Name'].astype('string').str.strip()
+        room_types = df['Room Type']
+        rooms = df['Room']
+        # Empty cells are the default lane
+        priorities = df['Priority'].astype('string').str.strip().str.lower().fillna('') \
+            .replace('', DEFAULT_PRIORITY)
+
+        missing = names.isna() | (names == '') | room_types.isna() | rooms.isna()
+        bad_type = ~room_types.isin(list(self.room_types))
+        bad_room = ~rooms.isin(list(self.rooms))
+        mismatch = rooms.map({rid: r['type'] for rid, r in self.rooms.items()}) != room_types
+        bad_priority = ~priorities.isin(list(PRIORITY_LANES))
+
+        # First failing check of each row, same order as the row-by-row import
+        reasons = np.select(
+            [missing.to_numpy(dtype=bool), bad_type.to_numpy(), bad_room.to_numpy(), mismatch.to_numpy(),
+             bad_priority.to_numpy(dtype=bool)],
+            ['missing', 'type', 'room', 'mismatch', 'priority'],
+            default=''
+        )
+
+        errors = []
+        for i in np.flatnonzero(reasons != ''):
+            reason = reasons[i]
+            if reason == 'missing':
+                message = 'Missing required fields'
+            elif reason == 'type':
+                message = f'Invalid room type: {room_types.iloc[i]}'
+            elif reason == 'room':
+                message = f'Invalid room: {rooms.iloc[i]}'
+            elif reason == 'priority':
+                message = f'Invalid priority: {df["Priority"].iloc[i]}'
+            else:
+                message = f'Room {rooms.iloc[i]} is not of type {room_types.iloc[i]}'
+            errors.append(f'Row {i + 2}: {message}')
+
+        valid = pd.DataFrame({
+            'Name': names[reasons == ''].astype(object),
+            'RoomType': room_types[reasons == ''],
+            'Priority': priorities[reasons == ''].astype(object)
         })
-        
-        self.queue_df = pd.concat([self.queue_df, new_patient], ignore_index=True)
-        return queue_number
+        return valid, errors
+
+    @timed
+    def add_patients_bulk(self, rows):
+        """
+        Add a batch of patients from import rows in one step.
+        Numbers are assigned consecutively per room type in row order.
+        Returns: (number of patients added, list of per-row errors)
+        """
+        valid, errors = self.validate_import(rows)
+        if valid.empty:
+            return 0, errors
+
+        room_types = sorted(valid['RoomType'].unique())
+        with ExitStack() as stack:
+            for room_type in room_types:
+                stack.enter_context(self.type_locks[room_type])
+
+            # n-th row of a type gets last number + n
+            offsets = valid.groupby('RoomType').cumcount().to_numpy() + 1
+            starts = valid['RoomType'].map(self.last_numbers).to_numpy()
+            numbers = valid['RoomType'] + pd.Series(starts + offsets, index=valid.index).map('{:03d}'.format)
+
+            for room_type, added in valid['RoomType'].value_counts().items():
+                self.last_numbers[room_type] += int(added)
+
+            patients = list(zip(numbers, valid['Name'], valid['RoomType'], valid['Priority']))
+            self._apply_add_bulk(patients, self.clock())
+
+        self._snapshot_if_due()
+        return len(patients), errors
+
+    def _apply_add_bulk(self, patients, register_time):
+        """
+        Insert (number, name, room type, priority) patients (also used to
+        replay the journal, where older entries have no priority)
+        """
+        for queue_number, name, room_type, *priority in patients:
+            record = self._new_record(queue_number, name, room_type, register_time,
+                                      priority[0] if priority else DEFAULT_PRIORITY)
+            self.records[queue_number] = record
+            self.waiting[room_type].push(record)
+
+        self._log('add_bulk', time=register_time.isoformat(),
+                  patients=[list(patient) for patient in patients])
+        for room_type in sorted({patient[2] for patient in patients}):
+            self._publish('add', None, room_type, self.type_rooms[room_type])
 
+    @timed
     def call_patient(self, queue_number, room_id):
         """
         Call a patient to a specific room
         Returns: True if successful, False otherwise
         """
-        if room_id not in ROOMS:
+        if room_id not in self.rooms:
             raise ValueError(f"Invalid room ID: {room_id}")
-            
-        # Check if patient exists and is waiting
-        patient_mask = (self.queue_df['Number'] == queue_number) & \
-                      (self.queue_df['Status'].isin(['Waiting', 'Called']))
-                      
-        if not any(patient_mask):
+
+        record = self.records.get(queue_number)
+        if record is None:
             return False
-            
-        # Check if room type matches
-        patient_room_type = self.queue_df.loc[patient_mask, 'RoomType'].iloc[0]
-        if ROOMS[room_id]['type'] != patient_room_type:
+
+        # Check if the room serves the patient's type (own or overflow line)
+        patient_room_type = record['RoomType']
+        if patient_room_type not in self._line_types(room_id):
             raise ValueError(f"Room type mismatch: {room_id} cannot serve {patient_room_type}")
 
-        # Update patient status
-        self.queue_df.loc[patient_mask, 'Status'] = 'Called'
-        self.queue_df.loc[patient_mask, 'CallRoom'] = room_id
-        self.queue_df.loc[patient_mask, 'CallTime'] = datetime.now()
-        
+        with self._locks([patient_room_type, self.rooms[room_id]['type']]):
+            # Check if patient is waiting, or is being recalled to the same room.
+            # A patient already called to another room is not taken over.
+            if record['Status'] == 'Called' and record['CallRoom'] != room_id:
+                return False
+            if record['Status'] not in ('Waiting', 'Called') or \
+                    self.records.get(queue_number) is not record:
+                return False
+            # Same overflow rule as call_next
+            if record['Status'] == 'Waiting':
+                self._check_overflow(room_id, patient_room_type, len(self.waiting[patient_room_type]))
+
+            self._apply_call(record, room_id, self.clock())
+
+        self._snapshot_if_due()
         return True
 
+    def _apply_call(self, record, room_id, call_time):
+        """Move a patient into a room (also used to replay the journal)"""
+        queue_number = record['Number']
+        patient_room_type = record['RoomType']
+
+        # Take the patient out of the waiting line, or out of the room it
+        # was previously called to (recall)
+        if record['Status'] == 'Waiting':
+            self.waiting[patient_room_type].remove(queue_number)
+            changed_rooms = self.type_rooms[patient_room_type]
+            if room_id not in changed_rooms:
+                # Overflow call into a room of another type
+                changed_rooms = changed_rooms + [room_id]
+        else:
+            self.room_current[record['CallRoom']].pop(queue_number, None)
+            self.room_calls[record['CallRoom']].pop(queue_number, None)
+            changed_rooms = sorted({record['CallRoom'], room_id})
+
+        # Update patient status
+        record['Status'] = 'Called'
+        record['CallRoom'] = room_id
+        record['CallTime'] = call_time
+
+        self.room_current[room_id][queue_number] = record
+        self.room_calls[room_id][queue_number] = record
+
+        self._log('call', number=queue_number, room=room_id, time=call_time.isoformat())
+        self._publish('call', queue_number, patient_room_type, changed_rooms)
+
+    @timed
+    def call_next(self, room_id):
+        """
+        Complete the room's current patient and call the next waiting
+        patient of the room's type (see app.priority), or of an overflow
+        type over its backlog threshold when that patient has waited longer
+        (see _next_for_room), as one atomic step
+        Returns: dict with the completed number, the called patient (None
+        when nobody is waiting) and the room's new current/next state
+        """
+        if room_id not in self.rooms:
+            raise ValueError(f"Invalid room ID: {room_id}")
+
+        with self._locks(self._line_types(room_id)):
+            now = self.clock()
+
+            completed = self._current_patient(room_id)
+            if completed is not None:
+                self._apply_complete(completed, now)
+
+            called = self._next_for_room(room_id)
+            if called is not None:
+                self._apply_call(called, room_id, now)
+
+            result = {
+                'completed': completed['Number'] if completed else None,
+                'called': PatientRecord.from_record(called) if called else None
+            }
+            result.update(self.get_room_queue(room_id))
+
+        self._snapshot_if_due()
+        return result
+
+    @timed
     def complete_service(self, queue_number):
         """Mark a patient's service as complete"""
-        mask = (self.queue_df['Number'] == queue_number) & \
-               (self.queue_df['Status'] == 'Called')
-               
-        if any(mask):
-            self.queue_df.loc[mask, 'Status'] = 'Complete'
-            self.queue_df.loc[mask, 'CompleteTime'] = datetime.now()
-            return True
-        return False
+        record = self.records.get(queue_number)
+        if record is None:
+            return False
+
+        call_room = record['CallRoom']
+        room_type = self.rooms[call_room]['type'] if call_room in self.rooms else record['RoomType']
+        with self._locks([record['RoomType'], room_type]):
+            if record['Status'] != 'Called' or record['CallRoom'] != call_room:
+                return False
+            self._apply_complete(record, self.clock())
+
+        self._snapshot_if_due()
+        return True
+
+    def _apply_complete(self, record, complete_time):
+        """Close a patient's service (also used to replay the journal)"""
+        queue_number = record['Number']
+        record['Status'] = 'Complete'
+        record['CompleteTime'] = complete_time
+        self.room_current[record['CallRoom']].pop(queue_number, None)
+        self._observe_service(record)
+
+        self._log('complete', number=queue_number, time=complete_time.isoformat())
+        self._publish('complete', queue_number, record['RoomType'], [record['CallRoom']])
+
+    def _observe_service(self, record):
+        """Feed a completed service time to its room type's estimator"""
+        if record['CallTime'] is not None and record['CompleteTime'] is not None:
+            seconds = (record['CompleteTime'] - record['CallTime']).total_seconds()
+            self.estimators[record['RoomType']].observe(seconds)
+
+    def _current_patient(self, room_id):
+        """Most recently called patient still in 'Called' status for a room"""
+        called = self.room_current[room_id]
+        if not called:
+            return None
+        return called[next(reversed(called))]
 
+    @timed
     def get_room_queue(self, room_id):
         """
         Get queue information for a specific room
         Returns: dict with current and next patients
         """
-        room_type = ROOMS[room_id]['type']
-        
+        with self._locks(self._line_types(room_id)):
+            return self._room_queue(room_id, {})
+
+    @timed
+    def get_room_queues(self, room_ids):
+        """
+        Queue information of several rooms at once (lobby screens): one
+        lock pass, and the head of each waiting line is read once for all
+        rooms calling from it
+        Returns: dict of room id -> get_room_queue() dict, in the given order
+        """
+        for room_id in room_ids:
+            if room_id not in self.rooms:
+                raise ValueError(f"Invalid room ID: {room_id}")
+
+        with self._locks(t for room_id in room_ids for t in self._line_types(room_id)):
+            heads = {}
+            return {room_id: self._room_queue(room_id, heads) for room_id in room_ids}
+
+    def _room_queue(self, room_id, heads):
+        """
+        Queue information of a room (type locks held). `heads` caches the
+        next patients of each line: type -> [(key, ahead, record, eta)]
+        """
+        room_type = self.rooms[room_id]['type']
+
         # Get current patient in the room
-        current_mask = (self.queue_df['Status'] == 'Called') & \
-                      (self.queue_df['CallRoom'] == room_id)
-        current = self.queue_df[current_mask].to_dict('records')[0] if any(current_mask) else None
+        current = self._current_patient(room_id)
 
-        # Get next patients of same type
-        waiting_mask = (self.queue_df['Status'] == 'Waiting') & \
-                      (self.queue_df['RoomType'] == room_type)
-        next_patients = self.queue_df[waiting_mask].head(3).to_dict('records')
+        # Next patients of the lines the room calls from, in the order
+        # _next_for_room would pick them, with their estimated wait
+        candidates = []
+        for line_type in self._eligible_lines(room_id):
+            if line_type not in heads:
+                estimator = self.estimators[line_type]
+                heads[line_type] = [(sort_key(p['Priority'], p['RegisterTime']), ahead, p, estimator.eta(ahead))
+                                    for ahead, p in enumerate(self.waiting[line_type].first(3))]
+            candidates.extend((key, line_type != room_type, ahead, p, eta)
+                              for key, ahead, p, eta in heads[line_type])
+        candidates.sort(key=lambda c: c[:3])
+        next_patients = [PatientRecord.from_record(p, eta) for *_, p, eta in candidates[:3]]
 
         return {
-            'current': current,
-            'next': next_patients
+            'current': PatientRecord.from_record(current) if current else None,
+            'next': next_patients,
+            # Wait of a patient registering now
+            'estimatedWait': self.estimators[room_type].eta(len(self.waiting[room_type]))
         }
 
+    def get_rooms_version(self, room_ids):
+        """Version tag of several rooms (see get_version)"""
+        return '.'.join(self.get_version(room_id) for room_id in room_ids)
+
+    @timed
     def get_type_queue(self, room_type):
         """
         Get queue information for a room type
         Returns: list of waiting patients
         """
-        mask = (self.queue_df['RoomType'] == room_type) & \
-               (self.queue_df['Status'] == 'Waiting')
-        return self.queue_df[mask].to_dict('records')
+        with self.type_locks[room_type]:
+            return [dict(p) for p in self.waiting[room_type].values()]
 
+    @timed
     def get_room_type_status(self):
         """
         Get queue status for all room types
         Returns: dict with status for each room type
         """
-        status = {}
-        
-        for room_type in ROOM_TYPES:
-            # Get rooms of this type
-            type_rooms = [rid for rid, r in ROOMS.items() if r['type'] == room_type]
-            
-            rooms_status = []
-            for room_id in type_rooms:
-                queue_info = self.get_room_queue(room_id)
-                rooms_status.append({
-                    'room_id': room_id,
-                    'room_name': ROOMS[room_id]['name'],
-                    'current': queue_info['current']['Number'] if queue_info['current'] else None,
-                    'next': [p['Number'] for p in queue_info['next']],
-                    'waiting_count': len(queue_info['next'])
-                })
-                
-            status[room_type] = {
-                'rooms': rooms_status,
-                'total_waiting': sum(r['waiting_count'] for r in rooms_status)
-            }
-            
-        return status
+        # Maintained incrementally by _refresh_type_status()
+        return {room_type: self.type_status[room_type] for room_type in self.room_types}
+
+    def attach_archive(self, archive):
+        """Archive completed records before clean_old_records drops them"""
+        self.archive = archive
 
+    def get_expired_records(self, cutoff_time):
+        """Completed records older than the cutoff"""
+        with self._all_locks():
+            return [dict(r) for r in self.records.values()
+                    if r['Status'] == 'Complete' and r['CompleteTime'] < cutoff_time]
+
+    @timed
     def clean_old_records(self, hours=24):
-        """Remove completed records older than specified hours"""
-        cutoff_time = datetime.now() - pd.Timedelta(hours=hours)
-        complete_mask = (self.queue_df['Status'] == 'Complete') & \
-                       (self.queue_df['CompleteTime'] < cutoff_time)
-        self.queue_df = self.queue_df[~complete_mask]
+        """
+        Remove completed records older than specified hours,
+        moving them to the archive first if one is attached
+        Returns: number of records removed
+        """
+        cutoff_time = self.clock() - pd.Timedelta(hours=hours)
+        if self.archive is not None:
+            # Written outside the locks; completed records no longer change
+            # and newly completed ones cannot fall before the cutoff
+            self.archive.write(self.get_expired_records(cutoff_time))
+
+        with self._all_locks():
+            removed = self._apply_clean(cutoff_time)
+
+        self._snapshot_if_due()
+        return removed
+
+    def _apply_clean(self, cutoff_time):
+        """Drop completed records older than the cutoff (also used to replay the journal)"""
+        expired = [number for number, r in self.records.items()
+                   if r['Status'] == 'Complete' and r['CompleteTime'] < cutoff_time]
+        changed_rooms = set()
+        for number in expired:
+            record = self.records.pop(number)
+            self.room_calls[record['CallRoom']].pop(number, None)
+            changed_rooms.add(record['CallRoom'])
+
+        if expired:
+            # Recent-call lists of these rooms changed
+            self._bump_versions(None, changed_rooms)
+            self._log('clean', cutoff=cutoff_time.isoformat())
+        return len(expired)
 
+    def _with_archived_calls(self, room_id, calls, limit):
+        """Fill a short recent-call list from the archive"""
+        if self.archive is None or len(calls) >= limit:
+            return calls
+        exclude = [call.Number for call in calls]
+        archived = self.archive.read_room_calls(room_id, limit - len(calls), exclude)
+        return calls + [PatientRecord.from_record(record) for record in archived]
+
+    @timed
     def get_recent_room_calls(self, room_id, limit=10):
         """Get recent calls for a specific room"""
-        mask = (self.queue_df['CallRoom'] == room_id)
-        recent = self.queue_df[mask].sort_values('CallTime', ascending=False).head(limit)
-        return recent.to_dict('records')
+        with self.type_locks[self.rooms[room_id]['type']]:
+            calls = self.room_calls[room_id]
+            calls = [PatientRecord.from_record(calls[number]) for number in islice(reversed(calls), limit)]
+        return self._with_archived_calls(room_id, calls, limit)
+
+    @timed
+    def to_dataframe(self):
+        """Export all records as a DataFrame (for reporting)"""
+        with self._all_locks():
+            records = [dict(record) for record in self.records.values()]
+        return pd.DataFrame(records, columns=QUEUE_COLUMNS)
+
+    @property
+    def queue_df(self):
+        """DataFrame view of the queue, kept for reporting code"""
+        return self.to_dataframe()
+
+def create_queue_system(rooms=ROOMS, room_types=ROOM_TYPES, backend=QUEUE_BACKEND,
+                        sqlite_path=SQLITE_PATH, journal_dir=JOURNAL_DIR, overflow=OVERFLOW_RULES):
+    """Build a queue with the given storage backend (defaults: the application's config)"""
+    if backend == 'sqlite':
+        from app.sqlite_store import SQLiteQueueData
+        return SQLiteQueueData(sqlite_path, rooms=rooms, room_types=room_types, overflow=overflow)
+    if backend != 'memory':
+        raise ValueError(f"Invalid queue backend: {backend}")
 
-# Global queue data instance
-queue_system = QueueData()
+    # In-memory queue, restored from the journal if configured
+    queue = QueueData(rooms, room_types, overflow)
+    if journal_dir:
+        journal = QueueJournal(journal_dir, JOURNAL_FSYNC_INTERVAL, JOURNAL_SNAPSHOT_EVERY)
+        queue.attach_journal(journal)
+        atexit.register(journal.close)
+    return queue
@@ -0,0 +1,128 @@
+import heapq
+from itertools import count
+from app.config import DEFAULT_PRIORITY, PRIORITY_AGING_SECONDS, PRIORITY_LANES
+
+def validate_priority(priority):
+    """
+    Normalise a priority lane name (empty -> DEFAULT_PRIORITY)
+    Returns: lane name
+    """
+    if priority is None or str(priority).strip() == '':
+        return DEFAULT_PRIORITY
+    lane = str(priority).strip().lower()
+    if lane not in PRIORITY_LANES:
+        raise ValueError(f"Invalid priority: {priority}")
+    return lane
+
+def sort_key(priority, register_time):
+    """
+    Serving order of a waiting patient, lower first: the registration time
+    moved earlier by PRIORITY_AGING_SECONDS per level above the default
+    lane. Keys never change while a patient waits, so the heap needs no
+    re-ordering as patients age.
+    """
+    head_start = PRIORITY_LANES[priority]['level'] - PRIORITY_LANES[DEFAULT_PRIORITY]['level']
+    return register_time.timestamp() - head_start * PRIORITY_AGING_SECONDS
+
+class WaitingLine:
+    """
+    Waiting patients of one room type in serving order (sort_key, then
+    registration order). A binary heap with lazy removal: push and pop are
+    O(log n), removing a patient called out of turn is O(1) amortized and
+    first(k) walks only the top of the heap, O(k log k).
+    """
+
+    def __init__(self):
+        # (key, seq, number); entries of removed patients stay until popped
+        self._heap = []
+        # number -> (key, seq, record)
+        self._entries = {}
+        self._seq = count()
+        self._stale = 0
+
+    def push(self, record):
+        """Add a waiting record (uses its Priority and RegisterTime)"""
+        key = sort_key(record['Priority'], record['RegisterTime'])
+        seq = next(self._seq)
+        self._entries[record['Number']] = (key, seq, record)
+        heapq.heappush(self._heap, (key, seq, record['Number']))
+
+    def _live(self, item):
+        entry = self._entries.get(item[2])
+        return entry is not None and entry[1] == item[1]
+
+    def _prune(self):
+        """Drop removed patients from the top of the heap"""
+        while self._heap and not self._live(self._heap[0]):
+            heapq.heappop(self._heap)
+            self._stale -= 1
+
+    def remove(self, number):
+        """
+        Take a patient out of the line
+        Returns: the record, or None when not waiting
+        """
+        entry = self._entries.pop(number, None)
+        if entry is None:
+            return None
+        self._stale += 1
+        # Patients called in order leave from the top: drop them at once
+        self._prune()
+        # Rebuild once removed entries deeper in the heap pile up
+        if self._stale > 32 and 2 * self._stale > len(self._entries):
+            self._heap = [(key, seq, n) for n, (key, seq, _) in self._entries.items()]
+            heapq.heapify(self._heap)
+            self._stale = 0
+        return entry[2]
+
+    def peek(self):
+        """Next patient to serve, None when the line is empty"""
+        self._prune()
+        return self._entries[self._heap[0][2]][2] if self._heap else None
+
+    def head_key(self):
+        """Serving key of the next patient, None when the line is empty"""
+        self._prune()
+        return self._heap[0][0] if self._heap else None
+
+    def pop(self):
+        """Remove and return the next patient to serve (None when empty)"""
+        record = self.peek()
+        if record is not None:
+            heapq.heappop(self._heap)
+            del self._entries[record['Number']]
+        return record
+
+    def first(self, k):
+        """Next k patients to serve, in order"""
+        self._prune()
+        heap = self._heap
+        result = []
+        frontier = [(heap[0], 0)] if heap else []
+        # Best-first walk: a heap node is only smaller than its children
+        while frontier and len(result) < k:
+            item, index = heapq.heappop(frontier)
+            if self._live(item):
+                result.append(self._entries[item[2]][2])
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+        return result
+
+    def ahead_of(self, number):
+        """Patients served before the given one, O(n)"""
+        key, seq, _ = self._entries[number]
+        return sum(1 for k, s, _ in self._entries.values() if (k, s) < (key, seq))
+
+    def values(self):
+        """All waiting records in serving order, O(n log n)"""
+        return [record for _, _, record in sorted(self._entries.values(), key=lambda e: e[:2])]
+
+    def __iter__(self):
+        return iter([record['Number'] for record in self.values()])
+
+    def __contains__(self, number):
+        return number in self._entries
+
+    def __len__(self):
+        return len(self._entries)
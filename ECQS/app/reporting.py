@@ -0,0 +1,186 @@
+from datetime import date, datetime, timedelta
+from threading import Lock
+import numpy as np
+import pandas as pd
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+# Columns kept per patient for reporting
+METRIC_COLUMNS = ['Day', 'RoomType', 'CallRoom', 'Status', 'Wait', 'Service',
+                  'RegisterHour', 'CompleteHour', 'CallTime', 'CompleteTime']
+
+def parse_day(value, default):
+    """Parse a YYYY-MM-DD query value"""
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}, expected YYYY-MM-DD")
+
+def day_metrics(df):
+    """
+    Reduce raw queue records to per-patient metrics
+    Returns: DataFrame with METRIC_COLUMNS (Wait/Service in seconds)
+    """
+    register_time = pd.to_datetime(df['RegisterTime'])
+    call_time = pd.to_datetime(df['CallTime'])
+    complete_time = pd.to_datetime(df['CompleteTime'])
+
+    return pd.DataFrame({
+        'Day': register_time.dt.strftime('%Y-%m-%d'),
+        'RoomType': df['RoomType'],
+        'CallRoom': df['CallRoom'],
+        'Status': df['Status'],
+        'Wait': (call_time - register_time).dt.total_seconds(),
+        'Service': (complete_time - call_time).dt.total_seconds(),
+        'RegisterHour': register_time.dt.hour,
+        'CompleteHour': complete_time.dt.hour,
+        'CallTime': call_time,
+        'CompleteTime': complete_time,
+    }, columns=METRIC_COLUMNS)
+
+def percentiles(values):
+    """Count, mean and p50/p90/p99 of a Series of seconds (NaN ignored)"""
+    values = values.dropna()
+    if values.empty:
+        return {'count': 0, 'mean': None, 'p50': None, 'p90': None, 'p99': None}
+
+    p50, p90, p99 = np.percentile(values.to_numpy(), [p * 100 for p in PERCENTILES])
+    return {
+        'count': int(len(values)),
+        'mean': round(float(values.mean()), 1),
+        'p50': round(float(p50), 1),
+        'p90': round(float(p90), 1),
+        'p99': round(float(p99), 1)
+    }
+
+def grouped_percentiles(metrics, column, by):
+    """percentiles() of a metric column for each value of `by`"""
+    result = {}
+    for key, values in metrics.groupby(by)[column]:
+        result[key] = percentiles(values)
+    return result
+
+def hourly_counts(hours, groups):
+    """Counts per hour of day (24 slots) for each group and overall"""
+    valid = hours.notna()
+    table = pd.crosstab(groups[valid], hours[valid].astype(int)).reindex(columns=range(24), fill_value=0)
+    result = {key: [int(n) for n in row] for key, row in table.iterrows()}
+    result['all'] = [int(n) for n in table.sum(axis=0)]
+    return result
+
+def utilisation(metrics):
+    """
+    Share of each room's open time spent serving patients.
+    A room counts as open from its first call to its last completion of
+    each day; the busy time is the sum of its service times.
+    """
+    served = metrics.dropna(subset=['Service'])
+    if served.empty:
+        return {}
+
+    days = served.groupby(['CallRoom', 'Day']).agg(
+        busy=('Service', 'sum'),
+        opened=('CallTime', 'min'),
+        closed=('CompleteTime', 'max')
+    )
+    days['open'] = (days['closed'] - days['opened']).dt.total_seconds()
+    rooms = days.groupby(level='CallRoom')[['busy', 'open']].sum()
+
+    return {
+        room: {
+            'busy_seconds': round(float(row['busy']), 1),
+            'open_seconds': round(float(row['open']), 1),
+            'utilisation': round(float(row['busy'] / row['open']), 3) if row['open'] > 0 else None
+        }
+        for room, row in rooms.iterrows()
+    }
+
+class QueueReports:
+    """
+    Wait/service time and throughput reports over the live queue and
+    the archive. Per-patient metrics of closed days (before today, with
+    every patient served) are cached, so long ranges only compute the
+    days that can still change.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self._closed_days = {}
+        self._lock = Lock()
+
+    def _day_range(self, start, end):
+        return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+    def metrics(self, start, end):
+        """
+        Per-patient metrics of the patients registered from start to end
+        Returns: DataFrame with METRIC_COLUMNS
+        """
+        days = self._day_range(start, end)
+        with self._lock:
+            cached = [self._closed_days[day] for day in days if day in self._closed_days]
+            missing = [day for day in days if day not in self._closed_days]
+        if not missing:
+            return pd.concat(cached, ignore_index=True)
+
+        frames = [self.queue.to_dataframe()]
+        if self.queue.archive is not None:
+            archived = set(self.queue.archive.days())
+            frames += [self.queue.archive.read_day(day) for day in missing if day in archived]
+
+        # Records still in the live queue may already be archived as well.
+        # The archive outlives the queue state, and numbers start from 001
+        # again when the journal or database is reset, so a patient is
+        # identified by number and registration day
+        records = pd.concat(frames, ignore_index=True)
+        records = records[~records.assign(
+            RegisterDay=pd.to_datetime(records['RegisterTime']).dt.date
+        ).duplicated(['Number', 'RegisterDay'])]
+        fresh = day_metrics(records)
+        fresh = fresh[fresh['Day'].isin(missing)]
+
+        today = date.today().isoformat()
+        with self._lock:
+            for day in missing:
+                part = fresh[fresh['Day'] == day]
+                if day < today and (part['Status'] == 'Complete').all():
+                    self._closed_days[day] = part
+
+        return pd.concat(cached + [fresh], ignore_index=True)
+
+    def build(self, start, end, room_type=None):
+        """
+        Build the report for patients registered from start to end (dates)
+        Returns: dict of wait/service percentiles, hourly throughput and utilisation
+        """
+        if end < start:
+            raise ValueError("End date is before start date")
+        if room_type is not None and room_type not in self.queue.room_types:
+            raise ValueError(f"Invalid room type: {room_type}")
+
+        metrics = self.metrics(start, end)
+        if room_type is not None:
+            metrics = metrics[metrics['RoomType'] == room_type]
+
+        return {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'patients': int(len(metrics)),
+            'wait': {
+                'all': percentiles(metrics['Wait']),
+                'by_type': grouped_percentiles(metrics, 'Wait', 'RoomType'),
+                'by_room': grouped_percentiles(metrics, 'Wait', 'CallRoom')
+            },
+            'service': {
+                'all': percentiles(metrics['Service']),
+                'by_type': grouped_percentiles(metrics, 'Service', 'RoomType'),
+                'by_room': grouped_percentiles(metrics, 'Service', 'CallRoom')
+            },
+            'throughput': {
+                'arrivals': hourly_counts(metrics['RegisterHour'], metrics['RoomType']),
+                'completions': hourly_counts(metrics['CompleteHour'], metrics['RoomType'])
+            },
+            'utilisation': {room: value for room, value in utilisation(metrics).items() if room in self.queue.rooms}
+        }
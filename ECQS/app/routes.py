@@ -1,14 +1,125 @@
-from flask import Blueprint, jsonify, render_template, request, current_app
+from flask import Blueprint, Response, abort, g, jsonify, render_template, request, current_app, send_file
+from collections import OrderedDict
 from datetime import datetime
-from app.models import queue_system
-from app.config import ROOM_TYPES, ROOMS
+from io import BytesIO
+from threading import Lock
+import json
+from app.reporting import parse_day
+from app.announcements import announcement_ids, parse_announcement_id
+from app.config import (DEFAULT_SITE, PRIORITY_LANES, DISPLAY_AUDIO, ANNOUNCEMENT_AUDIO_MAX_BYTES,
+                        TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES, TTS_TIMEOUT)
+from app.models import PatientRecord, epoch_ms
+from app.sites import sites
+from app.tts_cache import AudioBuffers, AudioCache, GTTSBackend
 # 在 routes.py 的開頭添加導入
-from app.voice_utils import queue_announcement
+from app.announcer import announcer_client, queue_announcement
 
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Registered twice by create_app(): at / for the default site and at
+# /site/<site_id>/ for every site of the registry
 bp = Blueprint('routes', __name__)
 
+@bp.url_value_preprocessor
+def pull_site(endpoint, values):
+    """Select the site of the request; its queue, rooms and reports are in g.site"""
+    site_id = values.pop('site_id', DEFAULT_SITE) if values else DEFAULT_SITE
+    g.site = sites.get(site_id)
+    if g.site is None:
+        abort(404, description=f"Site not found: {site_id}")
+
+@bp.context_processor
+def inject_site():
+    """Site layout and URL prefix for the page templates"""
+    return {
+        'site': g.site,
+        'site_base': g.site.url_prefix,
+        'rooms': g.site.rooms,
+        'priority_lanes': PRIORITY_LANES
+    }
+
+def _json_default(obj):
+    """Values the JSON encoders do not handle natively"""
+    if isinstance(obj, PatientRecord):
+        return obj.to_dict()
+    if isinstance(obj, datetime):
+        return epoch_ms(obj)
+    raise TypeError(f"Not JSON serializable: {type(obj).__name__}")
+
+def dumps(payload):
+    """
+    Encode an API payload: orjson when installed (PatientRecord natively,
+    as a slotted dataclass), else the standard json module
+    Returns: UTF-8 bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(payload, default=_json_default, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+def _json(payload, status=200):
+    """JSON response encoded with dumps()"""
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+# Last encoded body per URL and queue version, shared by all displays
+# polling the same room: only the first poll after a change encodes it.
+# Least recently used bodies are dropped past ENCODED_CACHE_SIZE.
+ENCODED_CACHE_SIZE = 256
+_encoded = OrderedDict()
+_encoded_lock = Lock()
+
+def _versioned_json(version, build, key=None):
+    """
+    JSON response tagged with a queue version as ETag.
+    Answers 304 without calling build() when the client already has it.
+    `key` names the cached body when the path alone does not (default: path).
+    """
+    if request.if_none_match.contains_weak(version):
+        response = Response(status=304)
+    else:
+        key = key or request.path
+        with _encoded_lock:
+            cached = _encoded.get(key)
+            if cached is not None:
+                _encoded.move_to_end(key)
+        if cached is None or cached[0] != version:
+            cached = (version, dumps(build()))
+            with _encoded_lock:
+                _encoded[key] = cached
+                _encoded.move_to_end(key)
+                while len(_encoded) > ENCODED_CACHE_SIZE:
+                    _encoded.popitem(last=False)
+        response = Response(cached[1], mimetype='application/json')
+    response.set_etag(version)
+    # Let browsers cache the payload but revalidate on every poll
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Announcement audio played by the room displays, synthesized once in
+# this process and shared by every screen. Created on the first request
+# (gTTS is imported on first synthesis), so the disk cache is not opened
+# while display audio is off.
+_announcement_audio = None
+_announcement_audio_lock = Lock()
+
+def announcement_audio():
+    """Audio buffers of the announcement endpoint, created on first use"""
+    global _announcement_audio
+    with _announcement_audio_lock:
+        if _announcement_audio is None:
+            _announcement_audio = AudioBuffers(
+                AudioCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES, GTTSBackend(timeout=TTS_TIMEOUT)),
+                ANNOUNCEMENT_AUDIO_MAX_BYTES)
+        return _announcement_audio
+
+# Announcement ids never name different audio, so browsers keep them
+ANNOUNCEMENT_CACHE_SECONDS = 365 * 24 * 3600
+
 # Display Routes
 @bp.route('/')
 def index():
@@ -23,14 +134,14 @@ def register_page():
 @bp.route('/room/<room_id>')
 def room_display(room_id):
     """Room display page"""
-    if room_id not in ROOMS:
+    if room_id not in g.site.rooms:
         return "Room not found", 404
     return render_template('room_display.html')
 
 @bp.route('/room-op/<room_id>')
 def room_operation(room_id):
     """Room operation panel"""
-    if room_id not in ROOMS:
+    if room_id not in g.site.rooms:
         return "Room not found", 404
     return render_template('room_operation.html')
 
@@ -45,24 +156,33 @@ def import_page():
     return render_template('import.html')
 
 # API Routes
+@bp.route('/api/config/sites')
+def api_sites():
+    """List the sites served by this deployment"""
+    return jsonify([{
+        'id': site.id,
+        'name': site.name,
+        'url': site.url_prefix or '/'
+    } for site in sites])
+
 @bp.route('/api/config/room-types')
 def api_room_types():
     """Get room types configuration"""
-    return jsonify(ROOM_TYPES)
+    return jsonify(g.site.room_types)
 
 @bp.route('/api/config/rooms')
 def api_rooms():
     """Get rooms configuration"""
-    return jsonify(ROOMS)
+    return jsonify(g.site.rooms)
 
 @bp.route('/api/config/room/<room_id>')
 def api_room_config(room_id):
     """Get specific room configuration"""
-    if room_id not in ROOMS:
+    if room_id not in g.site.rooms:
         return jsonify({'error': 'Room not found'}), 404
     
-    room = ROOMS[room_id]
-    room_type = ROOM_TYPES[room['type']]
+    room = g.site.rooms[room_id]
+    room_type = g.site.room_types[room['type']]
     
     return jsonify({
         'id': room_id,
@@ -87,22 +207,39 @@ def api_register():
             return jsonify({'error': 'Missing required fields'}), 400
         
         # Validate room type
-        if room_type not in ROOM_TYPES:
+        if room_type not in g.site.room_types:
             return jsonify({'error': f'Invalid room type: {room_type}'}), 400
             
-        # Add patient
-        queue_number = queue_system.add_patient(name, room_type)
+        # Add patient (priority lane: regular, senior, pwd, urgent)
+        queue_number, eta = g.site.queue.add_patient(name, room_type, data.get('priority'))
         
         return jsonify({
             'success': True,
-            'queueNumber': queue_number
+            'queueNumber': queue_number,
+            'estimatedWait': eta
         })
             
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Registration error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
 
+def _announce(queue_number, room_id):
+    """
+    Queue the voice announcement of a call that is already committed,
+    so a failure here is logged instead of failing the call
+    Returns: dict of the English and Tagalog texts, or None
+    """
+    try:
+        en_text, tl_text = queue_announcement(queue_number, room_id, g.site.rooms, g.site.room_types,
+                                              g.site.id)
+    except Exception as e:
+        current_app.logger.error(f"Error announcing {queue_number}: {e}")
+        return None
+    return {'en': en_text, 'tl': tl_text}
+
 # 修改叫號API
 @bp.route('/api/call', methods=['POST'])
 def api_call():
@@ -115,20 +252,14 @@ def api_call():
         if not queue_number or not room_id:
             return jsonify({'error': 'Missing required fields'}), 400
 
-        success = queue_system.call_patient(queue_number, room_id)
+        success = g.site.queue.call_patient(queue_number, room_id)
 
         if not success:
             return jsonify({'error': 'Patient not found or already called'}), 404
 
-        # Queue voice announcement
-        en_text, tl_text = queue_announcement(queue_number, room_id)
-
         return jsonify({
             'success': True,
-            'announcements': {
-                'en': en_text,
-                'tl': tl_text
-            }
+            'announcements': _announce(queue_number, room_id)
         })
 
     except ValueError as e:
@@ -137,6 +268,34 @@ def api_call():
         current_app.logger.error(f"Error calling patient: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@bp.route('/api/call-next/<room_id>', methods=['POST'])
+def api_call_next(room_id):
+    """Complete the room's current patient and call the next one"""
+    try:
+        if room_id not in g.site.rooms:
+            return jsonify({'error': 'Room not found'}), 404
+
+        result = g.site.queue.call_next(room_id)
+
+        announcements = None
+        if result['called']:
+            announcements = _announce(result['called'].Number, room_id)
+
+        return _json({
+            'success': True,
+            'completed': result['completed'],
+            'called': result['called'],
+            'current': result['current'],
+            'next': result['next'],
+            'announcements': announcements
+        })
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error calling next patient: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @bp.route('/api/complete', methods=['POST'])
 def api_complete():
     """Mark patient service as complete"""
@@ -147,7 +306,7 @@ def api_complete():
         if not queue_number:
             return jsonify({'error': 'Queue number is required'}), 400
             
-        success = queue_system.complete_service(queue_number)
+        success = g.site.queue.complete_service(queue_number)
         
         if not success:
             return jsonify({'error': 'Patient not found or not in called status'}), 404
@@ -162,84 +321,211 @@ def api_complete():
 def api_room_queue(room_id):
     """Get queue status for specific room"""
     try:
-        if room_id not in ROOMS:
+        if room_id not in g.site.rooms:
             return jsonify({'error': 'Room not found'}), 404
             
-        queue_data = queue_system.get_room_queue(room_id)
-        return jsonify(queue_data)
+        return _versioned_json(
+            g.site.queue.get_version(room_id),
+            lambda: _room_queue_payload(room_id)
+        )
         
     except Exception as e:
         current_app.logger.error(f"Error getting room queue: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@bp.route('/api/queues')
+def api_room_queues():
+    """
+    Queue status of several rooms in one response, for lobby and hallway
+    screens: ?rooms=R01,R02 and/or ?types=MC,SP (every room of the types)
+    """
+    try:
+        room_ids = [r for r in request.args.get('rooms', '').split(',') if r]
+        room_types = [t for t in request.args.get('types', '').split(',') if t]
+        if not room_ids and not room_types:
+            return jsonify({'error': 'Missing rooms or types'}), 400
+
+        for room_id in room_ids:
+            if room_id not in g.site.rooms:
+                return jsonify({'error': f'Room not found: {room_id}'}), 404
+        for room_type in room_types:
+            if room_type not in g.site.room_types:
+                return jsonify({'error': f'Invalid room type: {room_type}'}), 400
+
+        # Requested rooms and the rooms of the requested types, in layout
+        # order, so any spelling of the same set shares one cached body
+        room_ids = [room_id for room_id, room in g.site.rooms.items()
+                    if room_id in room_ids or room['type'] in room_types]
+
+        queue = g.site.queue
+        return _versioned_json(
+            queue.get_rooms_version(room_ids),
+            lambda: {'rooms': {room_id: _room_queue_payload(room_id, data)
+                               for room_id, data in queue.get_room_queues(room_ids).items()}},
+            key=f"{request.path}?{','.join(room_ids)}"
+        )
+
+    except Exception as e:
+        current_app.logger.error(f"Error getting room queues: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def _room_queue_payload(room_id, data=None):
+    """Room queue, with the audio ids of the current patient's announcement"""
+    if data is None:
+        data = g.site.queue.get_room_queue(room_id)
+    if DISPLAY_AUDIO and data['current']:
+        data['announcement'] = announcement_ids(data['current'].Number, room_id,
+                                                g.site.rooms, g.site.room_types)
+    return data
+
+@bp.route('/api/announcement/<announcement_id>.mp3')
+def api_announcement_audio(announcement_id):
+    """
+    Announcement audio for the room displays (ids from /api/queue/<room_id>).
+    Cached by browsers for good, with Range requests for media players.
+    """
+    try:
+        found = parse_announcement_id(announcement_id, g.site.rooms, g.site.room_types)
+        if not DISPLAY_AUDIO or found is None:
+            return jsonify({'error': 'Announcement not found'}), 404
+        # Only calls the displays can show, so ids cannot drive synthesis
+        queue_number, room_id, text, lang = found
+        if queue_number not in {call.Number for call in g.site.queue.get_recent_room_calls(room_id)}:
+            return jsonify({'error': 'Announcement not found'}), 404
+
+        key, audio = announcement_audio().get(text, lang)
+        response = send_file(BytesIO(audio), mimetype='audio/mpeg', conditional=True,
+                             etag=key, max_age=ANNOUNCEMENT_CACHE_SECONDS)
+        response.cache_control.immutable = True
+        return response
+
+    except Exception as e:
+        current_app.logger.error(f"Error getting announcement audio: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @bp.route('/api/dashboard-status')
 def api_dashboard_status():
     """Get queue status for dashboard"""
     try:
-        status = queue_system.get_room_type_status()
-        return jsonify(status)
+        return _versioned_json(
+            g.site.queue.get_version(),
+            g.site.queue.get_room_type_status
+        )
         
     except Exception as e:
         current_app.logger.error(f"Error getting dashboard status: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@bp.route('/api/stream')
+def api_stream():
+    """
+    Server-Sent Events stream of queue changes.
+    Optional ?room=<room_id> or ?type=<room_type> limits the events sent.
+    """
+    room_id = request.args.get('room')
+    room_type = request.args.get('type')
+
+    if room_id and room_id not in g.site.rooms:
+        return jsonify({'error': 'Room not found'}), 404
+    if room_type and room_type not in g.site.room_types:
+        return jsonify({'error': f'Invalid room type: {room_type}'}), 400
+
+    subscription = g.site.queue.events.subscribe(room_id=room_id, room_type=room_type)
+    return Response(
+        g.site.queue.events.listen(subscription),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @bp.route('/api/recent-calls/<room_id>')
 def api_recent_calls(room_id):
     """Get recent calls for a specific room"""
     try:
-        if room_id not in ROOMS:
+        if room_id not in g.site.rooms:
             return jsonify({'error': 'Room not found'}), 404
             
-        recent_calls = queue_system.get_recent_room_calls(room_id)
-        return jsonify(recent_calls)
+        return _versioned_json(
+            g.site.queue.get_version(room_id),
+            lambda: g.site.queue.get_recent_room_calls(room_id)
+        )
         
     except Exception as e:
         current_app.logger.error(f"Error getting recent calls: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@bp.route('/api/import-batch', methods=['POST'])
-def api_import_batch():
-    """Import batch data"""
+@bp.route('/api/reports/summary')
+def api_report_summary():
+    """Wait/service time percentiles, hourly throughput and room utilisation"""
     try:
-        data = request.get_json()
-        if not data or 'data' not in data:
-            return jsonify({
-                'success': 0,
-                'errors': ['No data provided']
-            }), 400
+        today = datetime.now().date()
+        start = parse_day(request.args.get('start'), today)
+        end = parse_day(request.args.get('end'), start if request.args.get('start') else today)
+        return jsonify(g.site.reports.build(start, end, request.args.get('type')))
 
-        import_data = data['data']
-        success_count = 0
-        errors = []
-
-        # Validate room types and rooms
-        valid_room_types = set(ROOM_TYPES.keys())
-        valid_rooms = set(ROOMS.keys())
-
-        for i, row in enumerate(import_data):
-            try:
-                # Basic validation
-                if not all(k in row for k in ['Name', 'Room Type', 'Room']):
-                    raise ValueError('Missing required fields')
-
-                if row['Room Type'] not in valid_room_types:
-                    raise ValueError(f'Invalid room type: {row["Room Type"]}')
-
-                if row['Room'] not in valid_rooms:
-                    raise ValueError(f'Invalid room: {row["Room"]}')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error building report: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
 
-                if ROOMS[row['Room']]['type'] != row['Room Type']:
-                    raise ValueError(f'Room {row["Room"]} is not of type {row["Room Type"]}')
+@bp.route('/api/announcer/stats')
+def api_announcer_stats():
+    """Backpressure metrics of the voice announcer"""
+    try:
+        return jsonify(announcer_client.stats())
+    except Exception as e:
+        current_app.logger.error(f"Error getting announcer stats: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
 
-                # Add patient
-                queue_system.add_patient(
-                    name=row['Name'].strip(),
-                    room_type=row['Room Type']
-                )
-                success_count += 1
+# Column names of the import template sheet
+IMPORT_TEMPLATE_COLUMNS = {
+    'Patient Name': 'Name',
+    'Room Number': 'Room'
+}
+
+def _read_import_file(upload):
+    """Read an uploaded CSV/XLSX import file into rows"""
+    filename = (upload.filename or '').lower()
+    if filename.endswith('.csv'):
+        df = pd.read_csv(upload.stream, dtype=str)
+    elif filename.endswith(('.xlsx', '.xls')):
+        df = pd.read_excel(upload.stream, dtype=str)
+    else:
+        raise ValueError('Unsupported file type, upload a .csv or .xlsx file')
+
+    df = df.rename(columns=IMPORT_TEMPLATE_COLUMNS)
+    return df.astype(object).where(df.notna(), None)
 
-            except Exception as e:
-                errors.append(f'Row {i+2}: {str(e)}')
+@bp.route('/api/import-batch', methods=['POST'])
+def api_import_batch():
+    """Import batch data (JSON rows, or an uploaded CSV/XLSX file)"""
+    try:
+        if 'file' in request.files:
+            try:
+                import_data = _read_import_file(request.files['file'])
+            except ImportError:
+                return jsonify({
+                    'success': 0,
+                    'errors': ['Excel support is not installed on the server (pip install openpyxl); upload a CSV file']
+                }), 400
+            except ValueError as e:
+                return jsonify({
+                    'success': 0,
+                    'errors': [str(e)]
+                }), 400
+        else:
+            data = request.get_json(silent=True)
+            if not data or 'data' not in data:
+                return jsonify({
+                    'success': 0,
+                    'errors': ['No data provided']
+                }), 400
+            import_data = data['data']
+
+        success_count, errors = g.site.queue.add_patients_bulk(import_data)
 
         return jsonify({
             'success': success_count,
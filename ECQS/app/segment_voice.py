@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+import pygame
+
+class SegmentVoice:
+    """
+    Concatenative announcement engine.
+    Each phrase (colour word, number, room name, carrier phrase) is
+    synthesized once through the audio cache, decoded to PCM in the mixer
+    format and kept in memory up to max_bytes (least recently used
+    segments are dropped first); an announcement is the joined PCM of its
+    phrases, played as a single buffer.
+    """
+
+    def __init__(self, audio_cache, gap_ms=120, silence_threshold=500, max_bytes=64 * 1024 * 1024):
+        self.audio_cache = audio_cache
+        self.gap_ms = gap_ms
+        self.silence_threshold = silence_threshold
+        self.max_bytes = max_bytes
+        # (text, lang) -> PCM bytes, least recently used first
+        self._segments = OrderedDict()
+        self._total_bytes = 0
+        self._lock = Lock()
+
+    def _frame_bytes(self):
+        """Bytes per sample frame of the initialised mixer"""
+        _, size, channels = pygame.mixer.get_init()
+        return abs(size) // 8 * channels
+
+    def _trim(self, pcm):
+        """Strip leading and trailing silence from a 16-bit PCM segment"""
+        _, size, channels = pygame.mixer.get_init()
+        if size != -16:
+            return pcm
+
+        samples = np.frombuffer(pcm, dtype=np.int16).reshape(-1, channels)
+        loud = np.flatnonzero(np.abs(samples).max(axis=1) > self.silence_threshold)
+        if len(loud) == 0:
+            return pcm
+        return samples[loud[0]:loud[-1] + 1].tobytes()
+
+    def segment(self, text, lang):
+        """
+        Get the PCM of one phrase, synthesizing and decoding it on first use
+        Returns: raw PCM bytes in the mixer format
+        """
+        key = (text, lang)
+        with self._lock:
+            pcm = self._segments.get(key)
+            if pcm is not None:
+                self._segments.move_to_end(key)
+                return pcm
+
+        audio_file = self.audio_cache.get_or_create(text, lang)
+        pcm = self._trim(pygame.mixer.Sound(audio_file).get_raw())
+        with self._lock:
+            if key not in self._segments:
+                self._segments[key] = pcm
+                self._total_bytes += len(pcm)
+                while self._total_bytes > self.max_bytes and len(self._segments) > 1:
+                    _, dropped = self._segments.popitem(last=False)
+                    self._total_bytes -= len(dropped)
+        return pcm
+
+    def render(self, phrases, lang):
+        """Join the PCM segments of the phrases into one buffer"""
+        frequency, _, _ = pygame.mixer.get_init()
+        frame = self._frame_bytes()
+        gap = bytes(frequency * self.gap_ms // 1000 * frame)
+
+        return gap.join(self.segment(phrase, lang) for phrase in phrases)
+
+    def speak(self, phrases, lang):
+        """Play an announcement built from phrases and wait until it ends"""
+        sound = pygame.mixer.Sound(buffer=self.render(phrases, lang))
+        sound.play()
+        time.sleep(sound.get_length())
+
+    def warm_up(self, phrases_by_lang):
+        """
+        Load segments ahead of time
+        Returns: number of segments loaded
+        """
+        loaded = 0
+        for lang, phrases in phrases_by_lang.items():
+            for phrase in phrases:
+                self.segment(phrase, lang)
+                loaded += 1
+        return loaded
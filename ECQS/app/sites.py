@@ -0,0 +1,116 @@
+import glob
+import json
+import os
+from collections import OrderedDict
+from app.announcements import COLOR_TL
+from app.archive import RecordArchive
+from app.config import (ARCHIVE_DIR, DEFAULT_SITE, JOURNAL_DIR, RETENTION_INTERVAL, ROOM_TYPES,
+                        ROOMS, SITES_DIR, SITE_DATA_DIR)
+from app.models import create_queue_system
+from app.reporting import QueueReports
+
+class Site:
+    """One clinic (or floor): its room layout, queue and reports"""
+
+    def __init__(self, site_id, name, rooms, room_types, queue):
+        self.id = site_id
+        self.name = name
+        self.rooms = rooms
+        self.room_types = room_types
+        self.queue = queue
+        self.reports = QueueReports(queue)
+
+    @property
+    def url_prefix(self):
+        """URL prefix of the site's pages and API ('' for the default site)"""
+        return '' if self.id == DEFAULT_SITE else f"/site/{self.id}"
+
+class SiteRegistry:
+    """
+    Sites served by this deployment, each with its own QueueData
+    (records, locks, counters and event stream), so requests of one site
+    never wait on another site's locks.
+    """
+
+    def __init__(self):
+        self.sites = OrderedDict()
+
+    def add(self, site):
+        if site.id in self.sites:
+            raise ValueError(f"Duplicate site: {site.id}")
+        self.sites[site.id] = site
+
+    def get(self, site_id):
+        """Site by id, None when unknown"""
+        return self.sites.get(site_id)
+
+    def __iter__(self):
+        return iter(self.sites.values())
+
+    def __len__(self):
+        return len(self.sites)
+
+def load_site_config(path):
+    """
+    Read a site config file:
+        {"name": ..., "room_types": {...}, "rooms": {...}, "backend": "memory"}
+    room_types and rooms have the shape of ROOM_TYPES and ROOMS in config.py.
+    Returns: config dict
+    """
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+
+    for key in ('room_types', 'rooms'):
+        if not config.get(key):
+            raise ValueError(f"{path}: missing '{key}'")
+    for code, room_type in config['room_types'].items():
+        # Queue numbers are the code followed by digits
+        if not (code.isascii() and code.isalpha()):
+            raise ValueError(f"{path}: room type code {code!r} must be letters only")
+        if room_type.get('color_name') not in COLOR_TL:
+            raise ValueError(f"{path}: room type {code} needs a color_name of {', '.join(COLOR_TL)}")
+    for room_id, room in config['rooms'].items():
+        if room.get('type') not in config['room_types']:
+            raise ValueError(f"{path}: room {room_id} has unknown type {room.get('type')}")
+    return config
+
+def create_site(site_id, config):
+    """Build a site and its queue, storing its data under SITE_DATA_DIR/<site_id>"""
+    data_dir = os.path.join(SITE_DATA_DIR, site_id)
+    queue = create_queue_system(
+        config['rooms'], config['room_types'],
+        backend=config.get('backend', 'memory'),
+        sqlite_path=os.path.join(data_dir, 'queue.db'),
+        journal_dir=data_dir if JOURNAL_DIR else None,
+        overflow=config.get('overflow', {})
+    )
+    if RETENTION_INTERVAL:
+        queue.attach_archive(RecordArchive(os.path.join(data_dir, 'archive')))
+    return Site(site_id, config.get('name', site_id), config['rooms'], config['room_types'], queue)
+
+def create_site_registry():
+    """The default site (config.py layout) plus one site per SITES_DIR/<id>.json"""
+    registry = SiteRegistry()
+    queue = create_queue_system()
+    if RETENTION_INTERVAL:
+        queue.attach_archive(RecordArchive(ARCHIVE_DIR))
+    registry.add(Site(DEFAULT_SITE, 'Eye Center', ROOMS, ROOM_TYPES, queue))
+
+    if SITES_DIR and os.path.isdir(SITES_DIR):
+        for path in sorted(glob.glob(os.path.join(SITES_DIR, '*.json'))):
+            site_id = os.path.splitext(os.path.basename(path))[0]
+            registry.add(create_site(site_id, load_site_config(path)))
+    return registry
+
+def load_sites():
+    """
+    Fill the global registry from the configuration (called by create_app(),
+    which opens the journals); a registry set up beforehand, e.g. by tests
+    on in-memory queues, is kept as it is
+    """
+    if not len(sites):
+        for site in create_site_registry():
+            sites.add(site)
+
+# Global site registry, filled by create_app()
+sites = SiteRegistry()
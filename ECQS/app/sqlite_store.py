@@ -0,0 +1,677 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from uuid import uuid4
+import pandas as pd
+from app.config import DEFAULT_PRIORITY, OVERFLOW_RULES, ROOMS, ROOM_TYPES
+from app.metrics import timed
+from app.models import PatientRecord, QueueData, QUEUE_COLUMNS, TIME_COLUMNS
+from app.priority import sort_key, validate_priority
+
+SCHEMA = """
+-- Number lookups use the primary key index
+CREATE TABLE IF NOT EXISTS patients (
+    Number       TEXT PRIMARY KEY,
+    Name         TEXT,
+    RoomType     TEXT NOT NULL,
+    Status       TEXT NOT NULL,
+    CallRoom     TEXT,
+    CallTime     TEXT,
+    RegisterTime TEXT NOT NULL,
+    CompleteTime TEXT,
+    Priority     TEXT NOT NULL DEFAULT 'regular',
+    SortKey      REAL  -- Serving order of waiting patients, see app.priority.sort_key
+);
+CREATE INDEX IF NOT EXISTS idx_patients_room_calls ON patients (CallRoom, CallTime);
+
+CREATE TABLE IF NOT EXISTS counters (
+    RoomType   TEXT PRIMARY KEY,
+    LastNumber INTEGER NOT NULL
+);
+
+-- Change counters shared by all workers: 'all', 'type:<code>', 'room:<id>'
+CREATE TABLE IF NOT EXISTS versions (
+    Scope   TEXT PRIMARY KEY,
+    Version INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    Key   TEXT PRIMARY KEY,
+    Value TEXT
+);
+"""
+
+# Created after adding the columns missing from older databases
+LANE_INDEX = "CREATE INDEX IF NOT EXISTS idx_patients_lane ON patients (RoomType, Status, SortKey)"
+
+COLUMN_LIST = ', '.join(QUEUE_COLUMNS)
+
+class SQLiteQueueData(QueueData):
+    """
+    Queue data model stored in SQLite (WAL mode), so several worker
+    processes can serve the same queue. State transitions run in
+    BEGIN IMMEDIATE transactions, which also makes queue number
+    generation race-free across processes.
+    """
+
+    backend_name = 'sqlite'
+
+    def __init__(self, path, watch_interval=0.5, rooms=ROOMS, room_types=ROOM_TYPES,
+                 overflow=OVERFLOW_RULES):
+        super().__init__(rooms, room_types, overflow)
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        with self._transaction() as conn:
+            self._migrate(conn)
+            conn.executemany("INSERT OR IGNORE INTO counters VALUES (?, 0)",
+                             [(room_type,) for room_type in self.room_types])
+            scopes = ['all'] + [f"type:{t}" for t in self.room_types] + [f"room:{r}" for r in self.rooms]
+            conn.executemany("INSERT OR IGNORE INTO versions VALUES (?, 0)",
+                             [(scope,) for scope in scopes])
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('epoch', ?)", (uuid4().hex[:8],))
+            self.epoch = conn.execute("SELECT Value FROM meta WHERE Key = 'epoch'").fetchone()[0]
+
+        # Seed the wait estimators with the latest service times
+        recent = conn.execute(
+            "SELECT RoomType, CallTime, CompleteTime FROM patients WHERE Status = 'Complete' "
+            "ORDER BY CompleteTime DESC LIMIT 200"
+        ).fetchall()
+        for row in reversed(recent):
+            self._observe_row(row)
+
+        # Forward changes committed by other workers to this worker's stream clients
+        if watch_interval:
+            threading.Thread(target=self._watch_versions, args=(watch_interval,),
+                             daemon=True).start()
+
+    def _migrate(self, conn):
+        """Add the priority lane columns to a database created before them"""
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(patients)")}
+        if 'Priority' not in columns:
+            conn.execute(f"ALTER TABLE patients ADD COLUMN Priority TEXT NOT NULL DEFAULT '{DEFAULT_PRIORITY}'")
+        if 'SortKey' not in columns:
+            conn.execute("ALTER TABLE patients ADD COLUMN SortKey REAL")
+            rows = conn.execute("SELECT Number, RegisterTime FROM patients WHERE Status = 'Waiting'").fetchall()
+            conn.executemany("UPDATE patients SET SortKey = ? WHERE Number = ?", [
+                (sort_key(DEFAULT_PRIORITY, datetime.fromisoformat(row['RegisterTime'])), row['Number'])
+                for row in rows
+            ])
+        conn.execute(LANE_INDEX)
+
+    def _conn(self):
+        """SQLite connection of the calling thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction holding the database write lock from the start"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _to_record(row):
+        """Convert a patients row into a record dict"""
+        record = dict(row)
+        for column in TIME_COLUMNS:
+            if record[column] is not None:
+                record[column] = datetime.fromisoformat(record[column])
+        return record
+
+    def _bump_versions(self, room_type, rooms, conn=None):
+        """Advance the change counters inside the current transaction"""
+        scopes = ['all'] + [f"room:{room_id}" for room_id in rooms]
+        if room_type is not None:
+            scopes.append(f"type:{room_type}")
+        (conn or self._conn()).execute(
+            f"UPDATE versions SET Version = Version + 1 WHERE Scope IN ({', '.join('?' * len(scopes))})",
+            scopes
+        )
+
+    def _notify(self, action, queue_number, room_type, rooms):
+        """Publish a committed change to this worker's stream clients"""
+        self.events.publish({
+            'action': action,
+            'number': queue_number,
+            'room_type': room_type,
+            # Overflow rooms show this type's line too
+            'rooms': rooms + [rid for rid in self.overflow_rooms.get(room_type, []) if rid not in rooms]
+        })
+
+    def _watch_versions(self, interval):
+        """Publish 'sync' events for rooms changed by other connections"""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        seen = dict(conn.execute("SELECT Scope, Version FROM versions"))
+        data_version = None
+
+        while True:
+            time.sleep(interval)
+            try:
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current == data_version:
+                    continue
+                data_version = current
+
+                changed = {}
+                for scope, version in conn.execute("SELECT Scope, Version FROM versions"):
+                    if scope.startswith('room:') and seen.get(scope) != version:
+                        room_id = scope[5:]
+                        if room_id in self.rooms:
+                            changed.setdefault(self.rooms[room_id]['type'], []).append(room_id)
+                    seen[scope] = version
+
+                for room_type, rooms in changed.items():
+                    self._notify('sync', None, room_type, rooms)
+            except sqlite3.Error:
+                continue
+
+    def get_version(self, room_id=None):
+        """
+        Get a version tag of the queue state
+        Returns: tag that changes whenever the room (or, without room_id,
+        anything in the queue) changes
+        """
+        conn = self._conn()
+        if room_id is None:
+            version = conn.execute("SELECT Version FROM versions WHERE Scope = 'all'").fetchone()[0]
+            return f"{self.epoch}-{version}"
+
+        # A room's next patients can come from any of its lines
+        scopes = [f"type:{room_type}" for room_type in self._line_types(room_id)] + [f"room:{room_id}"]
+        versions = dict(conn.execute(
+            f"SELECT Scope, Version FROM versions WHERE Scope IN ({', '.join('?' * len(scopes))})",
+            scopes
+        ).fetchall())
+        return f"{self.epoch}-{room_id}-" + '-'.join(str(versions[scope]) for scope in scopes)
+
+    def attach_journal(self, journal):
+        """Not supported: SQLite storage is durable by itself"""
+        raise TypeError("SQLite storage is durable by itself; no journal is needed")
+
+    def _next_number(self, conn, room_type):
+        """Take the next number of a room type inside a write transaction"""
+        conn.execute("UPDATE counters SET LastNumber = LastNumber + 1 WHERE RoomType = ?",
+                     (room_type,))
+        last = conn.execute("SELECT LastNumber FROM counters WHERE RoomType = ?",
+                            (room_type,)).fetchone()[0]
+        self.last_numbers[room_type] = last
+        return f"{room_type}{last:03d}"
+
+    def generate_queue_number(self, room_type):
+        """Generate a new queue number for given room type"""
+        with self._transaction() as conn:
+            return self._next_number(conn, room_type)
+
+    @timed
+    def add_patient(self, name, room_type, priority=DEFAULT_PRIORITY):
+        """
+        Add a new patient to the queue, in the given priority lane
+        Returns: (queue number, estimated wait in seconds)
+        """
+        if room_type not in self.room_types:
+            raise ValueError(f"Invalid room type: {room_type}")
+        priority = validate_priority(priority)
+
+        with self._transaction() as conn:
+            queue_number = self._next_number(conn, room_type)
+            now = self.clock()
+            key = sort_key(priority, now)
+            conn.execute(
+                "INSERT INTO patients (Number, Name, RoomType, Status, RegisterTime, Priority, SortKey) "
+                "VALUES (?, ?, ?, 'Waiting', ?, ?, ?)",
+                (queue_number, name, room_type, now.isoformat(), priority, key)
+            )
+            self._bump_versions(room_type, self.type_rooms[room_type], conn)
+            ahead = conn.execute(
+                "SELECT COUNT(*) FROM patients WHERE RoomType = ? AND Status = 'Waiting' AND SortKey <= ?",
+                (room_type, key)
+            ).fetchone()[0] - 1
+
+        self._notify('add', queue_number, room_type, self.type_rooms[room_type])
+        return queue_number, self.estimators[room_type].eta(ahead)
+
+    def _waiting_count(self, conn, room_type):
+        return conn.execute(
+            "SELECT COUNT(*) FROM patients WHERE RoomType = ? AND Status = 'Waiting'",
+            (room_type,)
+        ).fetchone()[0]
+
+    def _eligible_types(self, conn, room_id):
+        """Lines a room calls from now: its own, and overflow lines at or over their threshold"""
+        lines = self.room_lines[room_id]
+        if len(lines) == 1:
+            return [lines[0][0]]
+        counts = dict(conn.execute(
+            f"SELECT RoomType, COUNT(*) FROM patients WHERE Status = 'Waiting' "
+            f"AND RoomType IN ({', '.join('?' * len(lines))}) GROUP BY RoomType",
+            [room_type for room_type, _ in lines]
+        ).fetchall())
+        return [room_type for room_type, threshold in lines
+                if not threshold or counts.get(room_type, 0) >= threshold]
+
+    def _next_rows(self, conn, room_id, columns, limit):
+        """Waiting patients a room would call next (see QueueData._next_for_room)"""
+        types = self._eligible_types(conn, room_id)
+        return conn.execute(
+            f"SELECT {columns} FROM patients WHERE Status = 'Waiting' "
+            f"AND RoomType IN ({', '.join('?' * len(types))}) "
+            "ORDER BY SortKey, RoomType != ?, rowid LIMIT ?",
+            types + [self.rooms[room_id]['type'], limit]
+        ).fetchall()
+
+    def _observe_row(self, row):
+        """Feed a completed service time (RoomType, CallTime, CompleteTime row) to the estimators"""
+        if row['CallTime'] and row['CompleteTime']:
+            seconds = (datetime.fromisoformat(row['CompleteTime'])
+                       - datetime.fromisoformat(row['CallTime'])).total_seconds()
+            self.estimators[row['RoomType']].observe(seconds)
+
+    @timed
+    def add_patients_bulk(self, rows):
+        """
+        Add a batch of patients from import rows in one transaction.
+        Numbers are assigned consecutively per room type in row order.
+        Returns: (number of patients added, list of per-row errors)
+        """
+        valid, errors = self.validate_import(rows)
+        if valid.empty:
+            return 0, errors
+
+        counts = valid['RoomType'].value_counts()
+        now = self.clock()
+        register_time = now.isoformat()
+
+        with self._transaction() as conn:
+            starts = {}
+            for room_type, added in counts.items():
+                conn.execute("UPDATE counters SET LastNumber = LastNumber + ? WHERE RoomType = ?",
+                             (int(added), room_type))
+                last = conn.execute("SELECT LastNumber FROM counters WHERE RoomType = ?",
+                                    (room_type,)).fetchone()[0]
+                starts[room_type] = last - int(added)
+                self.last_numbers[room_type] = last
+
+            offsets = valid.groupby('RoomType').cumcount().to_numpy() + 1
+            numbers = valid['RoomType'] + pd.Series(
+                valid['RoomType'].map(starts).to_numpy() + offsets, index=valid.index
+            ).map('{:03d}'.format)
+
+            conn.executemany(
+                "INSERT INTO patients (Number, Name, RoomType, Status, RegisterTime, Priority, SortKey) "
+                "VALUES (?, ?, ?, 'Waiting', ?, ?, ?)",
+                [(number, name, room_type, register_time, priority, sort_key(priority, now))
+                 for number, name, room_type, priority
+                 in zip(numbers, valid['Name'], valid['RoomType'], valid['Priority'])]
+            )
+            for room_type in counts.index:
+                self._bump_versions(room_type, self.type_rooms[room_type], conn)
+
+        for room_type in sorted(counts.index):
+            self._notify('add', None, room_type, self.type_rooms[room_type])
+        return len(valid), errors
+
+    @timed
+    def call_patient(self, queue_number, room_id):
+        """
+        Call a patient to a specific room
+        Returns: True if successful, False otherwise
+        """
+        if room_id not in self.rooms:
+            raise ValueError(f"Invalid room ID: {room_id}")
+
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT RoomType, Status, CallRoom FROM patients "
+                "WHERE Number = ? AND Status IN ('Waiting', 'Called')",
+                (queue_number,)
+            ).fetchone()
+            if row is None:
+                return False
+
+            patient_room_type = row['RoomType']
+            if patient_room_type not in self._line_types(room_id):
+                raise ValueError(f"Room type mismatch: {room_id} cannot serve {patient_room_type}")
+
+            # A patient already called to another room is not taken over
+            if row['Status'] == 'Called' and row['CallRoom'] != room_id:
+                return False
+            # Same overflow rule as call_next
+            if row['Status'] == 'Waiting':
+                self._check_overflow(room_id, patient_room_type,
+                                     self._waiting_count(conn, patient_room_type))
+
+            conn.execute(
+                "UPDATE patients SET Status = 'Called', CallRoom = ?, CallTime = ? WHERE Number = ?",
+                (room_id, self.clock().isoformat(), queue_number)
+            )
+
+            if row['Status'] == 'Waiting':
+                changed_rooms = self.type_rooms[patient_room_type]
+                if room_id not in changed_rooms:
+                    # Overflow call into a room of another type
+                    changed_rooms = changed_rooms + [room_id]
+            else:
+                changed_rooms = sorted({row['CallRoom'], room_id})
+            self._bump_versions(patient_room_type, changed_rooms, conn)
+
+        self._notify('call', queue_number, patient_room_type, changed_rooms)
+        return True
+
+    @timed
+    def call_next(self, room_id):
+        """
+        Complete the room's current patient and call the next waiting
+        patient of the room's type (see app.priority), or of an overflow
+        type over its backlog threshold when that patient has waited longer,
+        as one atomic step
+        Returns: dict with the completed number, the called patient (None
+        when nobody is waiting) and the room's new current/next state
+        """
+        if room_id not in self.rooms:
+            raise ValueError(f"Invalid room ID: {room_id}")
+
+        room_type = self.rooms[room_id]['type']
+        with self._transaction() as conn:
+            now = self.clock().isoformat()
+
+            completed = conn.execute(
+                "SELECT Number, RoomType, CallTime FROM patients WHERE CallRoom = ? AND Status = 'Called' "
+                "ORDER BY CallTime DESC LIMIT 1",
+                (room_id,)
+            ).fetchone()
+            if completed is not None:
+                conn.execute(
+                    "UPDATE patients SET Status = 'Complete', CompleteTime = ? WHERE Number = ?",
+                    (now, completed['Number'])
+                )
+                self._observe_row(dict(completed, CompleteTime=now))
+
+            called = next(iter(self._next_rows(conn, room_id, 'Number, RoomType', 1)), None)
+            if called is not None:
+                conn.execute(
+                    "UPDATE patients SET Status = 'Called', CallRoom = ?, CallTime = ? WHERE Number = ?",
+                    (room_id, now, called['Number'])
+                )
+
+            if completed and completed['RoomType'] != room_type:
+                # Overflow patient: their own type's versions change too
+                self._bump_versions(completed['RoomType'], [], conn)
+            called_type = called['RoomType'] if called else room_type
+            changed_rooms = sorted(set(self.type_rooms[called_type]) | {room_id}) if called else [room_id]
+            if completed or called:
+                self._bump_versions(called_type, changed_rooms, conn)
+
+            called_record = conn.execute(
+                f"SELECT {COLUMN_LIST} FROM patients WHERE Number = ?", (called['Number'],)
+            ).fetchone() if called else None
+
+        if completed:
+            self._notify('complete', completed['Number'], completed['RoomType'], [room_id])
+        if called:
+            self._notify('call', called['Number'], called_type, changed_rooms)
+
+        result = {
+            'completed': completed['Number'] if completed else None,
+            'called': PatientRecord.from_record(self._to_record(called_record)) if called_record else None
+        }
+        result.update(self.get_room_queue(room_id))
+        return result
+
+    @timed
+    def complete_service(self, queue_number):
+        """Mark a patient's service as complete"""
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT RoomType, CallRoom, CallTime FROM patients WHERE Number = ? AND Status = 'Called'",
+                (queue_number,)
+            ).fetchone()
+            if row is None:
+                return False
+
+            now = self.clock().isoformat()
+            conn.execute(
+                "UPDATE patients SET Status = 'Complete', CompleteTime = ? WHERE Number = ?",
+                (now, queue_number)
+            )
+            self._observe_row(dict(row, CompleteTime=now))
+            self._bump_versions(row['RoomType'], [row['CallRoom']], conn)
+
+        self._notify('complete', queue_number, row['RoomType'], [row['CallRoom']])
+        return True
+
+    @timed
+    def get_room_queue(self, room_id):
+        """
+        Get queue information for a specific room
+        Returns: dict with current and next patients
+        """
+        room_type = self.rooms[room_id]['type']
+        conn = self._conn()
+
+        current = conn.execute(
+            f"SELECT {COLUMN_LIST} FROM patients WHERE CallRoom = ? AND Status = 'Called' "
+            "ORDER BY CallTime DESC LIMIT 1",
+            (room_id,)
+        ).fetchone()
+
+        # Patients ahead in their own type's line, for the estimated wait
+        ahead = {}
+        next_patients = []
+        for row in self._next_rows(conn, room_id, COLUMN_LIST, 3):
+            line_ahead = ahead[row['RoomType']] = ahead.get(row['RoomType'], -1) + 1
+            next_patients.append(PatientRecord.from_record(
+                self._to_record(row), self.estimators[row['RoomType']].eta(line_ahead)))
+
+        return {
+            'current': PatientRecord.from_record(self._to_record(current)) if current else None,
+            'next': next_patients,
+            # Wait of a patient registering now
+            'estimatedWait': self.estimators[room_type].eta(self._waiting_count(conn, room_type))
+        }
+
+    @timed
+    def get_room_queues(self, room_ids):
+        """
+        Queue information of several rooms at once (lobby screens): three
+        queries in all, whatever the number of rooms
+        Returns: dict of room id -> get_room_queue() dict, in the given order
+        """
+        for room_id in room_ids:
+            if room_id not in self.rooms:
+                raise ValueError(f"Invalid room ID: {room_id}")
+        if not room_ids:
+            return {}
+
+        conn = self._conn()
+        rooms = sorted(set(room_ids))
+        types = sorted({t for room_id in rooms for t in self._line_types(room_id)})
+
+        # Latest call still in 'Called' per room
+        current = {}
+        for row in conn.execute(
+            f"SELECT {COLUMN_LIST} FROM patients WHERE Status = 'Called' "
+            f"AND CallRoom IN ({', '.join('?' * len(rooms))}) ORDER BY CallTime",
+            rooms
+        ):
+            current[row['CallRoom']] = row
+
+        counts = dict(conn.execute(
+            f"SELECT RoomType, COUNT(*) FROM patients WHERE Status = 'Waiting' "
+            f"AND RoomType IN ({', '.join('?' * len(types))}) GROUP BY RoomType",
+            types
+        ).fetchall())
+
+        # First 3 waiting patients of every line, in serving order
+        heads = {}
+        for row in conn.execute(
+            f"SELECT {COLUMN_LIST}, SortKey, RowId, Ahead FROM ("
+            "SELECT *, rowid AS RowId, ROW_NUMBER() OVER "
+            "(PARTITION BY RoomType ORDER BY SortKey, rowid) - 1 AS Ahead "
+            f"FROM patients WHERE Status = 'Waiting' AND RoomType IN ({', '.join('?' * len(types))})"
+            ") WHERE Ahead < 3 ORDER BY RoomType, Ahead",
+            types
+        ):
+            heads.setdefault(row['RoomType'], []).append(row)
+
+        queues = {}
+        for room_id in room_ids:
+            room_type = self.rooms[room_id]['type']
+            candidates = sorted(
+                (row for line_type, threshold in self.room_lines[room_id]
+                 if not threshold or counts.get(line_type, 0) >= threshold
+                 for row in heads.get(line_type, [])),
+                key=lambda row: (row['SortKey'], row['RoomType'] != room_type, row['RowId'])
+            )
+            row = current.get(room_id)
+            queues[room_id] = {
+                'current': PatientRecord.from_record(self._to_record(row)) if row else None,
+                'next': [PatientRecord.from_record(self._to_record(row),
+                                                   self.estimators[row['RoomType']].eta(row['Ahead']))
+                         for row in candidates[:3]],
+                'estimatedWait': self.estimators[room_type].eta(counts.get(room_type, 0))
+            }
+        return queues
+
+    def get_rooms_version(self, room_ids):
+        """Version tag of several rooms, read in one query (see get_version)"""
+        scopes = {f"type:{t}" for room_id in room_ids for t in self._line_types(room_id)}
+        scopes |= {f"room:{room_id}" for room_id in room_ids}
+        versions = dict(self._conn().execute(
+            f"SELECT Scope, Version FROM versions WHERE Scope IN ({', '.join('?' * len(scopes))})",
+            sorted(scopes)
+        ).fetchall())
+        return '.'.join(
+            f"{self.epoch}-{room_id}-" + '-'.join(
+                str(versions[scope]) for scope in
+                [f"type:{t}" for t in self._line_types(room_id)] + [f"room:{room_id}"])
+            for room_id in room_ids
+        )
+
+    @timed
+    def get_type_queue(self, room_type):
+        """
+        Get queue information for a room type
+        Returns: list of waiting patients
+        """
+        rows = self._conn().execute(
+            f"SELECT {COLUMN_LIST} FROM patients WHERE RoomType = ? AND Status = 'Waiting' "
+            "ORDER BY SortKey, rowid",
+            (room_type,)
+        ).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    @timed
+    def get_room_type_status(self):
+        """
+        Get queue status for all room types
+        Returns: dict with status for each room type
+        """
+        conn = self._conn()
+
+        waiting_counts = dict(conn.execute(
+            "SELECT RoomType, COUNT(*) FROM patients WHERE Status = 'Waiting' GROUP BY RoomType"
+        ).fetchall())
+
+        # Latest call per room among patients still in 'Called' status
+        current = {}
+        for room_id, number in conn.execute(
+                "SELECT CallRoom, Number FROM patients WHERE Status = 'Called' ORDER BY CallTime"):
+            current[room_id] = number
+
+        status = {}
+        for room_type in self.room_types:
+            next_numbers = [row[0] for row in conn.execute(
+                "SELECT Number FROM patients WHERE RoomType = ? AND Status = 'Waiting' "
+                "ORDER BY SortKey, rowid LIMIT 3",
+                (room_type,)
+            )]
+            waiting_count = waiting_counts.get(room_type, 0)
+
+            status[room_type] = {
+                'rooms': [{
+                    'room_id': room_id,
+                    'room_name': self.rooms[room_id]['name'],
+                    'current': current.get(room_id),
+                    'next': next_numbers,
+                    'waiting_count': waiting_count
+                } for room_id in self.type_rooms[room_type]],
+                'total_waiting': waiting_count
+            }
+
+        return status
+
+    def get_expired_records(self, cutoff_time):
+        """Completed records older than the cutoff"""
+        rows = self._conn().execute(
+            f"SELECT {COLUMN_LIST} FROM patients WHERE Status = 'Complete' AND CompleteTime < ?",
+            (cutoff_time.isoformat(),)
+        ).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    @timed
+    def clean_old_records(self, hours=24):
+        """
+        Remove completed records older than specified hours,
+        moving them to the archive first if one is attached
+        Returns: number of records removed
+        """
+        cutoff_time = self.clock() - pd.Timedelta(hours=hours)
+        if self.archive is not None:
+            self.archive.write(self.get_expired_records(cutoff_time))
+
+        with self._transaction() as conn:
+            rooms = [row[0] for row in conn.execute(
+                "SELECT DISTINCT CallRoom FROM patients WHERE Status = 'Complete' AND CompleteTime < ?",
+                (cutoff_time.isoformat(),)
+            )]
+            removed = 0
+            if rooms:
+                removed = conn.execute(
+                    "DELETE FROM patients WHERE Status = 'Complete' AND CompleteTime < ?",
+                    (cutoff_time.isoformat(),)
+                ).rowcount
+                self._bump_versions(None, rooms, conn)
+        return removed
+
+    @timed
+    def get_recent_room_calls(self, room_id, limit=10):
+        """Get recent calls for a specific room"""
+        rows = self._conn().execute(
+            f"SELECT {COLUMN_LIST} FROM patients WHERE CallRoom = ? "
+            "ORDER BY CallTime DESC LIMIT ?",
+            (room_id, limit)
+        ).fetchall()
+        calls = [PatientRecord.from_record(self._to_record(row)) for row in rows]
+        return self._with_archived_calls(room_id, calls, limit)
+
+    @timed
+    def to_dataframe(self):
+        """Export all records as a DataFrame (for reporting)"""
+        rows = self._conn().execute(
+            f"SELECT {COLUMN_LIST} FROM patients ORDER BY RegisterTime, rowid"
+        ).fetchall()
+        return pd.DataFrame([self._to_record(row) for row in rows], columns=QUEUE_COLUMNS)
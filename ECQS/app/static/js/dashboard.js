@@ -1,11 +1,14 @@
 let roomTypes = {};
 let roomConfig = {};
+let updateInterval = null;
+let eventSource = null;
+let pendingUpdate = null;
 
 async function loadConfigurations() {
     try {
         const [typesResponse, roomsResponse] = await Promise.all([
-            axios.get('/api/config/room-types'),
-            axios.get('/api/config/rooms')
+            axios.get(`${SITE_BASE}/api/config/room-types`),
+            axios.get(`${SITE_BASE}/api/config/rooms`)
         ]);
         
         roomTypes = typesResponse.data;
@@ -43,11 +46,12 @@ function createDashboardLayout() {
 
     // Start updating the dashboard
     updateDashboard();
+    startLiveUpdates();
 }
 
 async function updateDashboard() {
     try {
-        const response = await axios.get('/api/dashboard-status');
+        const response = await axios.get(`${SITE_BASE}/api/dashboard-status`);
         const status = response.data;
 
         Object.entries(status).forEach(([typeCode, typeStatus]) => {
@@ -88,9 +92,52 @@ async function updateDashboard() {
     } catch (error) {
         console.error('Failed to update dashboard:', error);
     }
-    
+}
+
+function scheduleUpdate() {
+    // Coalesce bursts of change events into a single refresh
+    if (pendingUpdate) return;
+    pendingUpdate = setTimeout(() => {
+        pendingUpdate = null;
+        updateDashboard();
+    }, 200);
+}
+
+function startLiveUpdates() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    eventSource = new EventSource(`${SITE_BASE}/api/stream`);
+
+    eventSource.onopen = () => {
+        // Stream is up: stop fallback polling and resync once
+        stopPolling();
+        updateDashboard();
+    };
+
+    eventSource.onmessage = scheduleUpdate;
+
+    eventSource.onerror = () => {
+        // The browser keeps reconnecting; poll until the stream is back
+        startPolling();
+    };
+}
+
+function startPolling() {
+    // Already polling
+    if (updateInterval) return;
+
     // Update every 5 seconds
-    setTimeout(updateDashboard, 5000);
+    updateInterval = setInterval(updateDashboard, 5000);
+}
+
+function stopPolling() {
+    if (updateInterval) {
+        clearInterval(updateInterval);
+        updateInterval = null;
+    }
 }
 
 // Initialize dashboard
@@ -98,6 +145,8 @@ document.addEventListener('DOMContentLoaded', loadConfigurations);
 
 // Cleanup on page unload
 window.addEventListener('beforeunload', () => {
-    // Clear any pending timeouts
-    clearTimeout(updateDashboard);
+    if (eventSource) {
+        eventSource.close();
+    }
+    stopPolling();
 });
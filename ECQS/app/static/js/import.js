@@ -2,8 +2,8 @@
 async function getRoomConfig() {
     try {
         const [roomTypesResponse, roomsResponse] = await Promise.all([
-            axios.get('/api/config/room-types'),
-            axios.get('/api/config/rooms')
+            axios.get(`${SITE_BASE}/api/config/room-types`),
+            axios.get(`${SITE_BASE}/api/config/rooms`)
         ]);
         
         return {
@@ -32,12 +32,14 @@ async function downloadTemplate() {
                 'Patient Name': 'EXAMPLE: John Santos',
                 'Room Type': 'MC',
                 'Room Number': 'R01',
+                'Priority': '',
                 'Notes': 'Example data - please delete'
             },
             {
                 'Patient Name': 'EXAMPLE: Maria Cruz',
                 'Room Type': 'SP',
                 'Room Number': 'R03',
+                'Priority': 'senior',
                 'Notes': 'Example data - please delete'
             }
         ];
@@ -52,7 +54,9 @@ async function downloadTemplate() {
             ['', ''],
             ...Object.entries(config.rooms).map(([roomId, info]) => 
                 ['', '', roomId, info.type]
-            )
+            ),
+            ['', ''],
+            ['Valid Priorities (empty = regular):', 'regular, senior, pwd, urgent']
         ];
         
         // Create main template worksheet
@@ -66,6 +70,7 @@ async function downloadTemplate() {
             { wch: 30 },  // Patient Name
             { wch: 15 },  // Room Type
             { wch: 15 },  // Room Number
+            { wch: 12 },  // Priority
             { wch: 40 }   // Notes
         ];
         
@@ -84,7 +89,9 @@ async function downloadTemplate() {
             B1: { t: 's', v: 'Room Type', h: 'Room Type', w: 'Room Type',
                 c: [{ a: 'SheetJS', t: 'Must be one of the valid room types from Validation sheet' }] },
             C1: { t: 's', v: 'Room Number', h: 'Room Number', w: 'Room Number',
-                c: [{ a: 'SheetJS', t: 'Must be one of the valid rooms from Validation sheet' }] }
+                c: [{ a: 'SheetJS', t: 'Must be one of the valid rooms from Validation sheet' }] },
+            D1: { t: 's', v: 'Priority', h: 'Priority', w: 'Priority',
+                c: [{ a: 'SheetJS', t: 'Optional: regular, senior, pwd or urgent' }] }
         };
         
         // Apply notes
@@ -125,7 +132,8 @@ async function handleFileUpload(file) {
                 const transformedData = jsonData.map(row => ({
                     Name: row['Patient Name'],
                     'Room Type': row['Room Type'],
-                    Room: row['Room Number']
+                    Room: row['Room Number'],
+                    Priority: row['Priority']
                 }));
                 
                 resolve(transformedData);
@@ -139,31 +147,6 @@ async function handleFileUpload(file) {
     });
 }
 
-// Validate imported data
-function validateData(data) {
-    const errors = [];
-    const validRoomTypes = new Set(['MC', 'SP', 'OP', 'RQ', 'WA']);
-    const validRooms = new Set(['R01', 'R02', 'R03', 'R04', 'R05', 'R06', 'R07', 'R08', 'R09', 'R10', 'R11']);
-    
-    data.forEach((row, index) => {
-        const rowNum = index + 2; // Add 2 for Excel row number (1-based + header row)
-        
-        if (!row.Name || typeof row.Name !== 'string' || row.Name.trim().length === 0) {
-            errors.push(`Row ${rowNum}: Invalid or missing patient name`);
-        }
-        
-        if (!row['Room Type'] || !validRoomTypes.has(row['Room Type'])) {
-            errors.push(`Row ${rowNum}: Invalid room type. Must be one of: ${Array.from(validRoomTypes).join(', ')}`);
-        }
-        
-        if (!row.Room || !validRooms.has(row.Room)) {
-            errors.push(`Row ${rowNum}: Invalid room number. Must be one of: ${Array.from(validRooms).join(', ')}`);
-        }
-    });
-    
-    return errors;
-}
-
 // Show preview of imported data
 function showPreview(data) {
     const previewSection = document.getElementById('previewSection');
@@ -174,6 +157,7 @@ function showPreview(data) {
             <td class="px-6 py-4 whitespace-nowrap">${row.Name}</td>
             <td class="px-6 py-4 whitespace-nowrap">${row['Room Type']}</td>
             <td class="px-6 py-4 whitespace-nowrap">${row.Room}</td>
+            <td class="px-6 py-4 whitespace-nowrap">${row.Priority || 'regular'}</td>
             <td class="px-6 py-4 whitespace-nowrap">Pending</td>
         </tr>
     `).join('');
@@ -181,7 +165,7 @@ function showPreview(data) {
     if (data.length > 10) {
         previewTable.innerHTML += `
             <tr>
-                <td colspan="4" class="px-6 py-4 text-center text-gray-500">
+                <td colspan="5" class="px-6 py-4 text-center text-gray-500">
                     ... and ${data.length - 10} more rows
                 </td>
             </tr>
@@ -238,26 +222,11 @@ async function startImport() {
     try {
         toggleLoading(true);
         
-        // Read and process file
-        const data = await handleFileUpload(file);
+        // Upload the file as is; the server parses and validates every row
+        const formData = new FormData();
+        formData.append('file', file);
         
-        // Validate data
-        const validationErrors = validateData(data);
-        if (validationErrors.length > 0) {
-            showResults({
-                success: 0,
-                errors: validationErrors
-            });
-            return;
-        }
-        
-        // Show preview
-        showPreview(data);
-        
-        // Send to server
-        const response = await axios.post('/api/import-batch', {
-            data: data
-        });
+        const response = await axios.post(`${SITE_BASE}/api/import-batch`, formData);
         
         // Show results
         showResults(response.data);
@@ -269,7 +238,7 @@ async function startImport() {
         console.error('Import error:', error);
         showResults({
             success: 0,
-            errors: [error.response?.data?.error || 'Import failed']
+            errors: error.response?.data?.errors || [error.response?.data?.error || 'Import failed']
         });
     } finally {
         toggleLoading(false);
@@ -281,7 +250,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // Add file input change handler
     document.getElementById('fileInput').addEventListener('change', async function(e) {
         const file = e.target.files[0];
-        if (file) {
+        // CSV files are previewed by the server import only
+        if (file && !file.name.toLowerCase().endsWith('.csv')) {
             try {
                 const data = await handleFileUpload(file);
                 showPreview(data);
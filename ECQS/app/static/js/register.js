@@ -3,7 +3,7 @@ let selectedService = null;
 
 async function loadServiceTypes() {
     try {
-        const response = await axios.get('/api/config/room-types');
+        const response = await axios.get(`${SITE_BASE}/api/config/room-types`);
         const types = response.data;
         
         const container = document.getElementById('serviceTypes');
@@ -60,14 +60,23 @@ function setLanguage(lang) {
     loadServiceTypes();
 }
 
-function showQueueNumber(number, serviceInfo) {
+function formatWait(seconds) {
+    const minutes = Math.max(1, Math.round(seconds / 60));
+    return currentLang === 'en' ?
+        `Estimated wait: about ${minutes} min` :
+        `Tinatayang paghihintay: mga ${minutes} minuto`;
+}
+
+function showQueueNumber(number, serviceInfo, estimatedWait) {
     const modal = document.getElementById('queueModal');
     const queueNumberEl = document.getElementById('queueNumber');
     const serviceTypeEl = document.getElementById('serviceType');
+    const estimatedWaitEl = document.getElementById('estimatedWait');
 
     queueNumberEl.textContent = number;
     queueNumberEl.style.color = serviceInfo.color;
     serviceTypeEl.textContent = serviceInfo[currentLang];
+    estimatedWaitEl.textContent = estimatedWait != null ? formatWait(estimatedWait) : '';
 
     modal.classList.remove('hidden');
 }
@@ -98,15 +107,17 @@ document.getElementById('registrationForm').addEventListener('submit', async (e)
     }
 
     try {
-        const response = await axios.post('/api/register', {
+        const response = await axios.post(`${SITE_BASE}/api/register`, {
             name: name.trim(),
-            roomType: selectedService
+            roomType: selectedService,
+            priority: document.getElementById('priority').value
         });
         
         if (response.data.success) {
-            const typesResponse = await axios.get('/api/config/room-types');
+            const typesResponse = await axios.get(`${SITE_BASE}/api/config/room-types`);
             const types = typesResponse.data;
-            showQueueNumber(response.data.queueNumber, types[selectedService]);
+            showQueueNumber(response.data.queueNumber, types[selectedService],
+                            response.data.estimatedWait);
         } else {
             throw new Error(response.data.error || 'Registration failed');
         }
@@ -2,6 +2,10 @@ let roomId = '';
 let roomConfig = null;
 let currentQueueNumber = null;
 let updateInterval = null;
+let eventSource = null;
+let pendingUpdate = null;
+let displayReady = false;
+let announcementAudio = null;
 
 async function initializeDisplay() {
     try {
@@ -9,7 +13,7 @@ async function initializeDisplay() {
         roomId = window.location.pathname.split('/').pop();
         
         // Load room configuration
-        const response = await axios.get(`/api/config/room/${roomId}`);
+        const response = await axios.get(`${SITE_BASE}/api/config/room/${roomId}`);
         roomConfig = response.data;
         
         // Update room information
@@ -22,7 +26,7 @@ async function initializeDisplay() {
         
         // Start updates
         await updateDisplay();
-        startAutoUpdate();
+        startLiveUpdates();
         
     } catch (error) {
         console.error('Error initializing display:', error);
@@ -32,11 +36,12 @@ async function initializeDisplay() {
 
 async function updateDisplay() {
     try {
-        const response = await axios.get(`/api/queue/${roomId}`);
+        const response = await axios.get(`${SITE_BASE}/api/queue/${roomId}`);
         const queueData = response.data;
         
         // Update current number
-        updateCurrentDisplay(queueData.current);
+        updateCurrentDisplay(queueData.current, queueData.announcement);
+        displayReady = true;
         
         // Update next numbers
         updateNextDisplay(queueData.next);
@@ -46,7 +51,7 @@ async function updateDisplay() {
     }
 }
 
-function updateCurrentDisplay(current) {
+function updateCurrentDisplay(current, announcement) {
     const numberDisplay = document.getElementById('currentNumber');
     const nameDisplay = document.getElementById('currentName');
     
@@ -56,6 +61,8 @@ function updateCurrentDisplay(current) {
             // Animate and play sound for new number
             numberDisplay.classList.add('blink');
             playAlertSound();
+            // Speak calls made while the screen is up, not the one found on load
+            if (displayReady) playAnnouncement(announcement);
             setTimeout(() => numberDisplay.classList.remove('blink'), 5000);
             currentQueueNumber = current.Number;
         }
@@ -79,6 +86,8 @@ function updateNextDisplay(nextPatients) {
             <div class="bg-gray-700 rounded-lg p-4 text-center">
                 <div class="text-3xl font-bold text-gray-300">${patient.Number}</div>
                 <div class="text-sm text-gray-400 mt-1">${patient.Name}</div>
+                ${patient.EstimatedWait != null ? `
+                <div class="text-sm text-gray-500 mt-1">~${Math.max(1, Math.round(patient.EstimatedWait / 60))} min</div>` : ''}
             </div>
         `).join('');
     } else {
@@ -104,32 +113,107 @@ function playAlertSound() {
     }
 }
 
-function startAutoUpdate() {
-    // Clear any existing interval
-    if (updateInterval) {
-        clearInterval(updateInterval);
+function playAnnouncement(announcement) {
+    // Spoken announcement (English, then Tagalog) after the alert sound
+    if (!announcement) return;
+    const urls = ['en', 'tl']
+        .filter(lang => announcement[lang])
+        .map(lang => `${SITE_BASE}/api/announcement/${announcement[lang]}.mp3`);
+
+    const alert = document.getElementById('alertSound');
+    if (alert && !alert.paused) {
+        alert.addEventListener('ended', () => playSequence(urls), { once: true });
+    } else {
+        playSequence(urls);
     }
-    
+}
+
+function playSequence(urls) {
+    // A newer call interrupts the one being spoken
+    if (announcementAudio) announcementAudio.pause();
+    const audio = new Audio();
+    announcementAudio = audio;
+
+    let index = 0;
+    const playNext = () => {
+        if (index >= urls.length || announcementAudio !== audio) return;
+        audio.src = urls[index++];
+        audio.play().catch(error => {
+            console.warn('Could not play announcement:', error);
+        });
+    };
+    audio.addEventListener('ended', playNext);
+    playNext();
+}
+
+function scheduleUpdate() {
+    // Coalesce bursts of change events into a single refresh
+    if (pendingUpdate) return;
+    pendingUpdate = setTimeout(() => {
+        pendingUpdate = null;
+        updateDisplay();
+    }, 200);
+}
+
+function startLiveUpdates() {
+    if (!window.EventSource) {
+        startAutoUpdate();
+        return;
+    }
+
+    eventSource = new EventSource(`${SITE_BASE}/api/stream?room=${roomId}`);
+
+    eventSource.onopen = () => {
+        // Stream is up: stop fallback polling and resync once
+        stopAutoUpdate();
+        updateDisplay();
+    };
+
+    eventSource.onmessage = scheduleUpdate;
+
+    eventSource.onerror = () => {
+        // The browser keeps reconnecting; poll until the stream is back
+        startAutoUpdate();
+    };
+}
+
+function stopLiveUpdates() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+    stopAutoUpdate();
+}
+
+function startAutoUpdate() {
+    // Already polling
+    if (updateInterval) return;
+
     // Update every 5 seconds
     updateInterval = setInterval(updateDisplay, 5000);
-    
-    // Handle page visibility changes
-    document.addEventListener('visibilitychange', () => {
-        if (document.hidden) {
-            clearInterval(updateInterval);
-        } else {
-            updateDisplay();
-            startAutoUpdate();
-        }
-    });
 }
 
-// Handle cleanup when page is unloaded
-window.addEventListener('beforeunload', () => {
+function stopAutoUpdate() {
     if (updateInterval) {
         clearInterval(updateInterval);
+        updateInterval = null;
+    }
+}
+
+// Handle page visibility changes
+document.addEventListener('visibilitychange', () => {
+    if (!roomConfig) return;
+
+    if (document.hidden) {
+        stopLiveUpdates();
+    } else {
+        updateDisplay();
+        startLiveUpdates();
     }
 });
 
+// Handle cleanup when page is unloaded
+window.addEventListener('beforeunload', stopLiveUpdates);
+
 // Initialize when page loads
 document.addEventListener('DOMContentLoaded', initializeDisplay);
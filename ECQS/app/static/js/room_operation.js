@@ -1,6 +1,9 @@
 let roomId = '';
 let roomConfig = null;
 let currentPatient = null;
+let updateInterval = null;
+let eventSource = null;
+let pendingUpdate = null;
 
 async function initialize() {
     // Get room ID from URL
@@ -8,7 +11,7 @@ async function initialize() {
     
     try {
         // Load room configuration
-        const configResponse = await axios.get(`/api/config/room/${roomId}`);
+        const configResponse = await axios.get(`${SITE_BASE}/api/config/room/${roomId}`);
         roomConfig = configResponse.data;
         
         // Update room information display
@@ -17,7 +20,7 @@ async function initialize() {
         document.getElementById('roomType').style.color = roomConfig.color;
         
         // Load room types for manual call
-        const typesResponse = await axios.get('/api/config/room-types');
+        const typesResponse = await axios.get(`${SITE_BASE}/api/config/room-types`);
         const roomTypes = typesResponse.data;
         
         const roomTypeSelect = document.getElementById('roomTypeSelect');
@@ -31,8 +34,8 @@ async function initialize() {
         // Initial data load
         await updateDisplay();
         
-        // Set up auto-refresh
-        setInterval(updateDisplay, 5000);
+        // Set up live updates
+        startLiveUpdates();
         
     } catch (error) {
         showNotification('Error initializing room operations: ' + error.message, 'error');
@@ -42,7 +45,7 @@ async function initialize() {
 async function updateDisplay() {
     try {
         // Get current queue status
-        const response = await axios.get(`/api/queue/${roomId}`);
+        const response = await axios.get(`${SITE_BASE}/api/queue/${roomId}`);
         const queueData = response.data;
         
         // Update current patient display
@@ -59,6 +62,52 @@ async function updateDisplay() {
     }
 }
 
+function scheduleUpdate() {
+    // Coalesce bursts of change events into a single refresh
+    if (pendingUpdate) return;
+    pendingUpdate = setTimeout(() => {
+        pendingUpdate = null;
+        updateDisplay();
+    }, 200);
+}
+
+function startLiveUpdates() {
+    if (!window.EventSource) {
+        startAutoUpdate();
+        return;
+    }
+
+    eventSource = new EventSource(`${SITE_BASE}/api/stream?room=${roomId}`);
+
+    eventSource.onopen = () => {
+        // Stream is up: stop fallback polling and resync once
+        stopAutoUpdate();
+        updateDisplay();
+    };
+
+    eventSource.onmessage = scheduleUpdate;
+
+    eventSource.onerror = () => {
+        // The browser keeps reconnecting; poll until the stream is back
+        startAutoUpdate();
+    };
+}
+
+function startAutoUpdate() {
+    // Already polling
+    if (updateInterval) return;
+
+    // Update every 5 seconds
+    updateInterval = setInterval(updateDisplay, 5000);
+}
+
+function stopAutoUpdate() {
+    if (updateInterval) {
+        clearInterval(updateInterval);
+        updateInterval = null;
+    }
+}
+
 function updateCurrentPatient(patient) {
     const numberEl = document.getElementById('currentNumber');
     const nameEl = document.getElementById('currentName');
@@ -85,6 +134,9 @@ function updateNextQueue(patients) {
                 class="p-4 bg-gray-50 rounded-lg hover:bg-gray-100 text-center transition-colors">
                 <div class="font-bold text-2xl">${patient.Number}</div>
                 <div class="text-sm text-gray-600">${patient.Name}</div>
+                ${patient.Priority && patient.Priority !== 'regular' ? `
+                    <div class="text-xs font-semibold uppercase text-red-600">${patient.Priority}</div>
+                ` : ''}
             </button>
         `).join('');
     } else {
@@ -94,7 +146,7 @@ function updateNextQueue(patients) {
 
 async function updateHistory() {
     try {
-        const response = await axios.get(`/api/recent-calls/${roomId}`);
+        const response = await axios.get(`${SITE_BASE}/api/recent-calls/${roomId}`);
         const history = response.data;
         
         const tbody = document.getElementById('historyTable');
@@ -124,11 +176,16 @@ async function updateHistory() {
 
 async function callNext() {
     try {
-        const response = await axios.get(`/api/queue/${roomId}`);
-        const queueData = response.data;
+        // Completes the current patient and calls the next one in one request
+        const response = await axios.post(`${SITE_BASE}/api/call-next/${roomId}`);
+        const result = response.data;
+        
+        updateCurrentPatient(result.current);
+        updateNextQueue(result.next);
+        await updateHistory();
         
-        if (queueData.next && queueData.next.length > 0) {
-            await callSpecific(queueData.next[0].Number);
+        if (result.called) {
+            showNotification(`Called number ${result.called.Number}`);
         } else {
             showNotification('No patients in queue');
         }
@@ -139,7 +196,7 @@ async function callNext() {
 
 async function callSpecific(number) {
     try {
-        await axios.post('/api/call', {
+        await axios.post(`${SITE_BASE}/api/call`, {
             queueNumber: number,
             roomId: roomId
         });
@@ -182,7 +239,7 @@ async function completeService() {
 
 async function completeSpecific(number) {
     try {
-        await axios.post('/api/complete', {
+        await axios.post(`${SITE_BASE}/api/complete`, {
             queueNumber: number
         });
         
@@ -217,5 +274,13 @@ function formatTime(timestamp) {
     return date.toLocaleTimeString();
 }
 
+// Close the stream when the page is unloaded
+window.addEventListener('beforeunload', () => {
+    if (eventSource) {
+        eventSource.close();
+    }
+    stopAutoUpdate();
+});
+
 // Initialize when page loads
 document.addEventListener('DOMContentLoaded', initialize);
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from io import BytesIO
+from threading import Event, Lock
+from time import perf_counter
+from app.metrics import SYNTHESIS_SECONDS
+
+class GTTSBackend:
+    """Speech synthesis backend using Google Text-to-Speech"""
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+
+    def synthesize(self, text, lang):
+        """Synthesize text and return the mp3 bytes"""
+        from gtts import gTTS
+
+        buffer = BytesIO()
+        gTTS(text=text, lang=lang, timeout=self.timeout).write_to_fp(buffer)
+        return buffer.getvalue()
+
+class AudioCache:
+    """
+    Content-addressed on-disk cache of synthesized speech.
+    Files are named by a hash of (text, lang) and evicted least recently
+    used first once the cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes, backend):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self._lock = Lock()
+
+        # key -> file size, least recently used first
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU index from the files already on disk"""
+        files = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.mp3'):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, filename))
+            files.append((stat.st_mtime, filename[:-4], stat.st_size))
+
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    @staticmethod
+    def make_key(text, lang):
+        """Cache key of an utterance"""
+        return hashlib.sha256(f"{lang}\0{text}".encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        """File path of a cache entry"""
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+
+    def get(self, text, lang):
+        """
+        Look up a cached utterance
+        Returns: path of the mp3 file, or None on a miss
+        """
+        key = self.make_key(text, lang)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+
+        path = self.path_for(key)
+        try:
+            # Keep the recency order across restarts
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+            return None
+        return path
+
+    def get_or_create(self, text, lang):
+        """
+        Get a cached utterance, synthesizing it on a miss
+        Returns: path of the mp3 file
+        """
+        path = self.get(text, lang)
+        if path:
+            return path
+        return self.put(text, lang, self._synthesize(text, lang))
+
+    def get_or_create_bytes(self, text, lang):
+        """
+        Like get_or_create, without going through the file on a miss
+        Returns: mp3 bytes
+        """
+        path = self.get(text, lang)
+        if path:
+            try:
+                with open(path, 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:
+                pass
+        audio = self._synthesize(text, lang)
+        self.put(text, lang, audio)
+        return audio
+
+    def _synthesize(self, text, lang):
+        # Called outside the lock so a slow backend does not block hits
+        start = perf_counter()
+        audio = self.backend.synthesize(text, lang)
+        SYNTHESIS_SECONDS.observe(perf_counter() - start, lang)
+        return audio
+
+    def put(self, text, lang, audio):
+        """Store synthesized audio; returns the path of the mp3 file"""
+        key = self.make_key(text, lang)
+        path = self.path_for(key)
+
+        # Write atomically so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(audio)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(audio)
+            self._total_bytes += len(audio)
+            self._evict(keep=key)
+        return path
+
+    def _forget(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self, keep=None):
+        """Remove least recently used entries until the cache fits"""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._forget(key)
+            try:
+                os.unlink(self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        return len(self._entries)
+
+class AudioBuffers:
+    """
+    Synthesized utterances kept in memory as mp3 bytes, in front of an
+    AudioCache (which keeps them across restarts). Least recently used
+    buffers are dropped past max_bytes. Concurrent requests for the same
+    utterance wait for a single synthesis.
+    """
+
+    def __init__(self, audio_cache, max_bytes):
+        self.audio_cache = audio_cache
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+
+        # key -> mp3 bytes, least recently used first
+        self._buffers = OrderedDict()
+        self._total_bytes = 0
+        # key -> Event set when its rendering ends
+        self._rendering = {}
+
+    def get(self, text, lang):
+        """
+        Get an utterance, loading or synthesizing it on a miss
+        Returns: (key, mp3 bytes)
+        """
+        key = AudioCache.make_key(text, lang)
+        while True:
+            with self._lock:
+                audio = self._buffers.get(key)
+                if audio is not None:
+                    self._buffers.move_to_end(key)
+                    return key, audio
+                done = self._rendering.get(key)
+                if done is None:
+                    done = self._rendering[key] = Event()
+                    break
+            # Rendered by another thread; retry here if that failed
+            done.wait()
+
+        try:
+            audio = self.audio_cache.get_or_create_bytes(text, lang)
+            with self._lock:
+                self._buffers[key] = audio
+                self._total_bytes += len(audio)
+                while self._total_bytes > self.max_bytes and len(self._buffers) > 1:
+                    _, dropped = self._buffers.popitem(last=False)
+                    self._total_bytes -= len(dropped)
+        finally:
+            with self._lock:
+                self._rendering.pop(key).set()
+        return key, audio
+
+    def __len__(self):
+        return len(self._buffers)
@@ -1,94 +1,106 @@
-from gtts import gTTS
-import tempfile
 import os
+from io import BytesIO
 from threading import Thread
-from queue import Queue
 import pygame
 import time
-from app.config import ROOM_TYPES, ROOMS
+from app.announcements import (create_announcement, create_announcement_phrases,
+                               segment_phrase_library)
+from app.config import (ANNOUNCEMENT_AUDIO_MAX_BYTES, ROOMS, SEGMENT_CACHE_MAX_BYTES, TTS_CACHE_DIR,
+                        TTS_CACHE_MAX_BYTES, TTS_TIMEOUT, VOICE_ENGINE)
+from app.metrics import PLAYBACK_SECONDS
+from app.segment_voice import SegmentVoice
+from app.tts_cache import AudioBuffers, AudioCache, GTTSBackend
 
-pygame.mixer.init()
-voice_queue = Queue()
+# Synthesized announcements, shared by the voice worker and the warm-up.
+# Swap audio_cache.backend to use another synthesizer (e.g. a stub in tests).
+audio_cache = AudioCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES, GTTSBackend(timeout=TTS_TIMEOUT))
 
-def format_number_for_speech(number):
-    """Format the number for speech (e.g., 'MC001' becomes 'green 1')"""
-    room_type = number[:2]
-    num = str(int(number[2:]))  # Remove leading zeros
-    color = ROOM_TYPES[room_type]['color_name']
-    return f"{color} {num}"
+# Recent announcements in memory, played without reading the cache files
+audio_buffers = AudioBuffers(audio_cache, ANNOUNCEMENT_AUDIO_MAX_BYTES)
 
-def create_announcement(queue_number, room_id):
-    """Create announcement text in English and Tagalog"""
-    formatted_num = format_number_for_speech(queue_number)
-    room_name = ROOMS[room_id]['name'].split('/')[0].strip()  # Get English name
-
-    # English announcement
-    en_text = f"{formatted_num}, please proceed to {room_name}"
-    
-    # Tagalog announcement
-    # Convert color names to Tagalog
-    color_tl = {
-        'blue': 'asul',
-        'green': 'berde',
-        'orange': 'orange',
-        'purple': 'lila',
-        'red': 'pula'
-    }
-    color_en = formatted_num.split()[0]
-    number = formatted_num.split()[1]
-    tl_text = f"Numero {color_tl[color_en]} {number}, mangyaring pumunta sa {room_name}"
-
-    return en_text, tl_text
+# Phrase segments for the 'segments' voice engine, filled from audio_cache
+segment_voice = SegmentVoice(audio_cache, max_bytes=SEGMENT_CACHE_MAX_BYTES)
 
 def speak_announcement(text, lang='en'):
-    """Create and play TTS announcement"""
+    """Play TTS announcement, synthesizing it only if not cached yet"""
     try:
-        # Create temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-        temp_filename = temp_file.name
-        temp_file.close()
-
-        # Create TTS and save to temp file
-        tts = gTTS(text=text, lang=lang)
-        tts.save(temp_filename)
+        _, audio = audio_buffers.get(text, lang)
 
-        # Play the file
-        pygame.mixer.music.load(temp_filename)
+        # Play the mp3 from memory
+        pygame.mixer.music.load(BytesIO(audio), 'mp3')
         pygame.mixer.music.play()
         while pygame.mixer.music.get_busy():
             time.sleep(0.1)
 
-        # Clean up
-        os.unlink(temp_filename)
-
     except Exception as e:
         print(f"Error in speech: {e}")
 
-def voice_worker():
-    """Background worker for processing voice announcements"""
-    while True:
-        announcement = voice_queue.get()
-        if announcement is None:
-            break
+def speak_segments(phrases, lang='en'):
+    """Play an announcement joined from cached phrase segments"""
+    try:
+        segment_voice.speak(phrases, lang)
+    except Exception as e:
+        print(f"Error in speech: {e}")
 
+def warm_up_announcements(count):
+    """
+    Pre-render the announcements for the first `count` numbers of every
+    room type in every room serving it (with the segments engine: the
+    phrase segments for numbers 1..count).
+    Returns: number of utterances newly synthesized
+    """
+    if VOICE_ENGINE == 'segments':
+        try:
+            init_audio()
+            return segment_voice.warm_up(segment_phrase_library(count))
+        except Exception as e:
+            print(f"Error warming up speech segments: {e}")
+            return 0
+
+    created = 0
+    for n in range(1, count + 1):
+        for room_id, room in ROOMS.items():
+            for text, lang in zip(create_announcement(f"{room['type']}{n:03d}", room_id), ('en', 'tl')):
+                if audio_cache.get(text, lang):
+                    continue
+                try:
+                    audio_cache.get_or_create(text, lang)
+                    created += 1
+                except Exception as e:
+                    # Synthesis unavailable: leave the rest for on-demand rendering
+                    print(f"Error warming up speech cache: {e}")
+                    return created
+    return created
+
+def start_warm_up(count):
+    """Run warm_up_announcements in the background"""
+    thread = Thread(target=warm_up_announcements, args=(count,), daemon=True)
+    thread.start()
+    return thread
+
+def init_audio():
+    """Open the audio device (announcer process, segment warm-up)"""
+    if not pygame.mixer.get_init():
+        # Keep SIGTERM/SIGINT working so the web process can stop the announcer
+        os.environ.setdefault('SDL_NO_SIGNAL_HANDLERS', '1')
+        pygame.mixer.init()
+
+def play_announcement(announcement):
+    """Speak one announcement job in English, then in Tagalog"""
+    with PLAYBACK_SECONDS.time(VOICE_ENGINE):
+        _play_announcement(announcement)
+
+def _play_announcement(announcement):
+    if VOICE_ENGINE == 'segments':
+        en_phrases, tl_phrases = announcement.get('phrases') or create_announcement_phrases(
+            announcement['number'], announcement['room'])
+        speak_segments(en_phrases, 'en')
+        time.sleep(0.5)  # Short pause between announcements
+        speak_segments(tl_phrases, 'tl')
+    else:
         # Play English announcement
         speak_announcement(announcement['en'], 'en')
         time.sleep(0.5)  # Short pause between announcements
 
         # Play Tagalog announcement
         speak_announcement(announcement['tl'], 'tl')
-
-        voice_queue.task_done()
-
-# Start voice worker thread
-voice_thread = Thread(target=voice_worker, daemon=True)
-voice_thread.start()
-
-def queue_announcement(queue_number, room_id):
-    """Queue an announcement to be spoken"""
-    en_text, tl_text = create_announcement(queue_number, room_id)
-    voice_queue.put({
-        'en': en_text,
-        'tl': tl_text
-    })
-    return en_text, tl_text
@@ -0,0 +1,319 @@
+"""
+Benchmark of the queue engine and the HTTP API on day-long traces.
+
+A trace replays one clinic day: scheduled patients bulk-imported in the
+morning, a walk-in registration burst in the first two hours, calls and
+completes in all rooms through the day, and display/dashboard polls in
+between. Each trace runs against QueueData directly ('queue') and
+through the Flask test client ('http'), for several day sizes.
+
+Results (ops/sec, latency percentiles per operation, peak memory) are
+written as JSON, so runs of different versions can be compared:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json   # exit 1 on regressions
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+# The benchmark measures the queue, not the voice announcer
+os.environ.setdefault('ECQS_AUDIO_MODE', 'none')
+
+from app.config import DEFAULT_SITE, ROOMS, ROOM_TYPES
+from app.models import QueueData
+
+DAY_MINUTES = 10 * 60
+BURST_MINUTES = 2 * 60
+IMPORT_BATCH = 100
+
+# Rooms whose operators use the one-click call-next; the others call
+# and complete separately, as in the operation panel
+CALL_NEXT_ROOMS = set(list(ROOMS)[::2])
+
+def day_trace(patients, seed=0):
+    """
+    Build the operations of one clinic day with `patients` patients
+    Returns: list of (operation, argument) in time order
+    """
+    rng = random.Random(seed)
+    room_types = list(ROOM_TYPES)
+    weights = [sum(1 for r in ROOMS.values() if r['type'] == t) for t in room_types]
+    events = []
+
+    # Scheduled patients (20%) are imported before opening, in batches
+    scheduled = patients // 5
+    rows = []
+    for i in range(scheduled):
+        room_id = rng.choice(list(ROOMS))
+        rows.append({'Name': f'Scheduled {i}', 'Room Type': ROOMS[room_id]['type'], 'Room': room_id})
+    for start in range(0, len(rows), IMPORT_BATCH):
+        events.append((0.0, 'import', rows[start:start + IMPORT_BATCH]))
+
+    # Walk-ins: half of them arrive in the morning burst
+    walk_ins = patients - scheduled
+    for i in range(walk_ins):
+        minute = rng.uniform(0, BURST_MINUTES) if i % 2 == 0 else rng.uniform(BURST_MINUTES, DAY_MINUTES)
+        events.append((minute, 'register', rng.choices(room_types, weights)[0]))
+
+    # Every room serves a similar share of the day, with some spare capacity
+    services_per_room = int(patients * 1.1 / len(ROOMS)) + 1
+    for room_id in ROOMS:
+        for _ in range(services_per_room):
+            minute = rng.uniform(5, DAY_MINUTES)
+            if room_id in CALL_NEXT_ROOMS:
+                events.append((minute, 'call_next', room_id))
+            else:
+                events.append((minute, 'complete', room_id))
+                events.append((minute + 0.01, 'call', room_id))
+
+    # Displays and dashboards polling between the changes
+    for _ in range(patients * 2):
+        minute = rng.uniform(0, DAY_MINUTES)
+        kind = rng.random()
+        if kind < 0.6:
+            events.append((minute, 'room_queue', rng.choice(list(ROOMS))))
+        elif kind < 0.9:
+            events.append((minute, 'dashboard', None))
+        else:
+            events.append((minute, 'recent_calls', rng.choice(list(ROOMS))))
+
+    events.sort(key=lambda e: e[0])
+    return [(op, arg) for _, op, arg in events]
+
+class QueueEngine:
+    """Runs trace operations on a QueueData"""
+
+    name = 'queue'
+
+    def __init__(self):
+        self.queue = QueueData()
+        self.count = 0
+
+    def register(self, room_type):
+        self.count += 1
+        self.queue.add_patient(f'Walk-in {self.count}', room_type)
+
+    def import_rows(self, rows):
+        self.queue.add_patients_bulk(rows)
+
+    def call_next(self, room_id):
+        self.queue.call_next(room_id)
+
+    def call(self, room_id):
+        waiting = self.queue.get_room_queue(room_id)['next']
+        if waiting:
+            self.queue.call_patient(waiting[0].Number, room_id)
+
+    def complete(self, room_id):
+        current = self.queue.get_room_queue(room_id)['current']
+        if current:
+            self.queue.complete_service(current.Number)
+
+    def room_queue(self, room_id):
+        self.queue.get_room_queue(room_id)
+
+    def dashboard(self, _):
+        self.queue.get_room_type_status()
+
+    def recent_calls(self, room_id):
+        self.queue.get_recent_room_calls(room_id)
+
+    def size(self):
+        return len(self.queue.records)
+
+class HttpEngine(QueueEngine):
+    """Runs trace operations through the API with Flask's test client"""
+
+    name = 'http'
+
+    def __init__(self):
+        from app import create_app
+        from app.sites import Site, sites
+
+        super().__init__()
+        sites.sites[DEFAULT_SITE] = Site(DEFAULT_SITE, 'Benchmark', ROOMS, ROOM_TYPES, self.queue)
+        self.client = create_app().test_client()
+
+    def register(self, room_type):
+        self.count += 1
+        self.client.post('/api/register', json={'name': f'Walk-in {self.count}', 'roomType': room_type})
+
+    def import_rows(self, rows):
+        self.client.post('/api/import-batch', json={'data': rows})
+
+    def call_next(self, room_id):
+        self.client.post(f'/api/call-next/{room_id}')
+
+    def call(self, room_id):
+        waiting = self.client.get(f'/api/queue/{room_id}').get_json()['next']
+        if waiting:
+            self.client.post('/api/call', json={'queueNumber': waiting[0]['Number'], 'roomId': room_id})
+
+    def complete(self, room_id):
+        current = self.client.get(f'/api/queue/{room_id}').get_json()['current']
+        if current:
+            self.client.post('/api/complete', json={'queueNumber': current['Number']})
+
+    def room_queue(self, room_id):
+        self.client.get(f'/api/queue/{room_id}')
+
+    def dashboard(self, _):
+        self.client.get('/api/dashboard-status')
+
+    def recent_calls(self, room_id):
+        self.client.get(f'/api/recent-calls/{room_id}')
+
+ENGINES = {engine.name: engine for engine in (QueueEngine, HttpEngine)}
+
+OPERATIONS = {
+    'register': 'register',
+    'import': 'import_rows',
+    'call_next': 'call_next',
+    'call': 'call',
+    'complete': 'complete',
+    'room_queue': 'room_queue',
+    'dashboard': 'dashboard',
+    'recent_calls': 'recent_calls'
+}
+
+def percentile(sorted_values, q):
+    """q-th percentile (0..100) of an already sorted list"""
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def replay(engine, trace):
+    """
+    Run a trace, timing each operation
+    Returns: (total seconds, dict of operation -> list of seconds)
+    """
+    latencies = {op: [] for op in OPERATIONS}
+    methods = {op: getattr(engine, name) for op, name in OPERATIONS.items()}
+
+    start = time.perf_counter()
+    for op, arg in trace:
+        began = time.perf_counter()
+        methods[op](arg)
+        latencies[op].append(time.perf_counter() - began)
+    return time.perf_counter() - start, latencies
+
+def run(engine_name, patients, seed=0):
+    """
+    Benchmark one engine on one day size
+    Returns: result dict
+    """
+    trace = day_trace(patients, seed)
+
+    engine = ENGINES[engine_name]()
+    seconds, latencies = replay(engine, trace)
+
+    # Peak memory in a second run, tracemalloc would distort the timings
+    tracemalloc.start()
+    memory_engine = ENGINES[engine_name]()
+    baseline, _ = tracemalloc.get_traced_memory()
+    replay(memory_engine, trace)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    operations = {}
+    for op, values in latencies.items():
+        if not values:
+            continue
+        values.sort()
+        operations[op] = {
+            'count': len(values),
+            'p50_us': round(percentile(values, 50) * 1e6, 1),
+            'p90_us': round(percentile(values, 90) * 1e6, 1),
+            'p99_us': round(percentile(values, 99) * 1e6, 1),
+            'max_us': round(values[-1] * 1e6, 1)
+        }
+
+    return {
+        'engine': engine_name,
+        'patients': patients,
+        'records': engine.size(),
+        'ops': len(trace),
+        'seconds': round(seconds, 4),
+        'ops_per_sec': round(len(trace) / seconds, 1),
+        'peak_memory_bytes': peak - baseline,
+        'operations': operations
+    }
+
+def git_revision():
+    """Commit of the benchmarked tree, None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, tolerance):
+    """
+    Compare ops/sec with a previous report
+    Returns: list of regressions found
+    """
+    previous = {(r['engine'], r['patients']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['engine'], result['patients']))
+        if before is None:
+            continue
+        change = result['ops_per_sec'] / before['ops_per_sec'] - 1
+        if change < -tolerance:
+            regressions.append(f"{result['engine']} @ {result['patients']} patients: "
+                               f"{before['ops_per_sec']} -> {result['ops_per_sec']} ops/s ({change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='500,2000,10000',
+                        help='patients per day, comma separated')
+    parser.add_argument('--engines', default='queue,http', help='queue and/or http')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report to this file (default: stdout)')
+    parser.add_argument('--baseline', help='JSON report of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed ops/sec drop against the baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    results = []
+    for engine_name in args.engines.split(','):
+        for patients in (int(size) for size in args.sizes.split(',')):
+            result = run(engine_name, patients, args.seed)
+            results.append(result)
+            print(f"{engine_name:5} {patients:6} patients: {result['ops_per_sec']:10.1f} ops/s, "
+                  f"peak {result['peak_memory_bytes'] / 2**20:.1f} MiB", file=sys.stderr)
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': args.seed,
+        'results': results
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION: {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,4 +11,6 @@ from app import create_app
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', debug=True)
+    # No reloader: its parent process would run create_app() as well and
+    # share the journal, archive and announcer with the serving process
+    app.run(host='0.0.0.0', debug=True, use_reloader=False)
@@ -0,0 +1,390 @@
+"""
+Discrete-event simulation of the clinic on the real queue engine.
+
+Patients arrive (Poisson arrivals during opening hours, or the
+registration times of a recorded trace) and are registered in a
+QueueData built from a room layout; a room calls its next patient with
+call_next as soon as it is free, and is busy for a service time drawn
+per room type. QueueData reads a virtual clock, so priority lanes,
+overflow rules and completions behave as on a real day, and a simulated
+week runs in a few seconds.
+
+The report gives per room type the waiting times (register -> call)
+and time-weighted queue lengths, and per room the patients served and
+the utilisation (busy time over opening hours):
+
+    python simulate.py --days 7
+    python simulate.py --rooms MC=3,SP=2,OP=2,RQ=1,WA=3
+    python simulate.py --sweep "MC=2,WA=3;MC=3,WA=2" --output sweep.json
+    python simulate.py --trace data/archive      # replay archived days
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import count
+
+# The simulation exercises the queue, not the voice announcer
+os.environ.setdefault('ECQS_AUDIO_MODE', 'none')
+
+import pandas as pd
+from app.config import DEFAULT_PRIORITY, OVERFLOW_RULES, ROOMS, ROOM_TYPES
+from app.models import QueueData
+
+# Mean service minutes per room type (override with --service)
+SERVICE_MINUTES = {'MC': 10, 'SP': 15, 'OP': 20, 'RQ': 5, 'WA': 12}
+DEFAULT_SERVICE_MINUTES = 10
+
+# Without --arrivals, each type gets this share of its rooms' capacity
+DEFAULT_LOAD = 0.85
+
+OPEN_HOUR = 8
+CLOSE_HOUR = 18
+
+# Monday; traces keep their own dates
+START = datetime(2024, 1, 1)
+
+class VirtualClock:
+    """Simulated time, read by QueueData through its clock attribute"""
+
+    def __init__(self, start):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+def parse_pairs(text, convert=float):
+    """'MC=3,SP=2' -> {'MC': 3.0, 'SP': 2.0}"""
+    pairs = {}
+    for item in filter(None, (part.strip() for part in (text or '').split(','))):
+        key, _, value = item.partition('=')
+        if not value:
+            raise ValueError(f"Expected KEY=VALUE, got: {item}")
+        pairs[key.strip()] = convert(value)
+    return pairs
+
+def build_rooms(counts, room_types=ROOM_TYPES, base=ROOMS):
+    """
+    Room layout with the given number of rooms per type (types left out
+    keep their count in the base layout)
+    Returns: rooms dict in the ROOMS format
+    """
+    rooms = {}
+    for room_type in room_types:
+        default = sum(1 for room in base.values() if room['type'] == room_type)
+        for _ in range(int(counts.get(room_type, default))):
+            n = len(rooms) + 1
+            rooms[f'R{n:02d}'] = {'type': room_type, 'name': f'Room {n} / Kwarto {n}'}
+    return rooms
+
+def service_sampler(mean_minutes, distribution, rng, samples=None):
+    """
+    Draw service durations for one room type: exponential, lognormal
+    (coefficient of variation 0.5) or resampled from recorded durations
+    Returns: function returning seconds
+    """
+    mean = mean_minutes * 60
+    if distribution == 'empirical' and samples:
+        return lambda: rng.choice(samples)
+    if distribution == 'exp':
+        return lambda: rng.expovariate(1 / mean)
+
+    sigma = math.sqrt(math.log(1 + 0.5 ** 2))
+    mu = math.log(mean) - sigma ** 2 / 2
+    return lambda: rng.lognormvariate(mu, sigma)
+
+def default_arrivals(rooms, room_types, service_minutes):
+    """
+    Demand filling DEFAULT_LOAD of each type's capacity in a room layout
+    Returns: dict of room type -> patients per hour
+    """
+    return {room_type: DEFAULT_LOAD * 60 / service_minutes.get(room_type, DEFAULT_SERVICE_MINUTES)
+            * sum(1 for room in rooms.values() if room['type'] == room_type)
+            for room_type in room_types}
+
+def poisson_arrivals(rates, days, rng, priorities=None, start=START):
+    """
+    Arrivals during opening hours of `days` days
+    Returns: sorted list of (time, room type, priority)
+    """
+    lanes = list(priorities or {})
+    weights = [priorities[lane] for lane in lanes]
+    rest = 1 - sum(weights)
+
+    arrivals = []
+    for day in range(days):
+        opening = start + timedelta(days=day, hours=OPEN_HOUR)
+        open_seconds = (CLOSE_HOUR - OPEN_HOUR) * 3600
+        for room_type, per_hour in rates.items():
+            if per_hour <= 0:
+                continue
+            offset = rng.expovariate(per_hour / 3600)
+            while offset < open_seconds:
+                priority = rng.choices(lanes + [DEFAULT_PRIORITY], weights + [rest])[0] if lanes \
+                    else DEFAULT_PRIORITY
+                arrivals.append((opening + timedelta(seconds=offset), room_type, priority))
+                offset += rng.expovariate(per_hour / 3600)
+    arrivals.sort(key=lambda a: a[0])
+    return arrivals
+
+def read_trace(path):
+    """
+    Recorded patients: a record archive directory (data/archive) or a
+    CSV / CSV.gz / Parquet file with RegisterTime and RoomType columns
+    (Priority, CallTime, CompleteTime optional)
+    Returns: (sorted arrivals, dict of room type -> service seconds seen)
+    """
+    if os.path.isdir(path):
+        from app.archive import RecordArchive
+        archive = RecordArchive(path)
+        df = pd.concat([archive.read_day(day) for day in archive.days()], ignore_index=True)
+    elif path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+
+    for column in ('RegisterTime', 'CallTime', 'CompleteTime'):
+        df[column] = pd.to_datetime(df[column]) if column in df else pd.NaT
+    if 'Priority' not in df:
+        df['Priority'] = DEFAULT_PRIORITY
+    df = df.dropna(subset=['RegisterTime', 'RoomType']).sort_values('RegisterTime')
+
+    arrivals = [(t.to_pydatetime(), room_type, priority if isinstance(priority, str) else DEFAULT_PRIORITY)
+                for t, room_type, priority in zip(df['RegisterTime'], df['RoomType'], df['Priority'])]
+
+    served = df.dropna(subset=['CallTime', 'CompleteTime'])
+    durations = {}
+    for room_type, seconds in zip(served['RoomType'], (served['CompleteTime'] - served['CallTime']).dt.total_seconds()):
+        if seconds > 0:
+            durations.setdefault(room_type, []).append(seconds)
+    return arrivals, durations
+
+def percentile(sorted_values, q):
+    """q-th percentile (0..100) of an already sorted list"""
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class Simulation:
+    """One run of a room layout against an arrival stream"""
+
+    def __init__(self, rooms, room_types, overflow, services):
+        self.clock = VirtualClock(START)
+        self.queue = QueueData(rooms, room_types, overflow)
+        self.queue.clock = self.clock.now
+        self.rooms = rooms
+        self.room_types = room_types
+        self.services = services
+
+        self.events = []
+        self._seq = count()
+        self.idle = set(rooms)
+        # Rooms to offer a new patient of each type, own type first
+        self.candidates = {room_type: [room_id for room_id in rooms if rooms[room_id]['type'] == room_type]
+                           + self.queue.overflow_rooms[room_type] for room_type in room_types}
+
+        self.waits = {room_type: [] for room_type in room_types}
+        self.arrived = dict.fromkeys(room_types, 0)
+        self.queue_area = dict.fromkeys(room_types, 0.0)
+        self.queue_max = dict.fromkeys(room_types, 0)
+        self.busy = dict.fromkeys(rooms, 0.0)
+        self.served = dict.fromkeys(rooms, 0)
+        self.overflow_served = dict.fromkeys(rooms, 0)
+
+    def _schedule(self, when, kind, arg):
+        heapq.heappush(self.events, (when, next(self._seq), kind, arg))
+
+    def _advance(self, when):
+        """Move the clock, accumulating the time-weighted queue lengths"""
+        elapsed = (when - self.clock.current).total_seconds()
+        if elapsed > 0:
+            for room_type, status in self.queue.get_room_type_status().items():
+                self.queue_area[room_type] += status['total_waiting'] * elapsed
+        self.clock.current = when
+
+    def _call_next(self, room_id):
+        """Free the room and call its next patient; schedule the end of the service"""
+        called = self.queue.call_next(room_id)['called']
+        if called is None:
+            self.idle.add(room_id)
+            return False
+
+        self.idle.discard(room_id)
+        room_type = called.RoomType
+        # PatientRecord times are epoch milliseconds
+        self.waits[room_type].append((called.CallTime - called.RegisterTime) / 1000)
+        self.served[room_id] += 1
+        if room_type != self.rooms[room_id]['type']:
+            self.overflow_served[room_id] += 1
+
+        seconds = self.services[room_type]()
+        self.busy[room_id] += seconds
+        self._schedule(self.clock.current + timedelta(seconds=seconds), 'done', room_id)
+        return True
+
+    def run(self, arrivals):
+        """
+        Play all arrivals and serve everyone
+        Returns: report dict
+        """
+        if arrivals:
+            self.clock.current = arrivals[0][0].replace(hour=0, minute=0, second=0, microsecond=0)
+        first_day = self.clock.current
+        for when, room_type, priority in arrivals:
+            self._schedule(when, 'arrive', (room_type, priority))
+
+        day = first_day
+        while self.events:
+            when, _, kind, arg = heapq.heappop(self.events)
+            # Retention runs at midnight, as the background task would
+            while when >= day + timedelta(days=1):
+                day += timedelta(days=1)
+                self._advance(day)
+                self.queue.clean_old_records(24)
+            self._advance(when)
+
+            if kind == 'arrive':
+                room_type, priority = arg
+                self.arrived[room_type] += 1
+                self.queue.add_patient(f'Patient {next(self._seq)}', room_type, priority)
+                waiting = self.queue.get_room_type_status()[room_type]['total_waiting']
+                self.queue_max[room_type] = max(self.queue_max[room_type], waiting)
+                # Overflow rooms may open up on this arrival, so every idle
+                # room that could serve the type tries to call
+                for room_id in self.candidates[room_type]:
+                    if room_id in self.idle:
+                        self._call_next(room_id)
+            else:
+                self._call_next(arg)
+
+        days = max(1, (day - first_day).days + 1)
+        return self.report(days, (day + timedelta(days=1) - first_day).total_seconds())
+
+    def report(self, days, total_seconds):
+        open_seconds = days * (CLOSE_HOUR - OPEN_HOUR) * 3600
+        types = {}
+        for room_type in self.room_types:
+            waits = sorted(self.waits[room_type])
+            types[room_type] = {
+                'arrivals': self.arrived[room_type],
+                'served': len(waits),
+                'wait_mean_min': round(sum(waits) / len(waits) / 60, 1) if waits else None,
+                'wait_p50_min': round(percentile(waits, 50) / 60, 1) if waits else None,
+                'wait_p90_min': round(percentile(waits, 90) / 60, 1) if waits else None,
+                'wait_p99_min': round(percentile(waits, 99) / 60, 1) if waits else None,
+                'wait_max_min': round(waits[-1] / 60, 1) if waits else None,
+                'queue_mean_open_hours': round(self.queue_area[room_type] / open_seconds, 2),
+                'queue_max': self.queue_max[room_type]
+            }
+
+        rooms = {room_id: {
+            'type': room['type'],
+            'served': self.served[room_id],
+            'overflow_served': self.overflow_served[room_id],
+            'utilisation': round(self.busy[room_id] / open_seconds, 3)
+        } for room_id, room in self.rooms.items()}
+
+        return {
+            'days': days,
+            'simulated_hours': round(total_seconds / 3600, 1),
+            'layout': {room_type: sum(1 for r in self.rooms.values() if r['type'] == room_type)
+                       for room_type in self.room_types},
+            'types': types,
+            'rooms': rooms
+        }
+
+def simulate(rooms=ROOMS, room_types=ROOM_TYPES, overflow=OVERFLOW_RULES, days=7, arrivals=None,
+             service_minutes=None, distribution='lognormal', trace=None, priorities=None, seed=0):
+    """
+    Simulate a room layout on Poisson arrivals (`arrivals` patients per
+    hour per type, by default DEFAULT_LOAD of the layout's capacity) or
+    on a recorded trace
+    Returns: report dict (see Simulation.report), plus the wall-clock seconds
+    """
+    rng = random.Random(seed)
+    service_minutes = dict(SERVICE_MINUTES, **(service_minutes or {}))
+
+    recorded = {}
+    if trace:
+        stream, recorded = read_trace(trace)
+        stream = [a for a in stream if a[1] in room_types]
+    else:
+        rates = default_arrivals(rooms, room_types, service_minutes)
+        rates.update(arrivals or {})
+        stream = poisson_arrivals(rates, days, rng, priorities)
+
+    services = {room_type: service_sampler(service_minutes.get(room_type, DEFAULT_SERVICE_MINUTES),
+                                           distribution, rng, recorded.get(room_type))
+                for room_type in room_types}
+
+    started = time.perf_counter()
+    report = Simulation(rooms, room_types, overflow, services).run(stream)
+    report['wall_seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+def summary(report):
+    """Short text table of a report"""
+    lines = [f"layout {report['layout']}, {report['days']} days, {report['wall_seconds']}s"]
+    for room_type, stats in report['types'].items():
+        lines.append(f"  {room_type}: {stats['served']:5}/{stats['arrivals']:<5} served, wait p50 "
+                     f"{stats['wait_p50_min']} p90 {stats['wait_p90_min']} max {stats['wait_max_min']} min, "
+                     f"queue mean {stats['queue_mean_open_hours']} max {stats['queue_max']}")
+    for room_id, stats in report['rooms'].items():
+        lines.append(f"  {room_id} ({stats['type']}): {stats['served']:5} served "
+                     f"({stats['overflow_served']} overflow), utilisation {stats['utilisation']:.0%}")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days', type=int, default=7, help='days of Poisson arrivals')
+    parser.add_argument('--rooms', help='rooms per type, e.g. MC=3,WA=2 (default: app/config.py)')
+    parser.add_argument('--sweep', help='several --rooms layouts separated by ";"')
+    parser.add_argument('--site', help="site JSON file (sites/<id>.json) to take rooms, types and overflow from")
+    parser.add_argument('--no-overflow', action='store_true', help='ignore the overflow rules')
+    parser.add_argument('--arrivals', help='patients per hour per type, e.g. MC=8,WA=6')
+    parser.add_argument('--service', help='mean service minutes per type, e.g. MC=12')
+    parser.add_argument('--distribution', default='lognormal', choices=('lognormal', 'exp', 'empirical'),
+                        help='service times (empirical: resample the trace)')
+    parser.add_argument('--priorities', help='share of arrivals per priority lane, e.g. senior=0.1,urgent=0.02')
+    parser.add_argument('--trace', help='replay recorded registrations (archive directory or CSV/Parquet)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report to this file (default: stdout)')
+    args = parser.parse_args()
+
+    room_types, base_rooms, overflow = ROOM_TYPES, ROOMS, OVERFLOW_RULES
+    if args.site:
+        from app.sites import load_site_config
+        config = load_site_config(args.site)
+        room_types, base_rooms, overflow = config['room_types'], config['rooms'], config.get('overflow', {})
+    if args.no_overflow:
+        overflow = {}
+
+    # The same demand for every layout: by default, that of the base layout
+    service = parse_pairs(args.service)
+    arrivals = default_arrivals(base_rooms, room_types, dict(SERVICE_MINUTES, **service))
+    arrivals.update(parse_pairs(args.arrivals))
+
+    layouts = args.sweep.split(';') if args.sweep else [args.rooms]
+    reports = []
+    for layout in layouts:
+        rooms = build_rooms(parse_pairs(layout, int), room_types, base_rooms) if layout else base_rooms
+        report = simulate(rooms, room_types, {} if args.no_overflow else overflow, args.days,
+                          arrivals, service, args.distribution,
+                          args.trace, parse_pairs(args.priorities), args.seed)
+        reports.append(report)
+        print(summary(report), file=sys.stderr)
+
+    text = json.dumps(reports if args.sweep else reports[0], indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
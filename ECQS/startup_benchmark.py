@@ -0,0 +1,79 @@
+"""
+Cold start benchmark for create_app() with audio disabled.
+
+Each run imports the app in a fresh interpreter (ECQS_AUDIO_MODE=none),
+times `from app import create_app; create_app()` and checks that the
+audio stack (pygame, gTTS) was not loaded. Fails when the median time
+is above the target.
+
+    python startup_benchmark.py --runs 5 --target 1.0
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+AUDIO_MODULES = ('pygame', 'gtts')
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+from app.config import DEFAULT_SITE, ROOMS, ROOM_TYPES
+from app.models import QueueData
+from app.sites import Site, sites
+# In-memory queue, so runs do not replay or write the real journal
+sites.add(Site(DEFAULT_SITE, 'Startup benchmark', ROOMS, ROOM_TYPES, QueueData()))
+create_app()
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'seconds': elapsed,
+    'audio_modules': [m for m in {AUDIO_MODULES!r} if m in sys.modules]
+}}))
+"""
+
+def measure(runs):
+    """
+    Time cold create_app() calls in fresh interpreters
+    Returns: list of result dicts ({'seconds', 'audio_modules'})
+    """
+    env = dict(os.environ, ECQS_AUDIO_MODE='none')
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE], cwd=here, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--target', type=float, default=1.0,
+                        help='maximum median startup time in seconds')
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    times = [r['seconds'] for r in results]
+    median = statistics.median(times)
+    print(f'create_app() cold start over {args.runs} runs: '
+          f'min {min(times):.3f}s, median {median:.3f}s, max {max(times):.3f}s')
+
+    problems = []
+    loaded = sorted({m for r in results for m in r['audio_modules']})
+    if loaded:
+        problems.append(f'audio modules imported with audio disabled: {", ".join(loaded)}')
+    if median > args.target:
+        problems.append(f'median {median:.3f}s is above the {args.target:.3f}s target')
+
+    for problem in problems:
+        print(f'FAIL: {problem}')
+    if not problems:
+        print('OK')
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
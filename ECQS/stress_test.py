@@ -0,0 +1,160 @@
+"""
+Concurrency stress test for the queue API.
+
+Runs hundreds of threads against the API at the same time: registration
+threads for every room type and operator threads for every room that
+call and complete patients. Afterwards it checks that no queue number
+was handed out twice and no patient was called to two rooms.
+
+    python stress_test.py                      # in-process Flask test client
+    python stress_test.py --url http://host:5000   # a running server
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+
+# The in-process test client runs without voice announcements
+os.environ.setdefault('ECQS_AUDIO_MODE', 'none')
+
+from app.config import ROOMS, ROOM_TYPES
+
+class TestClientAPI:
+    """Calls the API through Flask's test client on a fresh in-memory queue"""
+
+    def __init__(self):
+        from app import create_app
+        from app.config import DEFAULT_SITE, ROOMS, ROOM_TYPES
+        from app.models import QueueData
+        from app.sites import Site, sites
+
+        # Fresh queue without journal, so runs do not touch the real data
+        sites.sites[DEFAULT_SITE] = Site(DEFAULT_SITE, 'Stress test', ROOMS, ROOM_TYPES, QueueData())
+        self.client = create_app().test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_json()
+
+    def post(self, path, data):
+        response = self.client.post(path, json=data)
+        return response.status_code, response.get_json()
+
+class HttpAPI:
+    """Calls the API of a running server"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def _request(self, request):
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, json.loads(response.read() or 'null')
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read() or 'null')
+
+    def get(self, path):
+        return self._request(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data):
+        return self._request(urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(data).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        ))
+
+def run(api, registrations_per_thread=5, register_threads=200, operators_per_room=10,
+        calls_per_operator=20):
+    """
+    Run the stress test
+    Returns: list of problems found (empty when everything is consistent)
+    """
+    issued = []
+    called = defaultdict(list)
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(register_threads + operators_per_room * len(ROOMS))
+
+    def register():
+        start.wait()
+        for i in range(registrations_per_thread):
+            status, data = api.post('/api/register', {
+                'name': f'Stress {threading.get_ident()} {i}',
+                'roomType': random.choice(list(ROOM_TYPES))
+            })
+            with lock:
+                if status == 200:
+                    issued.append(data['queueNumber'])
+                else:
+                    errors.append(f'register: HTTP {status} {data}')
+
+    def operate(room_id):
+        start.wait()
+        for _ in range(calls_per_operator):
+            status, queue = api.get(f'/api/queue/{room_id}')
+            if status != 200 or not queue['next']:
+                continue
+
+            number = random.choice(queue['next'])['Number']
+            status, data = api.post('/api/call', {'queueNumber': number, 'roomId': room_id})
+            if status == 200:
+                with lock:
+                    called[number].append(room_id)
+                api.post('/api/complete', {'queueNumber': number})
+            elif status != 404:
+                with lock:
+                    errors.append(f'call {number} in {room_id}: HTTP {status} {data}')
+
+    threads = [threading.Thread(target=register) for _ in range(register_threads)]
+    for room_id in ROOMS:
+        threads += [threading.Thread(target=operate, args=(room_id,))
+                    for _ in range(operators_per_room)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    problems = list(errors)
+
+    duplicates = [number for number, n in Counter(issued).items() if n > 1]
+    if duplicates:
+        problems.append(f'duplicate queue numbers: {sorted(duplicates)}')
+
+    double_called = {number: rooms for number, rooms in called.items() if len(set(rooms)) > 1}
+    if double_called:
+        problems.append(f'patients called more than once: {double_called}')
+
+    expected = registrations_per_thread * register_threads
+    if len(issued) != expected:
+        problems.append(f'{len(issued)} registrations succeeded, expected {expected}')
+
+    print(f'{len(threads)} threads, {len(issued)} registrations, '
+          f'{sum(len(r) for r in called.values())} calls')
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', help='base URL of a running server (default: in-process)')
+    parser.add_argument('--register-threads', type=int, default=200)
+    parser.add_argument('--operators-per-room', type=int, default=10)
+    args = parser.parse_args()
+
+    api = HttpAPI(args.url) if args.url else TestClientAPI()
+    problems = run(api, register_threads=args.register_threads,
+                   operators_per_room=args.operators_per_room)
+
+    for problem in problems:
+        print(f'FAIL: {problem}')
+    if not problems:
+        print('OK: no duplicate numbers, no double calls')
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
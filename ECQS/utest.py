@@ -1,168 +1,720 @@
+import glob
+import os
 import unittest
-from unittest.mock import Mock, patch
-from app import create_app
-from app.models import Patient, Room, Queue
-from app.voice_utils import VoiceAnnouncement
 import json
-import pandas as pd
-from datetime import datetime
+import tempfile
+import time
+import wave
+from datetime import datetime, timedelta
+from io import BytesIO
+import numpy as np
+
+# Tests run without the voice announcer
+os.environ.setdefault('ECQS_AUDIO_MODE', 'none')
+
+from app import create_app, routes
+from app.announcements import announcement_ids, create_announcement
+from app.archive import RecordArchive, RetentionScheduler
+from app.announcer import AnnouncementQueue, Announcer, queue_announcement
+from app.config import DEFAULT_ANNOUNCER_AUTHKEY, DEFAULT_SITE, OVERFLOW_RULES, ROOMS, ROOM_TYPES
+from app.journal import QueueJournal
+from app.models import QueueData
+from app.priority import WaitingLine
+from app.sqlite_store import SQLiteQueueData
+from app.sites import Site, load_site_config, sites
+from app.tts_cache import AudioBuffers, AudioCache
+from simulate import Simulation, build_rooms, simulate
 
 class TestEyeQueueSystem(unittest.TestCase):
     def setUp(self):
         """Set up test environment before each test"""
-        self.app = create_app('testing')
+        # Fresh in-memory queue (no journal) for every test
+        self.queue = QueueData()
+        sites.sites[DEFAULT_SITE] = Site(DEFAULT_SITE, 'Test', ROOMS, ROOM_TYPES, self.queue)
+
+        self.app = create_app()
         self.client = self.app.test_client()
         self.ctx = self.app.app_context()
         self.ctx.push()
-        
-        # Initialize test database
-        db.create_all()
-        
-        # Create test room data
-        self.test_rooms = {
-            'R01': {'type': 'MC', 'name': 'Room 1'},
-            'R02': {'type': 'SP', 'name': 'Room 2'},
-            'R03': {'type': 'OP', 'name': 'Room 3'}
-        }
-        
-        for room_id, data in self.test_rooms.items():
-            room = Room(id=room_id, type=data['type'], name=data['name'])
-            db.session.add(room)
-        
-        db.session.commit()
 
     def tearDown(self):
         """Clean up after each test"""
-        db.session.remove()
-        db.drop_all()
         self.ctx.pop()
 
+    def register(self, name, room_type):
+        response = self.client.post('/api/register',
+                                    data=json.dumps({'name': name, 'roomType': room_type}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)
+
     def test_room_configuration(self):
         """Test room configuration and types"""
         response = self.client.get('/api/config/room-types')
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
-        
+
         # Verify all room types exist
         self.assertIn('MC', data)
         self.assertIn('SP', data)
         self.assertIn('OP', data)
         self.assertIn('RQ', data)
         self.assertIn('WA', data)
-        
+
         # Verify room type properties
         self.assertEqual(data['MC']['color_name'], 'blue')
         self.assertEqual(data['SP']['color_name'], 'green')
 
     def test_patient_registration(self):
         """Test patient registration process"""
-        test_patient = {
-            'name': 'John Doe',
-            'priority_number': 'A001',
-            'room_type': 'MC',
-            'contact': '1234567890'
-        }
-        
-        response = self.client.post('/api/register',
-                                  data=json.dumps(test_patient),
-                                  content_type='application/json')
-        
-        self.assertEqual(response.status_code, 201)
-        data = json.loads(response.data)
-        self.assertEqual(data['name'], test_patient['name'])
-        self.assertEqual(data['priority_number'], test_patient['priority_number'])
+        data = self.register('John Doe', 'MC')
+        self.assertTrue(data['success'])
+        self.assertEqual(data['queueNumber'], 'MC001')
+        self.assertIn('estimatedWait', data)
+
+        self.assertEqual(self.register('Jane Doe', 'MC')['queueNumber'], 'MC002')
+
+        # Default service time of 300s over the two MC rooms, two patients ahead
+        self.assertEqual(self.register('Ann Doe', 'MC')['estimatedWait'], 450)
+        # An instant service moves the estimate by ETA_ALPHA only
+        self.client.post('/api/call-next/R01')
+        self.client.post('/api/complete', json={'queueNumber': 'MC001'})
+        self.assertEqual(self.register('Bob Doe', 'MC')['estimatedWait'], 360)
+
+        # Unknown room type and missing fields are rejected
+        response = self.client.post('/api/register', json={'name': 'X', 'roomType': 'ZZ'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/register', json={'name': 'X'})
+        self.assertEqual(response.status_code, 400)
 
     def test_queue_management(self):
         """Test queue operations (call, complete)"""
-        # Register test patient
-        patient = Patient(name='Jane Doe', priority_number='A002', room_type='SP')
-        db.session.add(patient)
-        db.session.commit()
-        
-        # Test calling patient
-        call_data = {
-            'room_id': 'R02',
-            'patient_id': patient.id
-        }
-        
-        response = self.client.post('/api/call',
-                                  data=json.dumps(call_data),
-                                  content_type='application/json')
-        
-        self.assertEqual(response.status_code, 200)
-        
+        number = self.register('Jane Doe', 'SP')['queueNumber']
+
+        # Test calling patient (R03 serves SP)
+        response = self.client.post('/api/call', json={'queueNumber': number, 'roomId': 'R03'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.queue.records[number]['Status'], 'Called')
+
+        # A patient called to one room is not taken over by another room
+        response = self.client.post('/api/call', json={'queueNumber': number, 'roomId': 'R04'})
+        self.assertEqual(response.status_code, 404)
+
+        # Wrong room type
+        response = self.client.post('/api/call', json={'queueNumber': number, 'roomId': 'R01'})
+        self.assertEqual(response.status_code, 400)
+
         # Test completing service
-        complete_data = {
-            'room_id': 'R02',
-            'patient_id': patient.id
-        }
-        
-        response = self.client.post('/api/complete',
-                                  data=json.dumps(complete_data),
-                                  content_type='application/json')
-        
-        self.assertEqual(response.status_code, 200)
-
-    @patch('app.voice_utils.VoiceAnnouncement.announce')
-    def test_voice_announcements(self, mock_announce):
-        """Test voice announcement system"""
-        # Test English announcement
-        announcement = VoiceAnnouncement()
-        announcement.announce('Priority number A003, please proceed to Room 1', 'en')
-        mock_announce.assert_called_once()
-        
-        # Test Tagalog announcement
-        mock_announce.reset_mock()
-        announcement.announce('Pasyente numero A003, pumunta po sa Room 1', 'tl')
-        mock_announce.assert_called_once()
+        response = self.client.post('/api/complete', json={'queueNumber': number})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.queue.records[number]['Status'], 'Complete')
+
+    def test_call_next(self):
+        """Test the atomic complete-and-call of a room"""
+        first = self.register('A', 'MC')['queueNumber']
+        second = self.register('B', 'MC')['queueNumber']
+
+        data = json.loads(self.client.post('/api/call-next/R01').data)
+        self.assertIsNone(data['completed'])
+        self.assertEqual(data['called']['Number'], first)
+
+        data = json.loads(self.client.post('/api/call-next/R01').data)
+        self.assertEqual(data['completed'], first)
+        self.assertEqual(data['called']['Number'], second)
+        self.assertEqual(data['next'], [])
+
+    def test_event_stream(self):
+        """Test the Server-Sent Events of /api/stream"""
+        response = self.client.get('/api/stream?room=R01', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        stream = iter(response.response)
+        self.assertEqual(next(stream), b'retry: 3000\n\n')
+
+        def event():
+            line = next(stream).decode('utf-8')
+            self.assertTrue(line.startswith('data: '))
+            return json.loads(line[len('data: '):])
+
+        self.register('A', 'SP')
+        self.register('B', 'MC')
+        data = event()
+        self.assertEqual((data['action'], data['number'], data['room_type']), ('add', 'MC001', 'MC'))
+        self.assertIn('R01', data['rooms'])
+
+        self.client.post('/api/call-next/R01')
+        data = event()
+        self.assertEqual((data['action'], data['number']), ('call', 'MC001'))
+        response.close()
+
+        self.assertEqual(self.client.get('/api/stream?room=R99').status_code, 404)
+
+    def test_room_queues_batch(self):
+        """Test the multi-room queue endpoint of the lobby screens"""
+        for name in ('A', 'B'):
+            self.register(name, 'MC')
+        self.register('C', 'SP')
+        self.client.post('/api/call-next/R01')
+
+        response = self.client.get('/api/queues?rooms=R01,R03&types=MC')
+        self.assertEqual(response.status_code, 200)
+        rooms = json.loads(response.data)['rooms']
+        self.assertEqual(list(rooms), ['R01', 'R02', 'R03'])
+        self.assertEqual(rooms['R01']['current']['Number'], 'MC001')
+        self.assertEqual([p['Number'] for p in rooms['R02']['next']], ['MC002'])
+        self.assertEqual(rooms['R03'], json.loads(self.client.get('/api/queue/R03').data))
+
+        # Unchanged rooms answer 304; a change in any of them does not
+        etag = response.headers['ETag']
+        response = self.client.get('/api/queues?rooms=R01,R03&types=MC', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.register('D', 'SP')
+        response = self.client.get('/api/queues?rooms=R01,R03&types=MC', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        # Any order or repetition of the same rooms shares one cached body
+        cached = len(routes._encoded)
+        response = self.client.get('/api/queues?rooms=R03,R02,R01,R03')
+        self.assertEqual(list(json.loads(response.data)['rooms']), ['R01', 'R02', 'R03'])
+        self.assertEqual(len(routes._encoded), cached)
+
+        self.addCleanup(setattr, routes, 'ENCODED_CACHE_SIZE', routes.ENCODED_CACHE_SIZE)
+        routes.ENCODED_CACHE_SIZE = 2
+        for rooms in ('R01', 'R01,R02', 'R02,R03'):
+            self.client.get(f'/api/queues?rooms={rooms}')
+        self.assertEqual(list(routes._encoded), ['/api/queues?R01,R02', '/api/queues?R02,R03'])
+
+        self.assertEqual(self.client.get('/api/queues').status_code, 400)
+        self.assertEqual(self.client.get('/api/queues?rooms=R99').status_code, 404)
+        self.assertEqual(self.client.get('/api/queues?types=ZZ').status_code, 400)
+
+    def test_sites(self):
+        """Test that sites under /site/<site_id> keep separate queues"""
+        rooms = {'R01': {'type': 'MC', 'name': 'Room 1'}, 'X1': {'type': 'XRAY', 'name': 'X-ray'}}
+        room_types = {'MC': ROOM_TYPES['MC'], 'XRAY': ROOM_TYPES['OP']}
+        north = QueueData(rooms, room_types, {})
+        sites.add(Site('north', 'North', rooms, room_types, north))
+        self.addCleanup(sites.sites.pop, 'north')
+
+        self.assertEqual(self.register('A', 'MC')['queueNumber'], 'MC001')
+        response = self.client.post('/site/north/api/register', json={'name': 'B', 'roomType': 'MC'})
+        self.assertEqual(json.loads(response.data)['queueNumber'], 'MC001')
+        response = self.client.post('/site/north/api/register', json={'name': 'C', 'roomType': 'SP'})
+        self.assertEqual(response.status_code, 400)
+
+        self.client.post('/site/north/api/call-next/R01')
+        self.assertEqual(north.records['MC001']['Name'], 'B')
+        self.assertEqual(north.records['MC001']['Status'], 'Called')
+        self.assertEqual(self.queue.records['MC001']['Status'], 'Waiting')
+        self.assertEqual(json.loads(self.client.get('/api/queue/R01').data)['current'], None)
+        self.assertEqual(self.client.get('/site/north/api/queue/R02').status_code, 404)
+
+        # Room type codes of any length
+        response = self.client.post('/site/north/api/register', json={'name': 'E', 'roomType': 'XRAY'})
+        self.assertEqual(json.loads(response.data)['queueNumber'], 'XRAY001')
+        response = self.client.post('/site/north/api/call', json={'queueNumber': 'XRAY001', 'roomId': 'X1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['announcements']['en'], 'orange 1, please proceed to X-ray')
+
+        # A committed call succeeds even when its announcement fails
+        self.addCleanup(setattr, routes, 'queue_announcement', routes.queue_announcement)
+        routes.queue_announcement = lambda *args: 1 / 0
+        self.register('F', 'MC')
+        response = self.client.post('/api/call', json={'queueNumber': 'MC002', 'roomId': 'R01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(json.loads(response.data)['announcements'])
+        self.assertEqual(self.queue.records['MC002']['Status'], 'Called')
+
+        self.assertEqual(self.client.get('/site/nowhere/api/queue/R01').status_code, 404)
+        self.assertEqual(self.client.post('/site/nowhere/api/register',
+                                          json={'name': 'D', 'roomType': 'MC'}).status_code, 404)
+
+    def test_site_config(self):
+        """Test validation of site config files"""
+        directory = tempfile.mkdtemp()
+
+        def load(room_types):
+            path = os.path.join(directory, 'site.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'room_types': room_types, 'rooms': {'R01': {'type': 'XR', 'name': 'Room 1'}}}, f)
+            return load_site_config(path)
+
+        self.assertEqual(load({'XR': ROOM_TYPES['MC']})['rooms']['R01']['type'], 'XR')
+        for room_types in ({'XR': dict(ROOM_TYPES['MC'], color_name='teal')},
+                           {'XR': ROOM_TYPES['MC'], 'X2': ROOM_TYPES['SP']},
+                           {'XR': ROOM_TYPES['MC'], 'X-R': ROOM_TYPES['SP']}):
+            self.assertRaises(ValueError, load, room_types)
+
+    def test_priority_lanes(self):
+        """Test priority lanes, aging and the import Priority column"""
+        self.register('Regular 1', 'MC')
+        response = self.client.post('/api/register', json={'name': 'Senior', 'roomType': 'MC',
+                                                           'priority': 'senior'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/api/import-batch', json={'data': [
+            {'Name': 'Urgent', 'Room Type': 'MC', 'Room': 'R01', 'Priority': 'Urgent'},
+            {'Name': 'Bad', 'Room Type': 'MC', 'Room': 'R01', 'Priority': 'vip'}
+        ]})
+        self.assertEqual(json.loads(response.data)['success'], 1)
+        response = self.client.post('/api/register', json={'name': 'X', 'roomType': 'MC', 'priority': 'vip'})
+        self.assertEqual(response.status_code, 400)
+
+        data = json.loads(self.client.get('/api/queue/R01').data)
+        self.assertEqual([p['Name'] for p in data['next']], ['Urgent', 'Senior', 'Regular 1'])
+        self.assertEqual(self.queue.get_room_type_status()['MC']['rooms'][0]['next'],
+                         ['MC003', 'MC002', 'MC001'])
+
+        # Called out of turn, then served in lane order
+        self.client.post('/api/call', json={'queueNumber': 'MC002', 'roomId': 'R01'})
+        called = [json.loads(self.client.post('/api/call-next/R02').data)['called'] for _ in range(3)]
+        self.assertEqual([c and c['Number'] for c in called], ['MC003', 'MC001', None])
+
+        # Aging: a regular patient waiting longer than the head start goes first
+        line = WaitingLine()
+        now = datetime.now()
+        line.push({'Number': 'A', 'Priority': 'regular', 'RegisterTime': now - timedelta(minutes=30)})
+        line.push({'Number': 'B', 'Priority': 'senior', 'RegisterTime': now})
+        line.push({'Number': 'C', 'Priority': 'regular', 'RegisterTime': now - timedelta(minutes=5)})
+        self.assertEqual([r['Number'] for r in line.first(3)], ['A', 'B', 'C'])
+        self.assertEqual(line.remove('A')['Number'], 'A')
+        self.assertEqual(line.pop()['Number'], 'B')
+        self.assertEqual(len(line), 1)
+
+        # Patients called in order leave no removed entries behind
+        line = WaitingLine()
+        for i in range(1000):
+            line.push({'Number': i, 'Priority': 'regular', 'RegisterTime': now + timedelta(seconds=i)})
+        for i in range(999):
+            line.remove(i)
+            self.assertLessEqual(len(line._heap), 1000 - i)
+        self.assertEqual(len(line._heap), 1)
+        self.assertEqual([r['Number'] for r in line.first(3)], [999])
+
+    def test_overflow_rooms(self):
+        """Test WA rooms taking the MC backlog over its threshold"""
+        threshold = OVERFLOW_RULES['WA']['MC']
+        for i in range(threshold - 1):
+            self.register(f'MC {i}', 'MC')
+        self.register('Walk-in', 'WA')
+
+        # Below the threshold a WA room only serves its own line
+        self.assertEqual(self.queue.call_next('R09')['called'].Number, 'WA001')
+        self.assertIsNone(self.queue.call_next('R09')['called'])
+        with self.assertRaises(ValueError):
+            self.queue.call_patient('MC001', 'R03')
+        # Also when called by number
+        response = self.client.post('/api/call', json={'queueNumber': 'MC001', 'roomId': 'R09'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.queue.records['MC001']['Status'], 'Waiting')
+
+        # At the threshold the longest waiting MC patient is called there
+        version = self.queue.get_version('R09')
+        self.register('MC last', 'MC')
+        self.assertNotEqual(self.queue.get_version('R09'), version)
+        data = json.loads(self.client.get('/api/queue/R09').data)
+        self.assertEqual([p['Number'] for p in data['next']], ['MC001', 'MC002', 'MC003'])
+
+        result = json.loads(self.client.post('/api/call-next/R09').data)
+        self.assertEqual(result['called']['Number'], 'MC001')
+        self.assertEqual(self.queue.records['MC001']['CallRoom'], 'R09')
+        self.assertEqual(self.queue.get_room_type_status()['WA']['rooms'][0]['current'], 'MC001')
+
+        # Back under the threshold; completing the MC patient frees the room
+        self.assertIsNone(self.queue.call_next('R09')['called'])
+        self.assertEqual(self.queue.records['MC001']['Status'], 'Complete')
+        self.assertEqual(self.queue.call_next('R01')['called'].Number, 'MC002')
+
+    def test_simulation(self):
+        """Test a simulated day on the real queue with a virtual clock"""
+        rooms = build_rooms({'MC': 1, 'SP': 1, 'OP': 1, 'RQ': 1, 'WA': 2})
+        report = simulate(rooms, days=1, arrivals={'MC': 12, 'WA': 2}, seed=1)
+
+        for room_type, stats in report['types'].items():
+            self.assertEqual(stats['served'], stats['arrivals'])
+        self.assertGreater(report['types']['MC']['wait_p90_min'], report['types']['WA']['wait_p90_min'])
+        self.assertGreater(sum(r['overflow_served'] for r in report['rooms'].values()), 0)
+        self.assertLess(report['wall_seconds'], 10)
+
+        # The queue reads the simulated time, not the wall clock
+        sim = Simulation(rooms, ROOM_TYPES, {}, {t: lambda: 600 for t in ROOM_TYPES})
+        sim.run([(datetime(2024, 1, 1, 9), 'MC', 'regular'), (datetime(2024, 1, 1, 9, 5), 'MC', 'urgent')])
+        self.assertEqual(sim.waits['MC'], [0.0, 300.0])
+        self.assertEqual(sim.queue.records['MC002']['CompleteTime'], datetime(2024, 1, 1, 9, 20))
+
+    def test_announcement_audio(self):
+        """Test announcement audio served to the room displays"""
+        class StubBackend:
+            calls = 0
+
+            def synthesize(self, text, lang):
+                StubBackend.calls += 1
+                return f"ID3 {lang}: {text}".encode('utf-8')
+
+        # Created on first use only
+        self.assertIsNone(routes._announcement_audio)
+        self.addCleanup(setattr, routes, '_announcement_audio', None)
+        # Off in audio mode 'none' (the tests' mode)
+        self.assertFalse(routes.DISPLAY_AUDIO)
+        self.addCleanup(setattr, routes, 'DISPLAY_AUDIO', False)
+        routes.DISPLAY_AUDIO = True
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            routes._announcement_audio = AudioBuffers(AudioCache(cache_dir, 1 << 20, StubBackend()), 1 << 20)
+
+            self.register('A', 'MC')
+            self.client.post('/api/call-next/R01')
+            announcement = json.loads(self.client.get('/api/queue/R01').data)['announcement']
+            url = f"/api/announcement/{announcement['en']}.mp3"
+
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'audio/mpeg')
+            self.assertEqual(response.data, b'ID3 en: blue 1, please proceed to Room 1')
+            self.assertIn('immutable', response.headers['Cache-Control'])
+
+            # Range requests, revalidation and repeated plays need no new synthesis
+            response = self.client.get(url, headers={'Range': 'bytes=0-3'})
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response.data, b'ID3 ')
+            response = self.client.get(url, headers={'If-None-Match': response.headers['ETag']})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(StubBackend.calls, 1)
+
+            # Ids of another room or a changed text are not served
+            self.assertEqual(self.client.get(url.replace('R01', 'R02')).status_code, 404)
+            self.assertEqual(self.client.get('/api/announcement/MC001-R01-en-0.mp3').status_code, 404)
+
+            # Nor the ids of patients not called to the room
+            self.register('B', 'MC')
+            waiting = announcement_ids('MC002', 'R01')['en']
+            self.assertEqual(self.client.get(f'/api/announcement/{waiting}.mp3').status_code, 404)
+            self.assertEqual(StubBackend.calls, 1)
+
+    def test_voice_announcements(self):
+        """Test voice announcement texts and queueing"""
+        en_text, tl_text = create_announcement('MC003', 'R01')
+        self.assertEqual(en_text, 'blue 3, please proceed to Room 1')
+        self.assertEqual(tl_text, 'Numero asul 3, mangyaring pumunta sa Room 1')
+
+        # Without audio, queueing returns the texts at once
+        self.assertEqual(queue_announcement('MC003', 'R01'), (en_text, tl_text))
+
+    def test_segment_voice(self):
+        """Test joining pre-rendered phrase segments into one announcement"""
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+        import pygame
+        from app.segment_voice import SegmentVoice
+
+        pygame.mixer.init(frequency=22050, size=-16, channels=1)
+        self.addCleanup(pygame.mixer.quit)
+        frequency, _, channels = pygame.mixer.get_init()
+
+        class ToneBackend:
+            calls = 0
+
+            def synthesize(self, text, lang):
+                # Tone of 100 samples per letter between 500 samples of silence
+                ToneBackend.calls += 1
+                tone = (np.sin(np.arange(len(text) * 100) / 3) * 8000).astype(np.int16)
+                pcm = np.concatenate([np.zeros(500, np.int16), tone, np.zeros(500, np.int16)])
+                audio = BytesIO()
+                with wave.open(audio, 'wb') as w:
+                    w.setnchannels(1)
+                    w.setsampwidth(2)
+                    w.setframerate(frequency)
+                    w.writeframes(pcm.tobytes())
+                return audio.getvalue()
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            voice = SegmentVoice(AudioCache(cache_dir, 1 << 20, ToneBackend()))
+
+            # Silence around a phrase is trimmed
+            blue = voice.segment('blue', 'en')
+            self.assertAlmostEqual(len(blue) / (2 * channels), 400, delta=2)
+
+            # Phrases are joined with a fixed gap, each synthesized once
+            gap = bytes(frequency * voice.gap_ms // 1000 * 2 * channels)
+            self.assertEqual(voice.render(['blue', 'one', 'blue'], 'en'),
+                             gap.join([blue, voice.segment('one', 'en'), blue]))
+            self.assertEqual(ToneBackend.calls, 2)
+
+            self.assertEqual(voice.warm_up({'en': ['blue'], 'tl': ['asul']}), 2)
+            self.assertEqual(ToneBackend.calls, 3)
+
+            # Decoded segments are bounded, least recently used dropped first
+            voice.max_bytes = 3 * len(blue)
+            voice.segment('blue', 'en')
+            voice.segment('green', 'en')
+            self.assertEqual(list(voice._segments), [('blue', 'en'), ('green', 'en')])
+            self.assertLessEqual(voice._total_bytes, voice.max_bytes)
+
+    def test_announcement_queue(self):
+        """Test re-call priority, coalescing and stale announcements"""
+        queue = AnnouncementQueue(max_age=5)
+        job = lambda number, age=0, site=DEFAULT_SITE: {'site': site, 'number': number, 'room': 'R01',
+                                                        'en': '', 'tl': '', 'time': time.time() - age}
+
+        queue.put(job('MC001'))
+        self.assertEqual(queue.get(0)['number'], 'MC001')
+
+        queue.put(job('MC002'))
+        queue.put(job('MC002'))
+        queue.put(job('MC001'))
+        queue.put(job('MC009', age=10))
+        self.assertEqual(queue.get(0)['number'], 'MC001')
+        self.assertEqual(queue.get(0)['number'], 'MC002')
+        self.assertIsNone(queue.get(0))
+
+        stats = queue.stats()
+        self.assertEqual(stats['coalesced'], 1)
+        self.assertEqual(stats['dropped_stale'], 1)
+
+        # The same number called at two sites is two announcements; only
+        # the site that announced it before has a re-call (played first)
+        queue.put(job('MC001', site='north'))
+        queue.put(job('MC001'))
+        self.assertEqual(queue.stats()['depth'], 2)
+        self.assertEqual([queue.get(0)['site'] for _ in range(2)], [DEFAULT_SITE, 'north'])
+
+        # The built-in key is only accepted on loopback
+        with self.assertRaises(ValueError):
+            Announcer(('192.168.1.5', 6060), DEFAULT_ANNOUNCER_AUTHKEY)
+        Announcer(('127.0.0.1', 6060), DEFAULT_ANNOUNCER_AUTHKEY)
+        Announcer(('192.168.1.5', 6060), b'site-secret')
 
     def test_data_import(self):
         """Test batch data import functionality"""
-        # Create test DataFrame
-        test_data = pd.DataFrame({
-            'name': ['Test Patient 1', 'Test Patient 2'],
-            'priority_number': ['B001', 'B002'],
-            'room_type': ['MC', 'SP'],
-            'contact': ['1111111111', '2222222222']
-        })
-        
-        # Convert to Excel binary
-        excel_binary = test_data.to_excel(index=False).getvalue()
-        
+        csv_data = ('Patient Name,Room Type,Room Number\n'
+                    'Test Patient 1,MC,R01\nTest Patient 2,SP,R03\nBad Room,MC,R99\n')
+
         response = self.client.post('/api/import-batch',
-                                  data={'file': (excel_binary, 'test_import.xlsx')},
-                                  content_type='multipart/form-data')
-        
+                                    data={'file': (BytesIO(csv_data.encode('utf-8')), 'test_import.csv')},
+                                    content_type='multipart/form-data')
         self.assertEqual(response.status_code, 200)
-        
+        data = json.loads(response.data)
+        self.assertEqual(data['success'], 2)
+        self.assertEqual(len(data['errors']), 1)
+
         # Verify imported data
-        imported_patients = Patient.query.filter(
-            Patient.priority_number.in_(['B001', 'B002'])
-        ).all()
-        self.assertEqual(len(imported_patients), 2)
+        names = {r['Name']: r['RoomType'] for r in self.queue.records.values()}
+        self.assertEqual(names, {'Test Patient 1': 'MC', 'Test Patient 2': 'SP'})
+
+        response = self.client.post('/api/import-batch',
+                                    json={'data': [{'Name': 'C', 'Room Type': 'OP', 'Room': 'R05'}]})
+        self.assertEqual(json.loads(response.data)['success'], 1)
 
     def test_dashboard_status(self):
         """Test dashboard status API"""
+        self.register('A', 'OP')
         response = self.client.get('/api/dashboard-status')
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
-        
+
         # Verify dashboard data structure
-        self.assertIn('rooms', data)
-        self.assertIn('current_queue', data)
-        self.assertIn('waiting_counts', data)
+        self.assertEqual(set(data), set(ROOM_TYPES))
+        self.assertEqual(data['OP']['total_waiting'], 1)
+        self.assertEqual(data['OP']['rooms'][0]['next'], ['OP001'])
+
+        # Unchanged queue: the ETag answers 304
+        etag = response.headers['ETag']
+        response = self.client.get('/api/dashboard-status', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
 
     def test_room_display(self):
         """Test room display functionality"""
+        self.register('A', 'MC')
         room_id = 'R01'
         response = self.client.get(f'/api/queue/{room_id}')
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
-        
+
         # Verify room display data structure
-        self.assertIn('current_patient', data)
-        self.assertIn('queue', data)
-        self.assertIn('recent_calls', data)
+        self.assertIsNone(data['current'])
+        self.assertEqual(data['next'][0]['Number'], 'MC001')
+        self.assertIn('EstimatedWait', data['next'][0])
+        self.assertIn('estimatedWait', data)
+
+        self.client.post('/api/call-next/R01')
+        response = self.client.get(f'/api/recent-calls/{room_id}')
+        self.assertEqual(json.loads(response.data)[0]['Number'], 'MC001')
+
+        self.assertEqual(self.client.get('/api/queue/R99').status_code, 404)
+
+    def test_record_serialization(self):
+        """Test compact records with epoch-millisecond times, with and without orjson"""
+        from app import routes
+
+        before = int(time.time() * 1000)
+        self.register('A', 'MC')
+        self.client.post('/api/call-next/R01')
+
+        current = json.loads(self.client.get('/api/queue/R01').data)['current']
+        self.assertEqual(current['Number'], 'MC001')
+        self.assertIsInstance(current['CallTime'], int)
+        self.assertGreaterEqual(current['CallTime'], before - 1000)
+        self.assertIsNone(current['CompleteTime'])
+
+        payload = {'current': self.queue.get_room_queue('R01')['current'], 'at': datetime.now()}
+        encoded = json.loads(routes.dumps(payload))
+        orjson, routes.orjson = routes.orjson, None
+        try:
+            self.assertEqual(json.loads(routes.dumps(payload)), encoded)
+        finally:
+            routes.orjson = orjson
+
+    def test_metrics(self):
+        """Test the Prometheus metrics endpoint"""
+        self.register('A', 'MC')
+        self.client.post('/api/call-next/R01')
+        self.register('B', 'MC')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.get_data(as_text=True)
+
+        self.assertIn('# TYPE ecqs_http_request_duration_seconds histogram', text)
+        self.assertIn('endpoint="api_call_next",method="POST",status="200"', text)
+        self.assertIn('ecqs_queue_operation_duration_seconds_count{backend="memory",operation="call_next"}', text)
+        self.assertIn('ecqs_queue_waiting{site="main",room_type="MC"} 1', text)
+
+    def test_journal_recovery(self):
+        """Test restoring the queue from its journal and snapshot"""
+        directory = tempfile.mkdtemp()
+
+        def reopen(snapshot_every=1000):
+            queue = QueueData()
+            journal = QueueJournal(directory, 0.05, snapshot_every)
+            queue.attach_journal(journal)
+            self.addCleanup(journal.close)
+            return queue
+
+        queue = reopen()
+        for name, room_type in (('A', 'MC'), ('B', 'MC'), ('C', 'SP')):
+            queue.add_patient(name, room_type)
+        queue.add_patient('D', 'MC', priority='urgent')
+        queue.call_next('R01')
+        queue.call_patient('SP001', 'R03')
+        queue.complete_service('SP001')
+        # A retention pass that removes nothing is not logged
+        log_path = os.path.join(directory, QueueJournal.LOG_FILE)
+        size = os.path.getsize(log_path)
+        self.assertEqual(queue.clean_old_records(24), 0)
+        self.assertEqual(os.path.getsize(log_path), size)
+        queue.journal.close()
+
+        # Replay gives the live state back
+        replayed = reopen()
+        self.assertEqual(replayed.export_state(), queue.export_state())
+        self.assertEqual(replayed.get_room_queue('R01')['current'].Number, 'MC003')
+        replayed.journal.close()
+
+        # A torn last write is cut off and the log goes on after it
+        size = os.path.getsize(log_path)
+        with open(log_path, 'ab') as f:
+            f.write(b'{"number":"MC004","op":"add","na')
+        replayed = reopen()
+        self.assertEqual(replayed.export_state(), queue.export_state())
+        self.assertEqual(os.path.getsize(log_path), size)
+        self.assertEqual(replayed.add_patient('E', 'MC')[0], 'MC004')
+        replayed.journal.close()
+        self.assertIn('MC004', reopen().records)
+
+        # Snapshot plus the changes logged after it
+        queue = reopen(snapshot_every=3)
+        for name in ('F', 'G', 'H', 'I'):
+            queue.add_patient(name, 'WA')
+        queue.call_next('R09')
+        queue.journal.close()
+        self.assertTrue(os.path.exists(os.path.join(directory, QueueJournal.SNAPSHOT_FILE)))
+        self.assertEqual(glob.glob(log_path + '.*'), [])
+        self.assertGreater(os.path.getsize(log_path), 0)
+        replayed = reopen()
+        self.assertEqual(replayed.export_state(), queue.export_state())
+        self.assertEqual(replayed.add_patient('J', 'WA')[0], 'WA005')
+        replayed.journal.close()
+
+        # A snapshot that fails leaves its rotated log for recovery
+        queue = reopen()
+        queue.add_patient('K', 'WA')
+        self.assertTrue(queue.journal.start_snapshot(lambda: 1 / 0))
+        queue.add_patient('L', 'WA')
+        queue.journal.close()
+        self.assertEqual(len(glob.glob(log_path + '.*')), 1)
+        replayed = reopen()
+        self.assertEqual(replayed.export_state(), queue.export_state())
+
+    def test_sqlite_backend(self):
+        """Test the SQLite queue on a file database, and reopening it"""
+        path = os.path.join(tempfile.mkdtemp(), 'queue.db')
+        queue = SQLiteQueueData(path, watch_interval=None)
+        self.assertRaises(TypeError, queue.attach_journal, None)
+
+        first, _ = queue.add_patient('A', 'MC')
+        second, _ = queue.add_patient('B', 'MC', priority='senior')
+        third, _ = queue.add_patient('C', 'SP')
+        self.assertEqual((first, second, third), ('MC001', 'MC002', 'SP001'))
+
+        queue.call_patient(third, 'R03')
+        queue.complete_service(third)
+        result = queue.call_next('R01')
+        self.assertIsNone(result['completed'])
+        self.assertEqual(result['called'].Number, second)
+        self.assertEqual([p.Number for p in queue.get_room_queue('R02')['next']], [first])
+        self.assertRaises(ValueError, queue.call_patient, first, 'R03')
+
+        # Another worker (or a restart) sees the same state and numbering
+        queue = SQLiteQueueData(path, watch_interval=None)
+        self.assertEqual(queue.get_room_queue('R01')['current'].Number, second)
+        self.assertEqual(queue.to_dataframe().set_index('Number')['Status'].to_dict(),
+                         {first: 'Waiting', second: 'Called', third: 'Complete'})
+        self.assertEqual(queue.add_patient('D', 'MC')[0], 'MC003')
+        result = queue.call_next('R01')
+        self.assertEqual((result['completed'], result['called'].Number), (second, first))
+
+    def test_record_retention(self):
+        """Test moving expired records to the archive"""
+        archive = RecordArchive(tempfile.mkdtemp())
+        self.queue.attach_archive(archive)
+        yesterday = datetime.now() - timedelta(days=1)
+
+        self.queue.clock = lambda: yesterday
+        for name in ('A', 'B'):
+            self.register(name, 'MC')
+        self.client.post('/api/call-next/R01')
+        self.queue.clock = lambda: yesterday + timedelta(minutes=10)
+        self.client.post('/api/call-next/R01')
+        self.client.post('/api/complete', json={'queueNumber': 'MC002'})
+        self.queue.clock = datetime.now
+        self.register('C', 'MC')
+        self.client.post('/api/call-next/R01')
+
+        self.assertEqual(RetentionScheduler(self.queue, 60, 12).run_once(), 2)
+        self.assertEqual(list(self.queue.records), ['MC003'])
+        self.assertEqual(archive.days(), [yesterday.date().isoformat()])
+        self.assertEqual(sorted(archive.read_day(yesterday.date().isoformat())['Number']), ['MC001', 'MC002'])
+
+        # Recent calls of the room are filled from the archive
+        response = self.client.get('/api/recent-calls/R01')
+        self.assertEqual([call['Number'] for call in json.loads(response.data)], ['MC003', 'MC002', 'MC001'])
+
+    def test_multi_day_report(self):
+        """Test a report over days whose queue numbers repeat"""
+        today = datetime.now().replace(hour=10, minute=0, second=0, microsecond=0)
+        archive = RecordArchive(tempfile.mkdtemp())
+        self.queue.attach_archive(archive)
+        archive.write([{'Number': 'MC001', 'Name': f'Day {days}', 'RoomType': 'MC', 'Status': 'Complete',
+                        'CallRoom': 'R01', 'RegisterTime': today - timedelta(days=days),
+                        'CallTime': today - timedelta(days=days, minutes=-10),
+                        'CompleteTime': today - timedelta(days=days, minutes=-15), 'Priority': 'regular'}
+                       for days in (1, 2)])
+        self.register('Today', 'MC')
+
+        start = (today - timedelta(days=2)).date().isoformat()
+        response = self.client.get(f'/api/reports/summary?start={start}&end={today.date().isoformat()}')
+        self.assertEqual(response.status_code, 200)
+        report = json.loads(response.data)
+        self.assertEqual(report['patients'], 3)
+        self.assertEqual(report['wait']['all']['p50'], 600)
 
     def test_multilingual_support(self):
         """Test multilingual support"""
@@ -170,7 +722,7 @@ class TestEyeQueueSystem(unittest.TestCase):
         headers = {'Accept-Language': 'en'}
         response = self.client.get('/api/config/rooms', headers=headers)
         self.assertEqual(response.status_code, 200)
-        
+
         # Test Tagalog response
         headers = {'Accept-Language': 'tl'}
         response = self.client.get('/api/config/rooms', headers=headers)